@@ -0,0 +1,498 @@
+import os
+import time
+import uuid
+import bisect
+import itertools
+from collections import namedtuple
+
+import storage
+import ledger
+import velocity
+import deposits
+import balances
+from balances import FCFA, STABLECOIN
+from ledger import Ledger
+from events import EventBus
+from reconcile import Reconciler
+from velocity import VelocityEngine, VelocityExceeded
+from deposits import DepositPipeline
+from locking import TransactionManager
+
+# Compte appelant : nom et DID du token (DID None pour un token émis avant l'ajout du claim `did`)
+Caller = namedtuple("Caller", ["username", "did"])
+
+USERNAME_TAKEN = "Nom d'utilisateur déjà enregistré"
+PHONE_TAKEN = "Numéro Mobile Money déjà enregistré."
+USER_EXISTS = "Utilisateur déjà existant."
+
+# DID parcourus par prise de store.lock dans une recherche par sous-chaîne
+DID_SCAN_CHUNK = 4096
+
+
+class AccountError(Exception):
+    """Opération refusée : statut HTTP et détail renvoyés au client."""
+
+    def __init__(self, status, detail):
+        super().__init__(detail)
+        self.status = status
+        self.detail = detail
+
+
+def refuse_batch(results):
+    """Lot atomique dont une ligne est refusée : aucune ligne appliquée."""
+    for r in results:
+        if r["status"] == "ok":
+            r["status"] = "not_applied"
+    raise AccountError(400, {"message": "Transfert groupé refusé : aucune ligne appliquée.", "results": results})
+
+
+def batch_summary(results, debit):
+    rejected = sum(1 for r in results if r["status"] == "rejected")
+    return {
+        "message": "Transfert groupé traité",
+        "applied": len(results) - rejected,
+        "rejected": rejected,
+        "total_debited": balances.from_minor(STABLECOIN, debit),
+        "results": results,
+    }
+
+
+def balances_report(currency, aggregates):
+    """Réponse de /admin/balances/ à partir des agrégats en unités entières."""
+    return {
+        "accounts": aggregates["accounts"],
+        "total_supply": {c: balances.from_minor(c, v) for c, v in aggregates["supply"].items()},
+        "top_holders": [{"username": u, "balance": balances.from_minor(currency, v)} for u, v in aggregates["top"]],
+        "histogram": {"counts": aggregates["counts"],
+                      "edges": [balances.from_minor(currency, round(e)) for e in aggregates["edges"]]},
+    }
+
+
+# 👤 Opérations sur les comptes d'un store
+class AccountService:
+    """Ce que font les routes de main.py sur les comptes, pour un store.
+
+    En mode mono-processus, main.py en crée une sur son store. En mode
+    multi-processus, chaque shard (backend/shards.py) en tient une sur le
+    sien et les workers HTTP passent par `shards.ShardedAccounts`, qui a les
+    mêmes méthodes. Le compte appelant est un `Caller` ; les refus sont des
+    AccountError.
+    """
+
+    def __init__(self, store, txm=None):
+        self.store = store
+        # 🔒 Verrous par compte (DID) pour les mises à jour concurrentes
+        self.txm = txm or TransactionManager()
+        # 🧾 Grand livre des opérations (historique par compte)
+        self.book = Ledger(store)
+        # 📡 Écritures durables poussées aux abonnés de /events/
+        self.event_bus = EventBus(store, self.book)
+        # 🏎️ Limites de vélocité par compte (TRANSFERZ_VELOCITY_RULES : fichier JSON de règles ou "default", aucune si absent)
+        self.velocity = VelocityEngine(store, velocity.rules_from_env())
+        # ⚖️ Rapprochement grand livre / soldes (vérification incrémentale toutes les TRANSFERZ_RECONCILE_INTERVAL s)
+        self.reconciler = Reconciler(store, interval=float(os.getenv("TRANSFERZ_RECONCILE_INTERVAL", "5")))
+        self.deposit_pipeline = None
+
+    def start_deposits(self, adapters):
+        # 📲 Dépôts Mobile Money réglés en arrière-plan (TRANSFERZ_DEPOSIT_WORKERS)
+        self.deposit_pipeline = DepositPipeline(self.store, self.txm, adapters,
+                                                workers=int(os.getenv("TRANSFERZ_DEPOSIT_WORKERS", "8")))
+
+    def close(self):
+        self.reconciler.close()
+        if self.deposit_pipeline is not None:
+            self.deposit_pipeline.close()
+
+    def account(self, caller, status=404, detail="Utilisateur non trouvé."):
+        """Compte de l'appelant ; un token émis pour un ancien compte du même nom est refusé."""
+        user = self.store.users.get(caller.username)
+        if user is None:
+            raise AccountError(status, detail)
+        if caller.did is not None and user["did"] != caller.did:
+            raise AccountError(401, "Token revoked")
+        return user
+
+    def _velocity_error(self, event, username, amount, receivers=(), count=1):
+        try:
+            self.velocity.check(event, username, amount, receivers, count)
+        except VelocityExceeded as e:
+            return e.detail
+        return None
+
+    # 👤 Comptes
+    def exists(self, username):
+        return username in self.store.users
+
+    def conflicts(self, rows):
+        """Pour chaque (nom, numéro) : message si l'un des deux est déjà pris, sinon None."""
+        return [USER_EXISTS if username in self.store.users
+                else PHONE_TAKEN if phone_number in self.store.by_phone else None
+                for username, phone_number in rows]
+
+    def credentials(self, username):
+        """(DID, hash du mot de passe), ou None si le compte n'existe pas."""
+        user = self.store.users.get(username)
+        return (user["did"], user["password"]) if user is not None else None
+
+    @staticmethod
+    def _opening_records(username, user, source=None):
+        records = [storage.put_user(username, user)]
+        if user.get("balance_fcfa") or user.get("balance_stablecoin"):
+            extra = {"source": source} if source else {}
+            records.append(ledger.entry(
+                ledger.ADMIN_BALANCE, account=username, **extra,
+                balance_fcfa=user.get("balance_fcfa", 0), balance_stablecoin=user.get("balance_stablecoin", 0),
+                delta_fcfa=user.get("balance_fcfa", 0), delta_stablecoin=user.get("balance_stablecoin", 0),
+            ))
+        return records
+
+    def create_account(self, username, user, source=None, guard=None):
+        """Crée le compte (et l'écriture de ses soldes d'ouverture) ; `guard` est
+        appelé sous `store.lock`, juste avant l'écriture."""
+        records = self._opening_records(username, user, source)
+        # Vérification et insertion atomiques (deux inscriptions simultanées du même nom)
+        with self.store.lock:
+            if username in self.store.users:
+                raise AccountError(400, USERNAME_TAKEN)
+            if any(phone_number in self.store.by_phone for phone_number in user.get("phone_numbers", [])):
+                raise AccountError(400, PHONE_TAKEN)
+            if guard is not None:
+                guard()
+            seq = self.store.submit(*records)
+        self.store.wait(seq)
+
+    def import_accounts(self, rows, source="bulk_import"):
+        """Crée les comptes [(numéro de ligne, nom, compte)] en un commit ; renvoie [(numéro, erreur)]."""
+        errors = []
+        records = []
+        with self.store.lock:
+            # Revérification : une inscription a pu arriver pendant le hachage
+            for number, username, user in rows:
+                if username in self.store.users:
+                    errors.append((number, USER_EXISTS))
+                elif any(p in self.store.by_phone for p in user["phone_numbers"]):
+                    errors.append((number, PHONE_TAKEN))
+                else:
+                    records.extend(self._opening_records(username, user, source))
+            seq = self.store.submit(*records) if records else None
+        if seq is not None:
+            self.store.wait(seq)
+        return errors
+
+    def delete_account(self, username, guard=None):
+        """Supprime le compte ; renvoie son DID et ses numéros."""
+        user = self.store.users.get(username)
+        if user is None:
+            raise AccountError(404, "Utilisateur introuvable")
+        with self.txm.locked(user["did"]):
+            with self.store.lock:
+                user = self.store.users.get(username)
+                if user is None:
+                    raise AccountError(404, "Utilisateur introuvable")
+                if guard is not None:
+                    guard(username)
+                seq = self.store.submit(storage.delete_user(username))
+        self.store.wait(seq)
+        return {"did": user["did"], "phone_numbers": list(user["phone_numbers"])}
+
+    def set_balances(self, username, balance_fcfa, balance_stablecoin):
+        user = self.store.users.get(username)
+        if user is None:
+            raise AccountError(404, "Utilisateur introuvable")
+        with self.txm.locked(user["did"]):
+            if username not in self.store.users:
+                raise AccountError(404, "Utilisateur introuvable")
+            table = self.store.balances
+            delta_stablecoin = balances.to_minor(STABLECOIN, balance_stablecoin) - table.get(username, STABLECOIN)
+            seq = self.store.submit(
+                storage.set_balance(username, balance_fcfa=balance_fcfa, balance_stablecoin=balance_stablecoin),
+                ledger.entry(
+                    ledger.ADMIN_BALANCE, account=username,
+                    balance_fcfa=balance_fcfa, balance_stablecoin=balance_stablecoin,
+                    delta_fcfa=balance_fcfa - table.get(username, FCFA),
+                    delta_stablecoin=balances.from_minor(STABLECOIN, delta_stablecoin),
+                ),
+            )
+        self.store.wait(seq)
+
+    # 📊 Agrégats des soldes (calculés sur la table des soldes, sans boucle sur les comptes)
+    def balance_range(self, currency):
+        with self.store.lock:
+            return self.store.balances.bounds(currency)
+
+    def balance_aggregates(self, currency, top, bins, value_range=None):
+        """Agrégats en unités entières ; `value_range` fixe les bornes de l'histogramme."""
+        with self.store.lock:
+            table = self.store.balances
+            counts, edges = table.histogram(currency, bins, value_range)
+            return {
+                "accounts": len(table),
+                "supply": {c: table.total_supply(c) for c in balances.CURRENCIES},
+                "top": table.top(currency, top),
+                "counts": counts,
+                "edges": edges,
+            }
+
+    def balances_summary(self, currency, top, bins):
+        return balances_report(currency, self.balance_aggregates(currency, top, bins))
+
+    def velocity_usage(self, username):
+        if username not in self.store.users:
+            raise AccountError(404, "Utilisateur non trouvé.")
+        return self.velocity.usage(username)
+
+    def reconciliation(self, full=False, limit=100):
+        if full:
+            self.reconciler.audit()
+        else:
+            self.reconciler.check()
+        return self.reconciler.report(limit)
+
+    def gauges(self):
+        """Valeurs des jauges Prometheus liées aux comptes."""
+        return {
+            "total_supply": {c: balances.from_minor(c, self.store.balances.total_supply(c))
+                             for c in balances.CURRENCIES},
+            "discrepancies": len(self.reconciler.discrepancies),
+            "deposit_queue_depth": self.deposit_pipeline.depth(),
+            "deposits_settled": dict(self.deposit_pipeline.settled),
+            "velocity_tracked": self.velocity.tracked(),
+        }
+
+    # 👤 Tableau de bord : profil, DID, soldes, numéros et dernières opérations
+    def profile(self, caller, transactions=10):
+        with self.store.lock:
+            account = self.account(caller)
+            profile = {
+                "username": caller.username,
+                "did": account["did"],
+                "blockchain_address": account.get("blockchain_address", ""),
+                "phone_numbers": list(account["phone_numbers"]),
+                **self.store.balances.as_fields(caller.username),
+            }
+            items, next_cursor = self.book.history(account["did"], limit=transactions)
+        return {**profile, "transactions": items, "next_cursor": next_cursor}
+
+    def account_did(self, caller):
+        return self.account(caller)["did"]
+
+    def phones(self, caller):
+        return list(self.account(caller)["phone_numbers"])
+
+    def add_phone(self, caller, phone_number, guard=None):
+        self.account(caller, detail="Utilisateur introuvable")
+        with self.store.lock:
+            self.account(caller, detail="Utilisateur introuvable")
+            owner = self.store.by_phone.get(phone_number)
+            if owner == caller.username:
+                raise AccountError(400, "Numéro déjà lié à votre compte.")
+            if owner is not None:
+                raise AccountError(400, PHONE_TAKEN)
+            if guard is not None:
+                guard()
+            seq = self.store.submit(storage.add_phone(caller.username, phone_number))
+        self.store.wait(seq)
+
+    # 📌 Annuaire des DID
+    def lookup(self, username=None, phone_number=None):
+        """DID du compte qui porte ce nom ou ce numéro, sinon None."""
+        owner = username if username is not None else self.store.by_phone.get(phone_number)
+        account = self.store.users.get(owner) if owner is not None else None
+        return account["did"] if account else None
+
+    def users_etag(self):
+        # Change dès qu'un utilisateur est ajouté, supprimé ou reçoit un numéro
+        return f"{self.store.users_epoch}-{self.store.users_version}"
+
+    def did_page(self, cursor, q, match, limit):
+        """Jusqu'à `limit + 1` DID triés après `cursor` (le dernier signale une page suivante)."""
+        if q and match != "prefix":
+            # Sous-chaîne : tranches copiées sous le verrou, chacune reprise après le dernier DID vu
+            # (comme un curseur) ; une écriture n'attend pas la fin d'un parcours complet
+            page = []
+            last = cursor
+            while len(page) <= limit:
+                with self.store.lock:
+                    dids = self.store.dids_sorted
+                    start = bisect.bisect_right(dids, last) if last else 0
+                    chunk = dids[start:start + DID_SCAN_CHUNK]
+                if not chunk:
+                    break
+                page.extend(did for did in chunk if q in did)
+                last = chunk[-1]
+            return page[:limit + 1]
+
+        with self.store.lock:
+            dids = self.store.dids_sorted
+            start = bisect.bisect_right(dids, cursor) if cursor else 0
+            if q:
+                # Liste triée : les DID qui commencent par q sont contigus
+                start = max(start, bisect.bisect_left(dids, q))
+                return [d for d in dids[start:start + limit + 1] if d.startswith(q)]
+            return dids[start:start + limit + 1]
+
+    # 📋 Historique des transactions (pagination par curseur)
+    def history(self, caller, limit=50, cursor=None, entry_type=None, since=None, until=None):
+        did = self.account(caller)["did"]
+        return self.book.history(did, limit=limit, cursor=cursor, entry_type=entry_type, since=since, until=until)
+
+    # 📲 Dépôts Mobile Money : journalisés ici, réglés en arrière-plan par le pipeline
+    def create_deposit(self, caller, phone_number, amount, operator, key):
+        """Renvoie (dépôt, rejoué) ; un nouvel essai avec la même clé renvoie le dépôt d'origine."""
+        user = self.account(caller, status=400)
+        username = caller.username
+        if self.store.by_phone.get(phone_number) != username:
+            raise AccountError(400, "Numéro Mobile Money non enregistré. "
+                                    f"Numéros enregistrés : {user['phone_numbers']}")
+        adapters = self.deposit_pipeline.adapters
+        if operator not in adapters:
+            raise AccountError(400, f"Opérateur inconnu. Opérateurs possibles : {', '.join(adapters)}")
+
+        with self.store.lock:
+            existing_id = self.store.deposit_keys.get((username, key))
+            if existing_id is not None:
+                existing = self.store.deposits[existing_id]
+                if (existing["phone_number"], existing["amount"]) != (phone_number, amount):
+                    raise AccountError(409, "Clé d'idempotence déjà utilisée pour un autre dépôt.")
+                return deposits.public_view(existing), True
+
+            error = self._velocity_error(velocity.DEPOSIT, username, amount)
+            if error:
+                raise AccountError(403, error)
+
+            now = time.time()
+            deposit = {
+                "id": uuid.uuid4().hex,
+                "username": username,
+                "idempotency_key": key,
+                "phone_number": phone_number,
+                "operator": operator,
+                "amount": amount,
+                "status": deposits.PENDING,
+                "created_at": now,
+                "updated_at": now,
+            }
+            seq = self.store.submit(storage.put_deposit(deposit))
+        self.store.wait(seq)
+        self.deposit_pipeline.enqueue(deposit["id"])
+        return deposits.public_view(deposit), False
+
+    def deposit(self, caller, deposit_id):
+        deposit = self.store.deposits.get(deposit_id)
+        if deposit is None or deposit["username"] != caller.username:
+            return None
+        return deposits.public_view(deposit)
+
+    # 🔄 Transfert P2P via DID
+    def transfer(self, caller, receiver_did, amount):
+        sender_did, minor = self.check_transfer(caller, receiver_did, amount)
+        username = caller.username
+
+        # Verrous pris dans l'ordre des DID : pas d'interblocage entre A→B et B→A
+        with self.txm.locked(sender_did, receiver_did):
+            receiver = self.store.by_did.get(receiver_did)
+            balance = self.check_funds(caller, receiver, minor)
+            seq = self.store.submit(
+                storage.set_balance(username, balance_stablecoin=balances.from_minor(STABLECOIN, balance - minor)),
+                storage.set_balance(receiver, balance_stablecoin=balances.from_minor(
+                    STABLECOIN, self.store.balances.get(receiver, STABLECOIN) + minor)),
+                ledger.entry(ledger.TRANSFER, sender=username, receiver=receiver, currency="USDT", amount=amount,
+                             sender_did=sender_did, receiver_did=receiver_did),
+            )
+        self.store.wait(seq)
+
+    def check_transfer(self, caller, receiver_did, amount):
+        """Contrôles hors verrou d'un transfert : renvoie (DID expéditeur, montant en unités)."""
+        sender_did = self.account(caller)["did"]
+        if sender_did == receiver_did:
+            raise AccountError(400, "Vous ne pouvez pas vous envoyer de l'argent.")
+        minor = balances.to_minor(STABLECOIN, amount)
+        if minor <= 0:
+            raise AccountError(400, "Montant invalide.")
+        return sender_did, minor
+
+    def check_funds(self, caller, receiver, minor):
+        """Contrôles sous le verrou de l'expéditeur (`receiver` : nom, None s'il
+        n'existe pas) ; renvoie le solde de l'expéditeur en unités."""
+        self.account(caller)
+        if not receiver:
+            raise AccountError(404, "Destinataire non trouvé.")
+        balance = self.store.balances.get(caller.username, STABLECOIN)
+        if balance < minor:
+            raise AccountError(400, "Solde insuffisant")
+        error = self._velocity_error(velocity.TRANSFER, caller.username, minor, (receiver,))
+        if error:
+            raise AccountError(403, error)
+        return balance
+
+    def plan_batch(self, username, sender_did, transfers, receiver_of):
+        """Valide les lignes [(DID destinataire, montant)] d'un lot sur l'état courant.
+
+        `receiver_of(did)` donne le nom du destinataire (None s'il n'existe
+        pas). À appeler sous les verrous de l'expéditeur et des destinataires.
+        Renvoie (débit total, crédits {nom: unités}, écritures, résultats par ligne).
+        """
+        balance = self.store.balances.get(username, STABLECOIN)
+        debit = 0
+        credits = {}
+        entries = []
+        results = []
+        for index, (receiver_did, amount) in enumerate(transfers):
+            receiver = receiver_of(receiver_did)
+            minor = balances.to_minor(STABLECOIN, amount)
+            if receiver_did == sender_did:
+                error = "Vous ne pouvez pas vous envoyer de l'argent."
+            elif minor <= 0:
+                error = "Montant invalide."
+            elif receiver is None:
+                error = "Destinataire non trouvé."
+            elif debit + minor > balance:
+                error = "Solde insuffisant"
+            else:
+                # Cumul des lignes déjà acceptées dans ce lot
+                pending = itertools.chain(credits, () if receiver in credits else (receiver,))
+                error = self._velocity_error(velocity.TRANSFER, username, debit + minor, pending, len(entries) + 1)
+
+            if error:
+                results.append({"index": index, "receiver_did": receiver_did, "status": "rejected", "detail": error})
+                continue
+            debit += minor
+            credits[receiver] = credits.get(receiver, 0) + minor
+            entries.append(ledger.entry(ledger.TRANSFER, sender=username, receiver=receiver, currency="USDT",
+                                        amount=amount, sender_did=sender_did, receiver_did=receiver_did))
+            results.append({"index": index, "receiver_did": receiver_did, "status": "ok"})
+        return debit, credits, entries, results
+
+    # 📦 Transfert groupé (paie, reversements marchands)
+    def transfer_batch(self, caller, transfers, mode="atomic"):
+        sender_did = self.account(caller)["did"]
+        if not transfers:
+            raise AccountError(400, "Aucun transfert fourni.")
+        username = caller.username
+        dids = {sender_did}.union(receiver_did for receiver_did, _ in transfers)
+
+        # Toutes les lignes sont validées sur le même état, sous les verrous de tous les comptes
+        with self.txm.locked(*dids):
+            self.account(caller)
+            debit, credits, entries, results = self.plan_batch(username, sender_did, transfers,
+                                                               self.store.by_did.get)
+            if mode == "atomic" and len(entries) < len(results):
+                refuse_batch(results)
+
+            seq = self.commit_batch(username, debit, credits, entries) if credits else None
+        if seq is not None:
+            self.store.wait(seq)
+        return batch_summary(results, debit)
+
+    def commit_batch(self, username, debit, credits, entries):
+        """Débit, crédits {nom: unités} et écritures d'un lot en un commit (sous les verrous) ; renvoie son seq."""
+        table = self.store.balances
+        records = [storage.set_balance(username, balance_stablecoin=balances.from_minor(
+            STABLECOIN, table.get(username, STABLECOIN) - debit))]
+        records.extend(
+            storage.set_balance(receiver, balance_stablecoin=balances.from_minor(
+                STABLECOIN, table.get(receiver, STABLECOIN) + minor))
+            for receiver, minor in credits.items()
+        )
+        records.extend(entries)
+        return self.store.submit(*records)
@@ -0,0 +1,36 @@
+import math
+from typing import Annotated
+
+from fastapi import Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import JSONResponse
+from pydantic import Field
+
+from balances import FCFA, STABLECOIN, MAX_MINOR, from_minor
+
+# 💶 Montants finis et représentables en unités entières (balances.MAX_MINOR), sinon 422.
+# Partagés par backend/main.py et backend/transferz_poc.py, qui écrivent via balances.to_minor.
+MAX_FCFA = from_minor(FCFA, MAX_MINOR)
+MAX_STABLECOIN = from_minor(STABLECOIN, MAX_MINOR)
+
+FcfaAmount = Annotated[float, Field(gt=0, le=MAX_FCFA, allow_inf_nan=False)]
+StablecoinAmount = Annotated[float, Field(gt=0, le=MAX_STABLECOIN, allow_inf_nan=False)]
+FcfaBalance = Annotated[int, Field(ge=0, le=MAX_FCFA)]
+StablecoinBalance = Annotated[float, Field(ge=0, le=MAX_STABLECOIN, allow_inf_nan=False)]
+
+
+# ❌ 422 : une entrée non finie (Infinity, NaN) est renvoyée en texte, JSON ne sait pas l'encoder
+def _finite_json(value):
+    if isinstance(value, float) and not math.isfinite(value):
+        return str(value)
+    if isinstance(value, dict):
+        return {k: _finite_json(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_finite_json(v) for v in value]
+    return value
+
+
+async def validation_error(request: Request, exc: RequestValidationError):
+    """Gestionnaire des 422 (`app.add_exception_handler(RequestValidationError, validation_error)`)."""
+    return JSONResponse(status_code=422, content={"detail": _finite_json(jsonable_encoder(exc.errors()))})
@@ -0,0 +1,77 @@
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+# 🎟️ Cache des tokens déjà vérifiés
+class TokenCache:
+    """LRU borné : empreinte SHA-256 du token -> claims décodés, jusqu'à `exp`.
+
+    `revoke()` invalide immédiatement tous les tokens d'un utilisateur émis
+    avant la révocation (claim `iat`), qu'ils soient en cache ou non. `iat`
+    et la révocation sont comparés à la même précision (secondes
+    fractionnaires de `time.time()`) : un `iat` entier, tronqué à la
+    seconde, placerait avant la révocation un token émis juste après. Les
+    révocations plus anciennes que la durée de vie d'un token sont oubliées.
+    """
+
+    def __init__(self, max_size=10000, token_lifetime=30 * 24 * 3600):
+        self.max_size = max_size
+        self.token_lifetime = token_lifetime
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._revoked = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _digest(token):
+        return hashlib.sha256(token.encode()).digest()
+
+    def get(self, token):
+        key = self._digest(token)
+        with self._lock:
+            claims = self._entries.get(key)
+            if claims is None or claims.get("exp", 0) <= time.time():
+                if claims is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return claims
+
+    def put(self, token, claims):
+        key = self._digest(token)
+        with self._lock:
+            self._entries[key] = claims
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def revoke(self, username):
+        now = time.time()
+        with self._lock:
+            self._revoked.pop(username, None)
+            self._revoked[username] = now
+            while self._revoked:
+                oldest, revoked_at = next(iter(self._revoked.items()))
+                if revoked_at > now - self.token_lifetime:
+                    break
+                del self._revoked[oldest]
+
+    def is_revoked(self, claims):
+        """Token émis au plus tard à la dernière révocation de son utilisateur."""
+        revoked_at = self._revoked.get(claims.get("sub"))
+        return revoked_at is not None and claims.get("iat", 0) <= revoked_at
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "revoked_users": len(self._revoked),
+            }
@@ -0,0 +1,168 @@
+import numpy as np
+
+# 💰 Soldes en unités entières : FCFA (pas de subdivision) et micro-stablecoin
+FCFA = "fcfa"
+STABLECOIN = "stablecoin"
+CURRENCIES = (FCFA, STABLECOIN)
+SCALE = {FCFA: 1, STABLECOIN: 1_000_000}
+FIELDS = {FCFA: "balance_fcfa", STABLECOIN: "balance_stablecoin"}
+# Plus grand montant accepté, en unités entières : exact en float, et des
+# milliers de soldes à ce plafond tiennent encore dans un int64
+MAX_MINOR = 2 ** 53
+
+
+def to_minor(currency, amount):
+    """Montant affiché -> unités entières ; ValueError si non fini ou hors de ±MAX_MINOR."""
+    value = amount * SCALE[currency]
+    if not abs(value) <= MAX_MINOR:
+        raise ValueError(f"Montant hors limites : {amount}")
+    return int(round(value))
+
+
+def from_minor(currency, value):
+    value = int(value)
+    return value if currency == FCFA else value / SCALE[currency]
+
+
+# 📊 Table compacte des soldes, un slot par compte
+class BalanceTable:
+    """Soldes de tous les comptes dans des tableaux numpy d'entiers (int64).
+
+    Chaque compte occupe un slot ; les slots libérés par une suppression
+    sont réutilisés. D'autres colonnes alignées sur les mêmes slots peuvent
+    être ajoutées (`add_column`), par exemple les soldes attendus d'après le
+    grand livre. Les agrégats (masse totale, plus gros soldes,
+    histogramme) sont calculés sur les tableaux, sans parcourir les comptes
+    en Python. N'est pas protégée par un verrou : le store la modifie sous
+    `store.lock`.
+    """
+
+    def __init__(self, capacity=1024):
+        self._values = {currency: np.zeros(capacity, dtype=np.int64) for currency in CURRENCIES}
+        self._used = np.zeros(capacity, dtype=bool)
+        self._owners = [None] * capacity
+        self._slots = {}
+        self._free = []
+        self._end = 0
+
+    def __len__(self):
+        return len(self._slots)
+
+    def __contains__(self, username):
+        return username in self._slots
+
+    def __getstate__(self):
+        # Snapshot binaire : seulement les soldes, les colonnes ajoutées sont recalculées au démarrage
+        state = dict(self.__dict__)
+        state["_values"] = {currency: self._values[currency] for currency in CURRENCIES}
+        return state
+
+    def copy(self):
+        clone = object.__new__(BalanceTable)
+        clone._values = {name: values.copy() for name, values in self._values.items()}
+        clone._used = self._used.copy()
+        clone._owners = list(self._owners)
+        clone._slots = dict(self._slots)
+        clone._free = list(self._free)
+        clone._end = self._end
+        return clone
+
+    def add_column(self, name):
+        if name not in self._values:
+            self._values[name] = np.zeros(len(self._used), dtype=np.int64)
+
+    def _grow(self):
+        capacity = len(self._used) * 2
+        for name, values in self._values.items():
+            self._values[name] = np.resize(values, capacity)
+            self._values[name][len(values):] = 0
+        used = np.zeros(capacity, dtype=bool)
+        used[:len(self._used)] = self._used
+        self._used = used
+        self._owners.extend([None] * (capacity - len(self._owners)))
+
+    def add(self, username, **minor):
+        slot = self._slots.get(username)
+        if slot is None:
+            if self._free:
+                slot = self._free.pop()
+            else:
+                if self._end == len(self._used):
+                    self._grow()
+                slot = self._end
+                self._end += 1
+            self._slots[username] = slot
+            self._owners[slot] = username
+            self._used[slot] = True
+            for values in self._values.values():
+                values[slot] = 0
+        for currency in CURRENCIES:
+            self._values[currency][slot] = minor.get(currency, 0)
+
+    def remove(self, username):
+        slot = self._slots.pop(username, None)
+        if slot is None:
+            return
+        self._used[slot] = False
+        self._owners[slot] = None
+        for values in self._values.values():
+            values[slot] = 0
+        self._free.append(slot)
+
+    def get(self, username, column):
+        return int(self._values[column][self._slots[username]])
+
+    def set(self, username, column, value):
+        self._values[column][self._slots[username]] = value
+
+    def add_to(self, username, column, delta):
+        slot = self._slots.get(username)
+        if slot is not None:
+            self._values[column][slot] += delta
+
+    def as_fields(self, username):
+        """Soldes au format des enregistrements (`balance_fcfa`, `balance_stablecoin`)."""
+        slot = self._slots[username]
+        return {FIELDS[c]: from_minor(c, self._values[c][slot]) for c in CURRENCIES}
+
+    # 📈 Agrégats vectorisés
+    def total_supply(self, column):
+        return int(self._values[column][:self._end].sum())
+
+    def diff(self, column, other):
+        """Comptes dont les colonnes `column` et `other` diffèrent : [(username, valeur, autre)]."""
+        a = self._values[column][:self._end]
+        b = self._values[other][:self._end]
+        slots = np.flatnonzero(self._used[:self._end] & (a != b))
+        return [(self._owners[s], int(a[s]), int(b[s])) for s in slots]
+
+    def top(self, currency, n):
+        """Les `n` plus gros soldes, du plus grand au plus petit : [(username, unités)]."""
+        slots = np.flatnonzero(self._used[:self._end])
+        if n <= 0 or not len(slots):
+            return []
+        values = self._values[currency][slots]
+        if n < len(slots):
+            best = np.argpartition(values, -n)[-n:]
+        else:
+            best = np.arange(len(slots))
+        best = best[np.argsort(values[best], kind="stable")[::-1]]
+        return [(self._owners[slots[i]], int(values[i])) for i in best]
+
+    def bounds(self, currency):
+        """(plus petit, plus grand) solde en unités, None sans compte."""
+        values = self._values[currency][:self._end][self._used[:self._end]]
+        if not len(values):
+            return None
+        return int(values.min()), int(values.max())
+
+    def histogram(self, currency, bins=10, value_range=None):
+        """Nombre de comptes par tranche de solde : (effectifs, bornes en unités).
+
+        `value_range` impose les bornes (histogrammes de plusieurs tables à additionner).
+        """
+        values = self._values[currency][:self._end][self._used[:self._end]]
+        if not len(values) and value_range is None:
+            return [], []
+        counts, edges = np.histogram(values, bins=bins, range=value_range)
+        return counts.tolist(), edges.tolist()
@@ -0,0 +1,150 @@
+import io
+import csv
+import json
+import uuid
+
+import hashing
+from balances import FCFA, STABLECOIN, to_minor
+from keypool import generate_keypair
+
+# 📥 Import en masse d'utilisateurs (NDJSON ou CSV)
+# Colonnes : username, password ou password_hash (bcrypt déjà calculé),
+# phone_number, balance_fcfa, balance_stablecoin
+
+
+async def _iter_lines(stream):
+    """Lignes du corps, sans le \n final. Le tampon n'est ni recopié ni
+    réexaminé à chaque morceau : coût linéaire, même pour une longue ligne."""
+    buffer = bytearray()
+    async for chunk in stream:
+        scan = len(buffer)
+        buffer += chunk
+        start = 0
+        while (end := buffer.find(b"\n", scan)) >= 0:
+            yield bytes(buffer[start:end])
+            start = scan = end + 1
+        del buffer[:start]
+    if buffer:
+        yield bytes(buffer)
+
+
+async def iter_rows(stream, fmt):
+    """Lit le corps de la requête au fil de l'eau : (numéro de ligne, ligne, erreur).
+
+    En CSV, un champ entre guillemets peut contenir des retours à la ligne :
+    les lignes sont regroupées tant qu'un guillemet reste ouvert, puis
+    l'enregistrement est lu par le module csv. Son numéro est celui de sa
+    première ligne.
+    """
+    header = None
+    number = 0
+    pending = []
+    quotes = 0
+    first = 0
+    async for raw in _iter_lines(stream):
+        number += 1
+        try:
+            text = raw.decode("utf-8")
+        except UnicodeDecodeError:
+            pending, quotes = [], 0
+            yield number, None, "Encodage invalide (UTF-8 attendu)."
+            continue
+
+        if fmt == "csv":
+            if not pending:
+                if not text.strip():
+                    continue
+                first = number
+            pending.append(text)
+            quotes += text.count('"')
+            if quotes % 2:
+                continue
+            record, pending, quotes = "\n".join(pending), [], 0
+            try:
+                values = next(csv.reader(io.StringIO(record, newline="")))
+            except csv.Error as e:
+                yield first, None, f"CSV invalide : {e}"
+                continue
+            if header is None:
+                header = [name.strip() for name in values]
+                continue
+            yield first, dict(zip(header, values)), None
+            continue
+
+        line = text.strip()
+        if not line:
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            yield number, None, "JSON invalide."
+            continue
+        if not isinstance(row, dict):
+            yield number, None, "Objet JSON attendu."
+            continue
+        yield number, row, None
+
+    if pending:
+        yield first, None, "CSV invalide : guillemet non fermé."
+
+
+def _fcfa_balance(value):
+    """Solde FCFA entier : le FCFA n'a pas de subdivision, 12.7 est refusé plutôt que tronqué."""
+    if isinstance(value, float) and not value.is_integer():
+        raise ValueError(f"Solde FCFA non entier : {value}")
+    return int(value)
+
+
+def validate_row(row):
+    """Renvoie (ligne normalisée, None) ou (None, message d'erreur)."""
+    username = str(row.get("username") or "").strip()
+    phone_number = str(row.get("phone_number") or "").strip()
+    # En NDJSON, un mot de passe non textuel (nombre, objet) ne doit pas atteindre bcrypt
+    for field in ("password", "password_hash"):
+        if row.get(field) is not None and not isinstance(row[field], str):
+            return None, f"{field} doit être une chaîne."
+    password = row.get("password") or None
+    password_hash = row.get("password_hash") or None
+
+    if not username:
+        return None, "username manquant."
+    if not phone_number:
+        return None, "phone_number manquant."
+    if not password and not password_hash:
+        return None, "password ou password_hash requis."
+    if password_hash and hashing.pwd_context().identify(password_hash) is None:
+        return None, "password_hash non reconnu (bcrypt attendu)."
+
+    try:
+        balance_fcfa = _fcfa_balance(row.get("balance_fcfa") or 0)
+        balance_stablecoin = float(row.get("balance_stablecoin") or 0)
+        # Refuse "nan", "inf" et les montants hors limites du store
+        to_minor(FCFA, balance_fcfa)
+        to_minor(STABLECOIN, balance_stablecoin)
+    except (TypeError, ValueError, OverflowError):
+        return None, "Solde invalide."
+    if balance_fcfa < 0 or balance_stablecoin < 0:
+        return None, "Solde négatif."
+
+    return {
+        "username": username,
+        "phone_number": phone_number,
+        "password": password,
+        "password_hash": password_hash,
+        "balance_fcfa": balance_fcfa,
+        "balance_stablecoin": balance_stablecoin,
+    }, None
+
+
+def prepare_account(row):
+    """Exécuté dans le pool de processus : hachage bcrypt et génération des clés."""
+    private_key, address = generate_keypair()
+    return {
+        "password": row["password_hash"] or hashing.hash_password(row["password"]),
+        "did": f"did:transferz:{uuid.uuid4()}",
+        "private_key": private_key,
+        "blockchain_address": address,
+        "phone_numbers": [row["phone_number"]],
+        "balance_fcfa": row["balance_fcfa"],
+        "balance_stablecoin": row["balance_stablecoin"],
+    }
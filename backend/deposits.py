@@ -0,0 +1,133 @@
+import time
+import asyncio
+import logging
+import threading
+
+import storage
+import ledger
+from balances import FCFA
+from operators import OperatorError, OperatorUnavailable
+
+logger = logging.getLogger("transferz.deposits")
+
+# 📲 États d'un dépôt
+PENDING = "pending"
+COMPLETED = "completed"
+FAILED = "failed"
+
+
+def public_view(deposit):
+    return {key: value for key, value in deposit.items() if key != "username"}
+
+
+# ⏳ Règlement asynchrone des dépôts Mobile Money
+class DepositPipeline:
+    """File de dépôts réglés en arrière-plan auprès des opérateurs.
+
+    Un dépôt accepté est d'abord journalisé (`put_deposit`, statut pending),
+    puis mis en file. Des workers asyncio, dans un thread dédié, appellent
+    l'adaptateur de l'opérateur (pannes passagères retentées avec un délai
+    croissant) et créditent le compte dans le même commit que le passage à
+    `completed`. Au démarrage, les dépôts restés pending sont remis en file.
+    """
+
+    def __init__(self, store, txm, adapters, workers=8, max_attempts=5, retry_delay=0.5):
+        self.store = store
+        self.txm = txm
+        self.adapters = adapters
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.settled = {COMPLETED: 0, FAILED: 0}
+
+        self._loop = asyncio.new_event_loop()
+        self._queue = None
+        self._ready = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="deposit-pipeline", daemon=True)
+        self._thread.start()
+        self._ready.wait()
+
+        with store.lock:
+            pending = [d["id"] for d in store.deposits.values() if d["status"] == PENDING]
+        for deposit_id in pending:
+            self.enqueue(deposit_id)
+        if pending:
+            logger.info("🔁 %d dépôts en attente remis en file", len(pending))
+
+    def _run(self):
+        asyncio.set_event_loop(self._loop)
+        self._queue = asyncio.Queue()
+        for _ in range(self.workers):
+            self._loop.create_task(self._worker())
+        self._ready.set()
+        self._loop.run_forever()
+
+    def enqueue(self, deposit_id):
+        self._loop.call_soon_threadsafe(self._queue.put_nowait, deposit_id)
+
+    def depth(self):
+        return self._queue.qsize()
+
+    async def _worker(self):
+        while True:
+            deposit_id = await self._queue.get()
+            try:
+                await self._settle(deposit_id)
+            except Exception as e:
+                # Reste pending : retenté au prochain démarrage
+                logger.error("❌ Erreur de règlement du dépôt %s : %s", deposit_id, e)
+
+    async def _settle(self, deposit_id):
+        deposit = self.store.deposits[deposit_id]
+        adapter = self.adapters[deposit["operator"]]
+        error = None
+        for attempt in range(self.max_attempts):
+            if attempt:
+                await asyncio.sleep(self.retry_delay * 2 ** (attempt - 1))
+            try:
+                reference = await adapter.collect(deposit["phone_number"], deposit["amount"], deposit_id)
+            except OperatorUnavailable as e:
+                error = str(e)
+                continue
+            except OperatorError as e:
+                error = str(e)
+                break
+            await self._loop.run_in_executor(None, self._credit, deposit_id, reference)
+            return
+        await self._loop.run_in_executor(None, self._fail, deposit_id, error)
+
+    def _credit(self, deposit_id, reference):
+        deposit = self.store.deposits[deposit_id]
+        username = deposit["username"]
+        user = self.store.users.get(username)
+        if user is None:
+            return self._fail(deposit_id, "Utilisateur supprimé.")
+
+        with self.txm.locked(user["did"]):
+            deposit = self.store.deposits[deposit_id]
+            if deposit["status"] != PENDING:
+                return
+            if username not in self.store.users:
+                return self._fail(deposit_id, "Utilisateur supprimé.")
+            new_balance = self.store.balances.get(username, FCFA) + deposit["amount"]
+            seq = self.store.submit(
+                storage.put_deposit({**deposit, "status": COMPLETED, "operator_reference": reference,
+                                     "updated_at": time.time()}),
+                storage.set_balance(username, balance_fcfa=new_balance),
+                ledger.entry(ledger.DEPOSIT, account=username, currency="FCFA", amount=deposit["amount"],
+                             phone_number=deposit["phone_number"], operator=deposit["operator"],
+                             deposit_id=deposit_id),
+            )
+        self.store.wait(seq)
+        self.settled[COMPLETED] += 1
+        logger.debug("✅ Dépôt réglé", extra={"deposit_id": deposit_id, "user": username})
+
+    def _fail(self, deposit_id, error):
+        deposit = self.store.deposits[deposit_id]
+        self.store.apply(storage.put_deposit({**deposit, "status": FAILED, "error": error,
+                                              "updated_at": time.time()}))
+        self.settled[FAILED] += 1
+        logger.warning("⚠️ Dépôt échoué : %s", error, extra={"deposit_id": deposit_id})
+
+    def close(self):
+        self._loop.call_soon_threadsafe(self._loop.stop)
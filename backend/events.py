@@ -0,0 +1,180 @@
+import json
+import asyncio
+import logging
+import threading
+
+import storage
+from ledger import parties
+
+logger = logging.getLogger("transferz.events")
+
+HEARTBEAT = 15.0  # secondes entre deux commentaires keep-alive
+RESET = "reset"
+
+
+def format_event(event_id, event, data):
+    lines = [f"id: {event_id}"] if event_id is not None else []
+    lines += [f"event: {event}", f"data: {json.dumps(data)}"]
+    return "\n".join(lines) + "\n\n"
+
+
+class _Subscription:
+    __slots__ = ("username", "did", "loop", "queue", "overflow")
+
+    def __init__(self, username, did, loop, size):
+        self.username = username
+        self.did = did
+        self.loop = loop
+        self.queue = asyncio.Queue(size + 1)  # + la place du marqueur de fin
+        self.overflow = False
+
+
+# 📡 Diffusion des écritures du grand livre aux abonnés (SSE)
+class EventBus:
+    """Pub/sub en mémoire, par utilisateur, alimenté par le store.
+
+    Les écritures sont publiées par le thread d'écriture une fois durables
+    (`add_commit_listener`), jamais avant : un abonné ne voit pas un
+    transfert qui serait perdu par un crash. L'id d'un événement est l'id de
+    l'écriture ; `Last-Event-ID` rejoue les écritures manquées depuis
+    l'index du grand livre. Un abonné inactif ne coûte qu'une file asyncio
+    vide ; une file pleine (client trop lent) ferme le flux, le client se
+    reconnecte et reprend depuis son dernier id. `published` compte les
+    événements mis en file (tous seront envoyés), `overflows` les flux
+    fermés ainsi.
+
+    `wait()` bloque jusqu'à la publication d'une écriture plus récente : un
+    shard s'en sert pour servir les écritures aux workers HTTP, dont
+    `shards.ShardEventBus` les publie à ses propres abonnés.
+    """
+
+    def __init__(self, store, book, queue_size=1000, replay_limit=1000):
+        self.store = store
+        self.book = book
+        self.queue_size = queue_size
+        self.replay_limit = replay_limit
+        self.published = 0
+        self.overflows = 0
+        self._subscribers = {}
+        self._lock = threading.Lock()
+        self._advanced = threading.Condition(self._lock)
+        if store is None:
+            self.last_id = 0
+            return
+        with store.lock:
+            self.last_id = len(store.transactions)
+        store.add_commit_listener(self._on_commit)
+
+    def subscriber_count(self):
+        with self._lock:
+            return sum(len(subs) for subs in self._subscribers.values())
+
+    def subscribe(self, username, did):
+        subscription = _Subscription(username, did, asyncio.get_running_loop(), self.queue_size)
+        with self._lock:
+            self._subscribers.setdefault(username, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subs = self._subscribers.get(subscription.username)
+            if subs is not None:
+                subs.discard(subscription)
+                if not subs:
+                    del self._subscribers[subscription.username]
+
+    # Thread d'écriture du store
+    def _on_commit(self, commits):
+        self.publish([(record["entry"], None) for records in commits for record in records
+                      if record["op"] == storage.APPEND_LEDGER])
+
+    def publish(self, items):
+        """Remet les écritures [(écriture, soldes par DID ou None)] aux abonnés concernés.
+
+        Sans soldes joints, ceux du store sont lus au moment de l'envoi ; avec,
+        seuls les abonnés dont le DID y figure reçoivent l'écriture.
+        """
+        deliveries = {}
+        with self._lock:
+            for entry, balances in items:
+                for username, did in parties(entry):
+                    for subscription in self._subscribers.get(username, ()):
+                        if did not in (None, subscription.did):
+                            continue
+                        if balances is not None and subscription.did not in balances:
+                            continue
+                        fields = balances[subscription.did] if balances is not None else None
+                        deliveries.setdefault(subscription.loop, []).append((subscription, (entry, fields)))
+            if items:
+                self.last_id = max(self.last_id, items[-1][0]["id"])
+                self._advanced.notify_all()
+        for loop, batch in deliveries.items():
+            loop.call_soon_threadsafe(self._deliver, batch)
+
+    def wait(self, after_id, timeout):
+        """Attend (au plus `timeout` s) une écriture publiée d'id > `after_id` ; renvoie le dernier id publié."""
+        with self._advanced:
+            self._advanced.wait_for(lambda: self.last_id > after_id, timeout)
+            return self.last_id
+
+    def _deliver(self, items):
+        for subscription, item in items:
+            if subscription.overflow:
+                continue
+            if subscription.queue.qsize() >= self.queue_size:
+                # Dernière place réservée au marqueur : rien de déjà compté n'est jeté
+                subscription.overflow = True
+                subscription.queue.put_nowait(None)
+                self.overflows += 1
+                continue
+            subscription.queue.put_nowait(item)
+            self.published += 1
+
+    def balances(self, username, did):
+        """Soldes du compte au format des enregistrements ({} s'il n'existe plus)."""
+        with self.store.lock:
+            user = self.store.users.get(username)
+            return self.store.balances.as_fields(username) if user is not None and user["did"] == did else {}
+
+    def replay(self, did, after_id, limit):
+        """Écritures déjà publiées (donc durables) d'id > `after_id` : [(écriture, None)]."""
+        return [(e, None) for e in self.book.since(did, after_id, limit) if e["id"] <= self.last_id]
+
+    async def _replay(self, subscription, after_id):
+        return self.replay(subscription.did, after_id, self.replay_limit + 1)
+
+    def _event(self, subscription, entry, balances=None):
+        if balances is None:
+            balances = self.balances(subscription.username, subscription.did)
+        return format_event(entry["id"], entry["type"], {"entry": entry, **balances})
+
+    async def stream(self, subscription, last_event_id=None):
+        """Générateur SSE : rattrapage éventuel, puis événements en direct."""
+        try:
+            sent = last_event_id or 0
+            if last_event_id is not None:
+                # Rattrapage borné aux écritures déjà publiées (donc durables)
+                missed = await self._replay(subscription, last_event_id)
+                if len(missed) > self.replay_limit:
+                    yield format_event(None, RESET, {"detail": "Trop d'événements manqués, rechargez /me/."})
+                    missed = []
+                for entry, balances in missed:
+                    yield self._event(subscription, entry, balances)
+                    sent = entry["id"]
+            yield ": connecté\n\n"
+
+            while True:
+                try:
+                    item = await asyncio.wait_for(subscription.queue.get(), HEARTBEAT)
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+                if item is None:
+                    return  # File débordée : le client se reconnecte avec Last-Event-ID
+                entry, balances = item
+                if entry["id"] <= sent:
+                    continue
+                yield self._event(subscription, entry, balances)
+                sent = entry["id"]
+        finally:
+            self.unsubscribe(subscription)
@@ -0,0 +1,105 @@
+import os
+import asyncio
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+# 🔐 Paramètres bcrypt (par déploiement)
+BCRYPT_ROUNDS = int(os.getenv("TRANSFERZ_BCRYPT_ROUNDS", "12"))
+HASH_WORKERS = int(os.getenv("TRANSFERZ_HASH_WORKERS", str(os.cpu_count() or 1)))
+HASH_MAX_PENDING = int(os.getenv("TRANSFERZ_HASH_MAX_PENDING", "64"))
+
+_pwd_context = None
+
+
+def pwd_context():
+    """Contexte passlib créé au premier usage : passlib n'est importé que par les workers bcrypt."""
+    global _pwd_context
+    if _pwd_context is None:
+        from passlib.context import CryptContext
+        _pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+    return _pwd_context
+
+
+def hash_password(password):
+    return pwd_context().hash(password)
+
+
+def verify_password(plain_password, hashed_password):
+    try:
+        return pwd_context().verify(plain_password, hashed_password)
+    except ValueError:
+        # Hash non reconnu (ex. comptes admin simulés "hashed_...")
+        return False
+
+
+class HashPoolSaturated(Exception):
+    pass
+
+
+# 🏊 Pool de processus dédié à bcrypt
+class PasswordHasher:
+    """Exécute bcrypt dans un pool de processus, hors du GIL du serveur.
+
+    Au plus `max_pending` calculs sont acceptés à la fois (en cours + en
+    attente) ; au-delà, `HashPoolSaturated` est levée immédiatement pour
+    que la route réponde 503 au lieu d'empiler les requêtes.
+    """
+
+    def __init__(self, workers=HASH_WORKERS, max_pending=HASH_MAX_PENDING):
+        self.workers = workers
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._pool = None
+        self._pool_lock = threading.Lock()
+
+    def _get_pool(self):
+        if self._pool is None:
+            with self._pool_lock:
+                if self._pool is None:
+                    # spawn : les workers ne récupèrent pas les threads du serveur
+                    self._pool = ProcessPoolExecutor(max_workers=self.workers,
+                                                     mp_context=multiprocessing.get_context("spawn"))
+        return self._pool
+
+    async def _run(self, executor, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            raise HashPoolSaturated()
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(executor, fn, *args)
+        finally:
+            self._slots.release()
+
+    async def hash(self, password):
+        return await self._run(self._get_pool(), hash_password, password)
+
+    async def verify(self, plain_password, hashed_password):
+        return await self._run(self._get_pool(), verify_password, plain_password, hashed_password)
+
+    async def map(self, fn, items, concurrency=None):
+        """Applique `fn` à chaque élément sur le pool, dans l'ordre des éléments.
+
+        Chaque élément prend un créneau de la file, comme une requête, et au
+        plus `concurrency` (défaut : un par worker) sont soumis à la fois :
+        une connexion n'attend derrière un import qu'au plus un calcul par
+        worker. Quand la file est pleine, l'élément attend un créneau libre
+        au lieu d'échouer.
+        """
+        pool = self._get_pool()
+        loop = asyncio.get_running_loop()
+        limit = asyncio.Semaphore(concurrency or self.workers)
+
+        async def run_one(item):
+            async with limit:
+                while not self._slots.acquire(blocking=False):
+                    await asyncio.sleep(0.01)
+                try:
+                    return await loop.run_in_executor(pool, fn, item)
+                finally:
+                    self._slots.release()
+
+        return await asyncio.gather(*(run_one(item) for item in items))
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,125 @@
+import os
+import time
+import binascii
+import logging
+import threading
+from collections import deque
+
+logger = logging.getLogger("transferz.keypool")
+
+
+def generate_keypair():
+    # Import au premier appel (thread de remplissage) : eth_keys coûte ~0,2 s au démarrage
+    from eth_keys import keys
+
+    private_key = keys.PrivateKey(os.urandom(32))
+    address = private_key.public_key.to_checksum_address()  # Adresse blockchain
+    return binascii.hexlify(private_key.to_bytes()).decode(), address
+
+
+# 🗝️ Réserve de paires (clé privée, adresse) générées à l'avance
+class KeyPairPool:
+    """Paires secp256k1 pré-générées par un thread de fond.
+
+    Quand la réserve descend sous `low`, le thread la remplit jusqu'à `high`.
+    `pop()` ne bloque jamais : réserve vide -> génération dans la requête.
+    Après un échec de génération, le thread attend `retry_min` s avant de
+    réessayer, puis double l'attente à chaque échec (au plus `retry_max` s).
+    """
+
+    def __init__(self, low=32, high=256, generate=generate_keypair, retry_min=0.1, retry_max=30.0):
+        self.low = low
+        self.high = high
+        self.retry_min = retry_min
+        self.retry_max = retry_max
+        self._generate = generate
+        self._keys = deque()
+        self._cond = threading.Condition()
+        self._closed = False
+
+        self.generated = 0
+        self.served_from_pool = 0
+        self.served_inline = 0
+        self.refills = 0
+        self.failures = 0
+        self.last_refill_rate = 0.0
+
+        self._thread = threading.Thread(target=self._refill_loop, name="keypair-pool", daemon=True)
+        self._thread.start()
+
+    def _refill_loop(self):
+        backoff = 0.0
+        while True:
+            with self._cond:
+                if backoff:
+                    # pop() notifie tant que la réserve est basse : seul close() écourte l'attente
+                    self._cond.wait_for(lambda: self._closed, backoff)
+                while len(self._keys) >= self.low and not self._closed:
+                    self._cond.wait()
+                if self._closed:
+                    return
+
+            start = time.perf_counter()
+            produced = 0
+            failed = False
+            while len(self._keys) < self.high and not self._closed:
+                try:
+                    self._keys.append(self._generate())
+                except Exception as e:
+                    failed = True
+                    self.failures += 1
+                    backoff = min(backoff * 2, self.retry_max) if backoff else self.retry_min
+                    logger.error("🚨 Erreur de génération de clé (nouvel essai dans %.1f s) : %s", backoff, e)
+                    break
+                produced += 1
+            if not failed:
+                backoff = 0.0
+            elapsed = time.perf_counter() - start
+
+            self.generated += produced
+            self.refills += 1
+            if produced and elapsed > 0:
+                self.last_refill_rate = produced / elapsed
+
+    def pop(self):
+        try:
+            pair = self._keys.popleft()
+            self.served_from_pool += 1
+        except IndexError:
+            pair = None
+
+        if len(self._keys) < self.low:
+            with self._cond:
+                self._cond.notify()
+
+        if pair is None:
+            self.served_inline += 1
+            pair = self._generate()
+        return pair
+
+    def wait_for(self, depth, timeout=None):
+        """Attend que la réserve contienne `depth` paires (chauffe au démarrage) ; False si délai dépassé."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while len(self._keys) < depth:
+            if deadline is not None and time.monotonic() > deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def stats(self):
+        return {
+            "depth": len(self._keys),
+            "low_watermark": self.low,
+            "high_watermark": self.high,
+            "generated": self.generated,
+            "served_from_pool": self.served_from_pool,
+            "served_inline": self.served_inline,
+            "refills": self.refills,
+            "failures": self.failures,
+            "last_refill_rate_per_s": round(self.last_refill_rate, 1),
+        }
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
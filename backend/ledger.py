@@ -0,0 +1,136 @@
+from bisect import bisect_left, bisect_right
+
+import storage
+from balances import CURRENCIES, FCFA, STABLECOIN, to_minor
+
+# 🧾 Types d'écritures
+DEPOSIT = "deposit"
+TRANSFER = "transfer"
+CONVERSION = "conversion"
+ADMIN_BALANCE = "admin_balance"
+WITHDRAWAL = "withdrawal"
+ENTRY_TYPES = (DEPOSIT, TRANSFER, CONVERSION, ADMIN_BALANCE, WITHDRAWAL)
+
+
+def entry(entry_type, **fields):
+    """Enregistrement du journal qui ajoute une écriture immuable au grand livre.
+
+    Les comptes concernés sont `account` (dépôt, conversion, édition admin, retrait)
+    ou `sender` / `receiver` (transfert).
+    """
+    return storage.append_ledger({"type": entry_type, **fields})
+
+
+def accounts_of(entry):
+    return {entry.get(key) for key in storage.LEDGER_ROLES} - {None}
+
+
+def parties(entry):
+    """Comptes concernés : [(username, DID)], le DID valant None pour une écriture
+    journalisée avant qu'il n'y soit ajouté."""
+    return [(entry[role], entry.get(f"{role}_did")) for role in storage.LEDGER_ROLES if entry.get(role)]
+
+
+LEDGER_CURRENCIES = {"FCFA": FCFA, "USDT": STABLECOIN}
+
+
+def balance_deltas(entry):
+    """Effet d'une écriture sur les soldes : [(username, DID, devise, delta en unités entières)].
+
+    Dépôt et transfert portent `currency` / `amount` ; conversion, édition
+    admin et retrait portent `delta_fcfa` / `delta_stablecoin` sur `account`.
+    """
+    if entry["type"] == DEPOSIT:
+        currency = LEDGER_CURRENCIES[entry["currency"]]
+        return [(entry["account"], entry.get("account_did"), currency, to_minor(currency, entry["amount"]))]
+    if entry["type"] == TRANSFER:
+        currency = LEDGER_CURRENCIES[entry["currency"]]
+        amount = to_minor(currency, entry["amount"])
+        return [(entry["sender"], entry.get("sender_did"), currency, -amount),
+                (entry["receiver"], entry.get("receiver_did"), currency, amount)]
+    return [(entry["account"], entry.get("account_did"), c, to_minor(c, entry.get(f"delta_{c}", 0)))
+            for c in CURRENCIES]
+
+
+class _Postings:
+    __slots__ = ("ids", "ts")
+
+    def __init__(self):
+        self.ids = []
+        self.ts = []
+
+
+# 📚 Grand livre indexé par compte
+class Ledger:
+    """Index par compte (et par compte + type) des écritures du store.
+
+    Un compte est désigné par son DID : un nom d'utilisateur supprimé puis
+    réinscrit n'hérite pas de l'historique de l'ancien compte. Les écritures
+    antérieures à l'ajout des DID sont rattachées au compte qui porte le nom
+    au démarrage.
+
+    Les écritures sont stockées dans `store.transactions` (l'id d'une écriture
+    est sa position + 1) ; chaque index garde les ids et horodatages dans
+    l'ordre des commits, donc une page se lit par bisection sans dépendre de
+    la taille totale du grand livre.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self._postings = {}
+        with store.lock:
+            for e in store.transactions:
+                self._index(e)
+            store.add_listener(self._on_record)
+
+    def _on_record(self, record):
+        if record["op"] == storage.APPEND_LEDGER:
+            self._index(record["entry"])
+
+    def _index(self, e):
+        for username, did in parties(e):
+            did = did or self.store.users.get(username, {}).get("did")
+            if did is None:
+                continue
+            for key in ((did, None), (did, e["type"])):
+                postings = self._postings.get(key)
+                if postings is None:
+                    postings = self._postings[key] = _Postings()
+                postings.ids.append(e["id"])
+                postings.ts.append(e["ts"])
+
+    def history(self, did, limit=50, cursor=None, entry_type=None, since=None, until=None):
+        """Page d'historique, de la plus récente à la plus ancienne.
+
+        `cursor` est l'id de la dernière écriture de la page précédente ;
+        `since` / `until` sont des timestamps (secondes). Renvoie
+        `(écritures, next_cursor)`, `next_cursor` valant None en fin d'historique.
+        """
+        postings = self._postings.get((did, entry_type))
+        if postings is None:
+            return [], None
+
+        ids, ts = postings.ids, postings.ts
+        hi = min(len(ids), len(ts))
+        if cursor is not None:
+            hi = bisect_left(ids, cursor, 0, hi)
+        if until is not None:
+            hi = bisect_right(ts, until, 0, hi)
+        lo = bisect_left(ts, since, 0, hi) if since is not None else 0
+
+        start = max(lo, hi - limit)
+        page_ids = ids[start:hi][::-1]
+        transactions = self.store.transactions
+        items = [transactions[i - 1] for i in page_ids]
+        next_cursor = page_ids[-1] if page_ids and start > lo else None
+        return items, next_cursor
+
+    def since(self, did, after_id, limit=500):
+        """Écritures d'id > `after_id`, de la plus ancienne à la plus récente (reprise d'un flux)."""
+        postings = self._postings.get((did, None))
+        if postings is None:
+            return []
+        ids = postings.ids
+        start = bisect_right(ids, after_id, 0, min(len(ids), len(postings.ts)))
+        transactions = self.store.transactions
+        return [transactions[i - 1] for i in ids[start:start + limit]]
@@ -0,0 +1,37 @@
+import os
+import threading
+from contextlib import contextmanager
+
+# Nombre de verrous partagés par tous les comptes (TRANSFERZ_LOCK_STRIPES)
+LOCK_STRIPES = int(os.getenv("TRANSFERZ_LOCK_STRIPES", "4096"))
+
+
+# 🔒 Verrous par compte, pris dans un ordre déterministe
+class TransactionManager:
+    """Verrous par compte (clé = DID), répartis sur `stripes` verrous fixes.
+
+    Une clé est associée au verrou `hash(clé) % stripes` : la mémoire ne
+    dépend pas du nombre de clés vues, y compris des DID inexistants reçus
+    dans une requête. `locked()` trie les numéros de verrou avant de les
+    prendre : deux transferts qui touchent les mêmes comptes les
+    verrouillent toujours dans le même ordre, donc pas d'interblocage. Deux
+    transferts sur des comptes disjoints ne s'attendent que si leurs clés
+    tombent sur le même verrou. Les verrous ne sont pas réentrants : pas
+    d'appel imbriqué à `locked()` dans un même thread.
+    """
+
+    def __init__(self, stripes=LOCK_STRIPES):
+        self._locks = [threading.Lock() for _ in range(stripes)]
+
+    @contextmanager
+    def locked(self, *keys):
+        acquired = []
+        try:
+            for index in sorted({hash(key) % len(self._locks) for key in keys}):
+                lock = self._locks[index]
+                lock.acquire()
+                acquired.append(lock)
+            yield
+        finally:
+            for lock in reversed(acquired):
+                lock.release()
@@ -0,0 +1,67 @@
+import os
+import json
+import queue
+import atexit
+import random
+import logging
+import datetime
+from logging.handlers import QueueHandler, QueueListener
+
+# 📝 Journalisation non bloquante
+LOG_LEVEL = os.getenv("TRANSFERZ_LOG_LEVEL", "INFO").upper()
+DEBUG_SAMPLE_RATE = float(os.getenv("TRANSFERZ_LOG_DEBUG_SAMPLE_RATE", "0.01"))
+
+_STANDARD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    """Une ligne JSON par événement ; les champs passés via `extra=` sont conservés."""
+
+    def format(self, record):
+        event = {
+            "ts": datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _STANDARD_ATTRS:
+                event[key] = value
+        if record.exc_info:
+            event["exc"] = self.formatException(record.exc_info)
+        return json.dumps(event, ensure_ascii=False, default=str)
+
+
+class DebugSampler(logging.Filter):
+    """Ne garde qu'une fraction des événements DEBUG (volumineux sur le chemin chaud)."""
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        return record.levelno > logging.DEBUG or random.random() < self.rate
+
+
+class _LazyQueueHandler(QueueHandler):
+    # Le QueueHandler standard formate le message dans le thread appelant ;
+    # ici le formatage se fait dans le thread du listener.
+    def prepare(self, record):
+        return record
+
+
+def setup_logging(level=LOG_LEVEL, debug_sample_rate=DEBUG_SAMPLE_RATE):
+    log_queue = queue.SimpleQueue()
+    output = logging.StreamHandler()
+    output.setFormatter(JsonFormatter())
+    listener = QueueListener(log_queue, output)
+
+    handler = _LazyQueueHandler(log_queue)
+    handler.addFilter(DebugSampler(debug_sample_rate))
+
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(level)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
@@ -1,82 +1,204 @@
 import os
 import json
+import asyncio
+import logging
+import atexit
 import uuid
+import time
 import datetime
-import eth_keys
-from eth_keys import keys
-from eth_utils import encode_hex
-from fastapi import FastAPI, HTTPException, Depends
+import threading
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Depends, Header, Query, Request, Response
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
+from fastapi.exceptions import RequestValidationError
 from fastapi.security import OAuth2PasswordBearer
 from pydantic import BaseModel
-from passlib.context import CryptContext
+from typing import List, Literal, Optional
 import jwt
 from fastapi import Body
-
-app = FastAPI()
-
-# 🔑 Configuration Sécurité
-SECRET_KEY = "your_secret_key"
+import storage
+from locking import TransactionManager
+import ledger
+from accounts import AccountService, AccountError, Caller, USERNAME_TAKEN, USER_EXISTS, PHONE_TAKEN
+from operators import simulated_operators
+from balances import STABLECOIN
+import amounts
+from amounts import FcfaAmount, StablecoinAmount, FcfaBalance, StablecoinBalance
+import bulk_import
+from hashing import PasswordHasher, HashPoolSaturated
+from auth_cache import TokenCache
+from keypool import KeyPairPool
+import metrics
+from metrics import MetricsMiddleware, phase
+from ratelimit import RateLimitMiddleware, limiter_from_env
+import profiling
+from profiling import ProfilingMiddleware, ProfiledRoute, SlowRequestLog
+from readiness import Readiness, ReadinessMiddleware, READY
+from logging_setup import setup_logging
+
+# 📝 Logs JSON via une file et un thread dédié (TRANSFERZ_LOG_LEVEL, défaut INFO)
+setup_logging()
+logger = logging.getLogger("transferz")
+
+# 🚀 Le port s'ouvre sans attendre : état chargé puis chauffe en arrière-plan, suivis par /ready
+@asynccontextmanager
+async def lifespan(app):
+    threading.Thread(target=_start_in_background, name="startup", daemon=True).start()
+    yield
+
+app = FastAPI(lifespan=lifespan)
+
+# ❌ 422 : montants hors limites ou non finis (Infinity, NaN renvoyés en texte)
+app.add_exception_handler(RequestValidationError, amounts.validation_error)
+
+# 🚫 Refus des opérations sur les comptes (accounts.AccountService, ou un shard)
+@app.exception_handler(AccountError)
+async def account_error(request: Request, exc: AccountError):
+    return JSONResponse(status_code=exc.status, content={"detail": exc.detail})
+
+# 🔬 Profilage à la demande : fraction TRANSFERZ_PROFILE_SAMPLE_RATE des requêtes, ou en-tête
+# X-Transferz-Profile égal à TRANSFERZ_PROFILE_TOKEN ; les N plus lentes par route sont gardées
+slow_requests = SlowRequestLog()
+if profiling.ENABLED:
+    app.router.route_class = ProfiledRoute
+    app.add_middleware(ProfilingMiddleware, log=slow_requests)
+
+# 🚦 Budgets par classe de route, par IP et par utilisateur (TRANSFERZ_RATE_LIMIT_<CLASSE>_<IP|USER>="jetons/s:réserve")
+ROUTE_CLASSES = {
+    "/login/": "auth", "/register/": "auth",
+    "/admin/add_user/": "admin", "/admin/bulk_import/": "admin",
+    "/transfer/": "write", "/transfer/batch/": "write", "/deposit/": "write", "/user/add_phone/": "write",
+}
+RATE_LIMITS = {
+    "auth": {"ip": limiter_from_env("auth_ip", "0.5:10")},
+    "admin": {"ip": limiter_from_env("admin_ip", "2:20")},
+    "write": {"ip": limiter_from_env("write_ip", "50:100"), "user": limiter_from_env("write_user", "10:30")},
+    "read": {"ip": limiter_from_env("read_ip", "100:200"), "user": limiter_from_env("read_user", "50:100")},
+}
+
+def classify_route(path):
+    return ROUTE_CLASSES.get(path, None if path in ("/metrics", "/ready") else "read")
+
+if os.getenv("TRANSFERZ_RATE_LIMIT", "1") == "1":
+    # Ajouté avant MetricsMiddleware : les 429 sont aussi comptés dans les métriques HTTP
+    app.add_middleware(RateLimitMiddleware, limits=RATE_LIMITS, classify=classify_route,
+                       identify=lambda token: _rate_limit_user(token),
+                       trust_proxy=int(os.getenv("TRANSFERZ_TRUST_PROXY", "0")))
+readiness = Readiness(checks=("store", "keypool", "bcrypt"))
+app.add_middleware(ReadinessMiddleware, readiness=readiness)
+app.add_middleware(MetricsMiddleware)
+
+
+# 🔑 Configuration Sécurité (TRANSFERZ_SECRET_KEY ; la valeur par défaut ne convient qu'au développement)
+SECRET_KEY = os.getenv("TRANSFERZ_SECRET_KEY", "your_secret_key")
 ALGORITHM = "HS256"
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
-
-# 📂 Gestion de la base de données
-DB_PATH = "/tmp/database.json"
-if not os.path.exists(DB_PATH):
-    with open(DB_PATH, "w") as f:
-        json.dump({"users": {}, "transactions": []}, f, indent=4)
-def load_db():
+oauth2_optional = OAuth2PasswordBearer(tokenUrl="login", auto_error=False)
+token_cache = TokenCache(max_size=int(os.getenv("TRANSFERZ_TOKEN_CACHE_SIZE", "10000")))
+
+# 🧩 TRANSFERZ_SHARDS=N : comptes servis par N processus shards (scripts/run_sharded.py), 0 : store local
+SHARDS = int(os.getenv("TRANSFERZ_SHARDS", "0"))
+
+# 📂 Services créés par start(), pas à l'import : aucun fichier n'est lu avant l'ouverture du port.
+# `accounts` est un AccountService sur `store`, ou un shards.ShardedAccounts (`store` reste alors None).
+store = accounts = keypool = None
+
+# 🔒 Verrous par compte (DID) pour les mises à jour concurrentes
+txm = TransactionManager()
+
+# 🔐 bcrypt dans un pool de processus borné (TRANSFERZ_HASH_WORKERS, TRANSFERZ_BCRYPT_ROUNDS)
+hasher = PasswordHasher()
+atexit.register(hasher.shutdown)
+
+_start_lock = threading.Lock()
+
+def start(warm_up=True):
+    """Charge l'état et démarre les services (idempotent), puis chauffe si `warm_up`.
+
+    Appelé en arrière-plan par le lifespan ; les scripts qui importent `main`
+    l'appellent directement.
+    """
+    global store, accounts, keypool
+    with _start_lock:
+        if readiness.serving.is_set():
+            return
+        try:
+            # 📂 Gestion de la base de données (TRANSFERZ_STORAGE=json ou sqlite), ou shards déjà démarrés
+            with readiness.step("store"):
+                if SHARDS:
+                    import shards
+
+                    router = shards.ShardRouter(SHARDS)
+                    router.stats()  # Shards joignables, sinon ShardError (503)
+                    accounts = shards.ShardedAccounts(router)
+                    atexit.register(accounts.close)
+                else:
+                    store = storage.open_store()
+                    atexit.register(store.close)
+
+            with readiness.step("indexes"):
+                if store is not None:
+                    # 🧾 Grand livre, flux /events/, limites de vélocité, rapprochement
+                    accounts = AccountService(store, txm)
+                    atexit.register(accounts.close)
+
+            with readiness.step("services"):
+                if store is not None:
+                    # 📲 Dépôts Mobile Money réglés en arrière-plan (simulateurs MTN / Orange / Moov / Wave)
+                    accounts.start_deposits(simulated_operators())
+                # 🎯 Paires de clés pré-générées en arrière-plan, génération directe si la réserve est vide
+                keypool = KeyPairPool(
+                    low=int(os.getenv("TRANSFERZ_KEYPOOL_LOW", "32")),
+                    high=int(os.getenv("TRANSFERZ_KEYPOOL_HIGH", "256")),
+                )
+                atexit.register(keypool.close)
+        except Exception as e:
+            readiness.fail(e)
+            raise
+        readiness.serving.set()
+        readiness.check("store")
+
+    if warm_up:
+        _warm_up()
+
+# 🔥 Chauffe : réserve de clés remplie jusqu'au seuil bas, un hachage bcrypt réel dans le pool
+def _warm_up():
     try:
-        db_path = "/tmp/database.json"
-        if not os.path.exists(db_path):
-            logging.debug("🚨 `database.json` introuvable, création d’un nouveau fichier.")
-            with open(db_path, "w") as f:
-                json.dump({"users": {}, "transactions": []}, f, indent=4)
-
-        logging.debug(f"📖 Chargement de `database.json`...")
-        with open(db_path, "r") as f:
-            return json.load(f)
+        with readiness.step("keypool"):
+            if not keypool.wait_for(keypool.low, timeout=float(os.getenv("TRANSFERZ_WARMUP_TIMEOUT", "60"))):
+                raise TimeoutError("réserve de clés vide")
+        readiness.check("keypool")
+        with readiness.step("bcrypt"):
+            asyncio.run(hasher.hash("warm-up"))
+        readiness.check("bcrypt")
     except Exception as e:
-        logging.error(f"❌ Erreur lors du chargement de la base de données : {str(e)}")
-        raise
-
-
+        readiness.fail(e)
 
-def save_db(data):
+def _start_in_background():
     try:
-        db_path = "/tmp/database.json"
-        logging.debug(f"💾 Sauvegarde des données dans `{db_path}`...")
-        with open(db_path, "w") as f:
-            json.dump(data, f, indent=4)
-        logging.debug("✅ Sauvegarde terminée !")
-    except Exception as e:
-        logging.error(f"❌ Erreur lors de la sauvegarde : {str(e)}")
-        raise
+        start()
+    except Exception:
+        pass  # Déjà consigné par readiness.fail ; /ready reste en échec
 
 
 # 🎯 Génération du DID et du compte Blockchain
-import binascii
-
 def generate_did():
     try:
-        logging.debug("🔧 Génération du DID...")
-
-        # Génération de la clé privée Ethereum
-        private_key = keys.PrivateKey(os.urandom(32))
-        public_key = private_key.public_key
-        address = public_key.to_checksum_address()  # Adresse blockchain
+        logger.debug("🔧 Génération du DID...")
 
-        # Encodage correct de la clé privée
-        private_key_hex = binascii.hexlify(private_key.to_bytes()).decode()
+        # Clé privée Ethereum (hex) et adresse blockchain
+        with phase("generate_did"):
+            private_key_hex, address = keypool.pop()
 
         # Génération du DID
         did = f"did:transferz:{uuid.uuid4()}"
 
-        logging.debug(f"✅ DID généré : {did}, Adresse Blockchain : {address}")
+        logger.debug("✅ DID généré : %s", did)
         return did, private_key_hex, address
 
     except Exception as e:
-        logging.error(f"🚨 Erreur dans `generate_did()`: {str(e)}")
+        logger.error("🚨 Erreur dans `generate_did()`: %s", e)
         raise
 
 
@@ -94,73 +216,106 @@ class AddPhoneRequest(BaseModel):
 
 class DepositRequest(BaseModel):
     phone_number: str
-    amount: float
+    amount: FcfaAmount
+    operator: str = "MTN"
+    idempotency_key: Optional[str] = None
 
 class TransferRequest(BaseModel):
     receiver_did: str
-    amount: float
+    amount: StablecoinAmount
+
+class BatchTransferRequest(BaseModel):
+    transfers: List[TransferRequest]
+    mode: Literal["atomic", "best_effort"] = "atomic"
 
 # 🔑 Fonctions d'authentification
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+async def _run_hasher(fn, *args):
+    try:
+        return await fn(*args)
+    except HashPoolSaturated:
+        raise HTTPException(status_code=503, detail="Service surchargé, réessayez dans un instant.",
+                            headers={"Retry-After": "1"})
+
+async def verify_password(plain_password, hashed_password):
+    with phase("bcrypt_verify"):
+        return await _run_hasher(hasher.verify, plain_password, hashed_password)
 
-def get_password_hash(password):
-    return pwd_context.hash(password)
+async def get_password_hash(password):
+    with phase("bcrypt_hash"):
+        return await _run_hasher(hasher.hash, password)
 
 def create_access_token(data: dict):
-    expire = datetime.datetime.utcnow() + datetime.timedelta(days=30)
-    data.update({"exp": expire})
+    now = datetime.datetime.utcnow()
+    expire = now + datetime.timedelta(days=30)
+    # iat en secondes fractionnaires, comme TokenCache.revoke() : tronqué à la seconde, un token
+    # émis juste après une révocation serait refusé
+    data.update({"exp": expire, "iat": time.time()})
     return jwt.encode(data, SECRET_KEY, algorithm=ALGORITHM)
 
 def get_current_user(token: str = Depends(oauth2_scheme)):
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username = payload.get("sub")
-        if username is None:
+    # Les tokens déjà vérifiés sont servis depuis le cache jusqu'à leur expiration
+    payload = token_cache.get(token)
+    if payload is None:
+        try:
+            with phase("jwt_decode"):
+                payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        except jwt.ExpiredSignatureError:
+            raise HTTPException(status_code=401, detail="Token expired")
+        except jwt.PyJWTError:
             raise HTTPException(status_code=401, detail="Invalid authentication token")
-        return username
-    except jwt.ExpiredSignatureError:
-        raise HTTPException(status_code=401, detail="Token expired")
-    except jwt.PyJWTError:
+        token_cache.put(token, payload)
+
+    username = payload.get("sub")
+    if username is None:
         raise HTTPException(status_code=401, detail="Invalid authentication token")
+    if token_cache.is_revoked(payload):
+        raise HTTPException(status_code=401, detail="Token revoked")
+    return Caller(username, payload.get("did"))
 
+def get_optional_user(token: Optional[str] = Depends(oauth2_optional)):
+    return get_current_user(token) if token else None
 
-# 📌 Inscription avec génération automatique de DID
-import logging
-logging.basicConfig(level=logging.DEBUG)
+def _rate_limit_user(token):
+    try:
+        return get_current_user(token).username
+    except HTTPException:
+        return None
 
-@app.post("/register/")
-def register(user: UserRegister):
-    logging.debug("📌 Route /register/ appelée")
-    
-    db = load_db()
-    if user.username in db["users"]:
-        raise HTTPException(status_code=400, detail="Nom d'utilisateur déjà enregistré")
 
-    did, private_key, blockchain_address = generate_did()
+# 📌 Inscription avec génération automatique de DID
 
-    db["users"][user.username] = {
-        "password": get_password_hash(user.password),
+def _create_account(username, hashed_pw):
+    did, private_key, blockchain_address = generate_did()
+    accounts.create_account(username, {
+        "password": hashed_pw,
         "did": did,
         "private_key": private_key,
         "blockchain_address": blockchain_address,
         "phone_numbers": [],
         "balance_fcfa": 0,
         "balance_stablecoin": 0
-    }
-    save_db(db)
-
+    })
     return {"message": "Utilisateur créé avec succès", "did": did, "blockchain_address": blockchain_address}
 
+@app.post("/register/")
+async def register(user: UserRegister):
+    logger.debug("📌 Route /register/ appelée")
+
+    if await run_in_threadpool(accounts.exists, user.username):
+        raise HTTPException(status_code=400, detail="Nom d'utilisateur déjà enregistré")
+
+    hashed_pw = await get_password_hash(user.password)
+    return await run_in_threadpool(_create_account, user.username, hashed_pw)
+
 # 🔑 Connexion de l’utilisateur
 @app.post("/login/")
-def login(user: UserLogin):
-    db = load_db()
-
-    if user.username not in db["users"] or not verify_password(user.password, db["users"][user.username]["password"]):
+async def login(user: UserLogin):
+    credentials = await run_in_threadpool(accounts.credentials, user.username)
+    if credentials is None or not await verify_password(user.password, credentials[1]):
         raise HTTPException(status_code=401, detail="Identifiants invalides")
 
-    access_token = create_access_token(data={"sub": user.username})
+    # Le DID lie le token à ce compte : il ne vaut rien pour un compte recréé sous le même nom
+    access_token = create_access_token(data={"sub": user.username, "did": credentials[0]})
     return {"access_token": access_token}
 
 # 🧾 Schéma d'entrée pour ajouter un utilisateur
@@ -168,132 +323,369 @@ class AdminUser(BaseModel):
     username: str
     password: str
     phone_number: str
-    balance_fcfa: int = 0
-    balance_stablecoin: float = 0.0
+    balance_fcfa: FcfaBalance = 0
+    balance_stablecoin: StablecoinBalance = 0.0
 
 # 🛠 Route d'ajout manuel (admin)
 @app.post("/admin/add_user/")
 def admin_add_user(user: AdminUser):
-    db = load_db()
-
-    if user.username in db["users"]:
-        raise HTTPException(status_code=400, detail="Utilisateur déjà existant.")
-
     # Simuler les données blockchain/DID
-    uid = str(uuid4())
+    uid = str(uuid.uuid4())
     did = f"did:transferz:{uid}"
     priv_key = f"privkey_{uid[:6]}"
     address = f"0x{uid[:6]}"
     hashed_pw = f"hashed_{user.password}"  # À remplacer si passlib est utilisé
 
-    db["users"][user.username] = {
-        "password": hashed_pw,
-        "did": did,
-        "private_key": priv_key,
-        "blockchain_address": address,
-        "phone_numbers": [user.phone_number],
-        "balance_fcfa": user.balance_fcfa,
-        "balance_stablecoin": user.balance_stablecoin
-    }
-
-    save_db(db)
+    try:
+        accounts.create_account(user.username, {
+            "password": hashed_pw,
+            "did": did,
+            "private_key": priv_key,
+            "blockchain_address": address,
+            "phone_numbers": [user.phone_number],
+            "balance_fcfa": user.balance_fcfa,
+            "balance_stablecoin": user.balance_stablecoin
+        })
+    except AccountError as e:
+        if e.detail == USERNAME_TAKEN:
+            raise HTTPException(status_code=400, detail=USER_EXISTS)
+        raise
 
     return {"message": "✅ Utilisateur ajouté", "did": did}
 
 
-from fastapi import Body
+# 📥 Import en masse (NDJSON ou CSV en streaming)
+BULK_IMPORT_CHUNK = int(os.getenv("TRANSFERZ_BULK_IMPORT_CHUNK", "1000"))
+
+async def _import_chunk(chunk, report):
+    # Lignes déjà prises par un compte existant écartées avant le hachage
+    conflicts = await run_in_threadpool(accounts.conflicts,
+                                        [(row["username"], row["phone_number"]) for _, row in chunk])
+    rows = []
+    for (number, row), error in zip(chunk, conflicts):
+        if error is not None:
+            report["errors"].append({"row": number, "username": row["username"], "error": error})
+        else:
+            rows.append((number, row))
+    if not rows:
+        return
+
+    prepared = await hasher.map(bulk_import.prepare_account, [row for _, row in rows])
+    # Revérification à l'écriture : une inscription a pu arriver pendant le hachage
+    errors = await run_in_threadpool(accounts.import_accounts, [
+        (number, row["username"], account) for (number, row), account in zip(rows, prepared)])
+    usernames = dict(rows)
+    for number, error in errors:
+        report["errors"].append({"row": number, "username": usernames[number]["username"], "error": error})
+    report["imported"] += len(rows) - len(errors)
+
+@app.post("/admin/bulk_import/")
+async def admin_bulk_import(request: Request, format: Optional[Literal["ndjson", "csv"]] = None):
+    fmt = format or ("csv" if "csv" in request.headers.get("content-type", "") else "ndjson")
+    report = {"imported": 0, "errors": []}
+    seen_usernames = set()
+    seen_phones = set()
+    chunk = []
+
+    async for number, raw, error in bulk_import.iter_rows(request.stream(), fmt):
+        row = None
+        if error is None:
+            row, error = bulk_import.validate_row(raw)
+        if error is None:
+            if row["username"] in seen_usernames:
+                error = USER_EXISTS
+            elif row["phone_number"] in seen_phones:
+                error = PHONE_TAKEN
+        if error is not None:
+            report["errors"].append({"row": number, "username": (raw or {}).get("username"), "error": error})
+            continue
+
+        seen_usernames.add(row["username"])
+        seen_phones.add(row["phone_number"])
+        chunk.append((number, row))
+        if len(chunk) >= BULK_IMPORT_CHUNK:
+            await _import_chunk(chunk, report)
+            chunk = []
+
+    if chunk:
+        await _import_chunk(chunk, report)
+
+    report["errors"].sort(key=lambda e: e["row"])
+    report["failed"] = len(report["errors"])
+    return report
+
 
 @app.post("/admin/delete_user/")
 def delete_user_admin(username: str = Body(...)):
-    db = load_db()
-    if username not in db["users"]:
-        raise HTTPException(status_code=404, detail="Utilisateur introuvable")
-    del db["users"][username]
-    save_db(db)
+    accounts.delete_account(username)
+    token_cache.revoke(username)
     return {"message": "Utilisateur supprimé"}
 
 @app.post("/admin/update_balance/")
 def update_balance_admin(
     username: str = Body(...),
-    balance_fcfa: int = Body(...),
-    balance_stablecoin: float = Body(...)
+    balance_fcfa: int = Body(..., ge=0, le=amounts.MAX_FCFA),
+    balance_stablecoin: float = Body(..., ge=0, le=amounts.MAX_STABLECOIN,
+                                     allow_inf_nan=False)
 ):
-    db = load_db()
-    if username not in db["users"]:
-        raise HTTPException(status_code=404, detail="Utilisateur introuvable")
-    db["users"][username]["balance_fcfa"] = balance_fcfa
-    db["users"][username]["balance_stablecoin"] = balance_stablecoin
-    save_db(db)
+    accounts.set_balances(username, balance_fcfa, balance_stablecoin)
     return {"message": "Solde mis à jour"}
 
+# 📊 Agrégats des soldes (calculés sur la table des soldes, sans boucle sur les comptes)
+@app.get("/admin/balances/")
+def balances_summary(
+    currency: Literal["fcfa", "stablecoin"] = STABLECOIN,
+    top: int = Query(10, ge=0, le=1000),
+    bins: int = Query(10, ge=1, le=1000),
+):
+    return accounts.balances_summary(currency, top, bins)
+
+# 🏎️ Consommation des limites de vélocité d'un compte
+@app.get("/admin/velocity/")
+def velocity_usage(username: str):
+    return {"username": username, "rules": accounts.velocity_usage(username)}
+
+# ⚖️ Écarts entre soldes et grand livre (full=true : audit complet)
+@app.get("/admin/reconciliation/")
+def reconciliation_report(full: bool = False, limit: int = Query(100, ge=1, le=10000)):
+    return accounts.reconciliation(full, limit)
+
+# 🧩 État des shards : comptes, masse, intentions de transfert en suspens
+if SHARDS:
+    @app.get("/admin/shards/")
+    def shard_stats():
+        return accounts.router.stats()
+
+# 📊 Métriques Prometheus
+# Jauges des comptes lues une fois par scrape (en mode shards, un appel à chaque shard)
+account_gauges = metrics.per_scrape(lambda: accounts.gauges())
+metrics.REGISTRY.register(metrics.CallbackMetric(
+    "transferz_keypool_depth", "Paires de clés disponibles dans la réserve",
+    lambda: {(): keypool.stats()["depth"]}))
+metrics.REGISTRY.register(metrics.CallbackMetric(
+    "transferz_keypool_refills_total", "Remplissages de la réserve de clés",
+    lambda: {(): keypool.refills}, kind="counter"))
+metrics.REGISTRY.register(metrics.CallbackMetric(
+    "transferz_keypool_generation_failures_total", "Échecs de génération de clé dans le thread de remplissage",
+    lambda: {(): keypool.failures}, kind="counter"))
+metrics.REGISTRY.register(metrics.CallbackMetric(
+    "transferz_token_cache_lookups_total", "Consultations du cache de tokens",
+    lambda: {("hit",): token_cache.hits, ("miss",): token_cache.misses}, ["result"], kind="counter"))
+metrics.REGISTRY.register(metrics.CallbackMetric(
+    "transferz_total_supply", "Somme des soldes de tous les comptes",
+    lambda: {(c,): v for c, v in account_gauges()["total_supply"].items()}, ["currency"]))
+metrics.REGISTRY.register(metrics.CallbackMetric(
+    "transferz_reconciliation_discrepancies", "Comptes dont le solde diffère du grand livre",
+    lambda: {(): account_gauges()["discrepancies"]}))
+metrics.REGISTRY.register(metrics.CallbackMetric(
+    "transferz_deposit_queue_depth", "Dépôts en attente de règlement",
+    lambda: {(): account_gauges()["deposit_queue_depth"]}))
+metrics.REGISTRY.register(metrics.CallbackMetric(
+    "transferz_deposits_settled_total", "Dépôts réglés par statut",
+    lambda: {(status,): n for status, n in account_gauges()["deposits_settled"].items()}, ["status"], kind="counter"))
+metrics.REGISTRY.register(metrics.CallbackMetric(
+    "transferz_event_subscribers", "Flux /events/ ouverts",
+    lambda: {(): accounts.event_bus.subscriber_count()}))
+metrics.REGISTRY.register(metrics.CallbackMetric(
+    "transferz_events_published_total", "Événements remis aux abonnés",
+    lambda: {(): accounts.event_bus.published}, kind="counter"))
+metrics.REGISTRY.register(metrics.CallbackMetric(
+    "transferz_event_overflows_total", "Flux /events/ fermés sur file pleine (client trop lent)",
+    lambda: {(): accounts.event_bus.overflows}, kind="counter"))
+metrics.REGISTRY.register(metrics.CallbackMetric(
+    "transferz_velocity_tracked_accounts", "Comptes ayant une fenêtre de vélocité active, par règle",
+    lambda: {(rule,): n for rule, n in account_gauges()["velocity_tracked"].items()}, ["rule"]))
+# 🚦 Prêt seulement après chargement de l'état et chauffe (santé Render)
+@app.get("/ready")
+def ready():
+    report = readiness.report()
+    return JSONResponse(status_code=200 if report["status"] == READY else 503, content=report)
+
+@app.get("/metrics")
+def prometheus_metrics():
+    return PlainTextResponse(metrics.REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+# 🔬 Requêtes profilées les plus lentes par route, et export de leur profil ; en-tête
+# X-Transferz-Profile égal à TRANSFERZ_PROFILE_TOKEN exigé (sans jeton configuré : toujours 403)
+def require_profile_token(x_transferz_profile: Optional[str] = Header(None)):
+    if not profiling.token_matches(x_transferz_profile):
+        raise HTTPException(status_code=403, detail="Jeton de profilage invalide.")
+
+@app.get("/admin/profiles/", dependencies=[Depends(require_profile_token)])
+def slowest_requests():
+    return {"enabled": profiling.ENABLED, "sample_rate": profiling.SAMPLE_RATE,
+            "keep_per_route": slow_requests.keep, "routes": slow_requests.slowest()}
+
+@app.get("/admin/profiles/{profile_id}", dependencies=[Depends(require_profile_token)])
+def download_profile(profile_id: int, format: Literal["json", "pstats", "speedscope"] = "json"):
+    profile = slow_requests.get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profil introuvable.")
+    if format == "json":
+        return profile.summary()
+    if profile.stats is None:
+        raise HTTPException(status_code=404, detail="Pas de profil cProfile pour cette requête (profileur occupé).")
+    if format == "pstats":
+        return Response(profiling.to_pstats(profile), media_type="application/octet-stream", headers={
+            "Content-Disposition": f'attachment; filename="transferz-{profile_id}.pstats"'})
+    return JSONResponse(profiling.to_speedscope(profile), headers={
+        "Content-Disposition": f'attachment; filename="transferz-{profile_id}.speedscope.json"'})
+
+@app.get("/admin/keypool/")
+def keypool_stats():
+    return keypool.stats()
+
+@app.get("/admin/token_cache/")
+def token_cache_stats():
+    return token_cache.stats()
+
+
+# 👤 Tableau de bord : profil, DID, soldes, numéros et dernières opérations en un seul appel
+@app.get("/me/")
+def me(user: Caller = Depends(get_current_user), transactions: int = Query(10, ge=0, le=200)):
+    return accounts.profile(user, transactions)
+
 @app.get("/user/phones/")
-def get_user_phones(user: str = Depends(get_current_user)):
-    db = load_db()
-    
-    if user not in db["users"]:
-        raise HTTPException(status_code=404, detail="Utilisateur non trouvé.")
-    
-    logging.debug(f"📞 Numéros enregistrés pour {user} : {db['users'][user]['phone_numbers']}")
-    
-    return db["users"][user]["phone_numbers"]
+def get_user_phones(user: Caller = Depends(get_current_user)):
+    logger.debug("📞 Consultation des numéros", extra={"user": user.username})
+
+    return accounts.phones(user)
 
 
 # 📲 Ajout d’un numéro Mobile Money
 @app.post("/user/add_phone/")
-def add_phone(data: AddPhoneRequest, user: str = Depends(get_current_user)):
-    db = load_db()
-
-    if user not in db["users"]:
-        raise HTTPException(status_code=404, detail="Utilisateur introuvable")
-
-    db["users"][user]["phone_numbers"].append(data.phone_number)
-    save_db(db)
+def add_phone(data: AddPhoneRequest, user: Caller = Depends(get_current_user)):
+    accounts.add_phone(user, data.phone_number)
 
     return {"message": "Numéro ajouté et lié à votre DID"}
 
 # 📌 Récupération des DID utilisateurs pour les transferts
-@app.get("/list_did_users/")
-def list_did_users():
-    db = load_db()
-    return {"users": [user["did"] for user in db["users"].values()]}
-
-# 📲 Dépôt d’argent via Mobile Money
-@app.post("/deposit/")
-def deposit_funds(data: dict, user: str = Depends(get_current_user)):
-    db = load_db()
-
-    logging.debug(f"📞 Numéros enregistrés pour {user} : {db['users'][user]['phone_numbers']}")
-    logging.debug(f"📡 Données reçues : {data}")
+DID_PAGE_STREAM_THRESHOLD = 1000
 
-    if user not in db["users"]:
-        raise HTTPException(status_code=400, detail="Utilisateur non trouvé.")
+def _did_page(cursor, q, match, limit):
+    page = accounts.did_page(cursor, q, match, limit)
+    next_cursor = page[limit - 1] if len(page) > limit else None
+    return page[:limit], next_cursor
 
-    if "phone_number" not in data or "amount" not in data:
-        raise HTTPException(status_code=400, detail="Données manquantes : phone_number ou amount.")
-
-    if data["phone_number"] not in db["users"][user]["phone_numbers"]:
-        raise HTTPException(status_code=400, detail=f"Numéro Mobile Money non enregistré. Numéros enregistrés : {db['users'][user]['phone_numbers']}")
+@app.get("/list_did_users/")
+def list_did_users(
+    request: Request,
+    limit: int = Query(100, ge=1, le=10000),
+    cursor: Optional[str] = None,
+    q: Optional[str] = None,
+    match: Literal["prefix", "substring"] = "prefix",
+    username: Optional[str] = None,
+    phone: Optional[str] = None,
+    user: Optional[Caller] = Depends(get_optional_user),
+):
+    # Recherche exacte (nom, numéro -> DID) réservée aux utilisateurs connectés
+    if (username is not None or phone is not None) and user is None:
+        raise HTTPException(status_code=401, detail="Not authenticated", headers={"WWW-Authenticate": "Bearer"})
+
+    # ETag : change dès qu'un utilisateur est ajouté, supprimé ou reçoit un numéro
+    etag = f'W/"{accounts.users_etag()}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag in (tag.strip() for tag in request.headers.get("if-none-match", "").split(",")):
+        return Response(status_code=304, headers=headers)
+
+    if username is not None or phone is not None:
+        did = accounts.lookup(username=username, phone_number=phone)
+        return JSONResponse({"users": [did] if did else [], "next_cursor": None}, headers=headers)
+
+    page, next_cursor = _did_page(cursor, q, match, limit)
+    if len(page) < DID_PAGE_STREAM_THRESHOLD:
+        return JSONResponse({"users": page, "next_cursor": next_cursor}, headers=headers)
+
+    def stream():
+        yield '{"users":['
+        for i in range(0, len(page), 500):
+            chunk = ",".join(json.dumps(did) for did in page[i:i + 500])
+            yield chunk if i == 0 else "," + chunk
+        yield f'],"next_cursor":{json.dumps(next_cursor)}}}'
+
+    return StreamingResponse(stream(), media_type="application/json", headers=headers)
+
+# 📲 Dépôt d’argent via Mobile Money : accepté (202) puis réglé en arrière-plan
+@app.post("/deposit/", status_code=202)
+def deposit_funds(data: DepositRequest, user: Caller = Depends(get_current_user),
+                  idempotency_key: Optional[str] = Header(None)):
+    logger.debug("📡 Dépôt demandé", extra={"user": user.username})
+
+    # Le FCFA n'a pas de subdivision : montant entier (positif et borné par DepositRequest)
+    amount = data.amount
+    if amount != int(amount):
+        raise HTTPException(status_code=400, detail="Montant invalide.")
+
+    # Un nouvel essai du client avec la même clé renvoie le dépôt d'origine
+    key = idempotency_key or data.idempotency_key or uuid.uuid4().hex
+    deposit, replayed = accounts.create_deposit(user, data.phone_number, int(amount), data.operator, key)
+    if replayed:
+        return JSONResponse(status_code=202, content=deposit, headers={"Idempotent-Replayed": "true"})
+
+    return JSONResponse(status_code=202, content={"message": "Dépôt accepté, en cours de traitement", **deposit})
+
+@app.get("/deposits/{deposit_id}")
+def deposit_status(deposit_id: str, user: Caller = Depends(get_current_user)):
+    deposit = accounts.deposit(user, deposit_id)
+    if deposit is None:
+        raise HTTPException(status_code=404, detail="Dépôt introuvable.")
+    return deposit
+
+
+# 📡 Flux SSE des écritures et soldes de l'utilisateur
+# EventSource ne permet pas d'en-tête Authorization : le token peut aussi passer en `?token=`
+def get_stream_user(request: Request, token: Optional[str] = None):
+    authorization = request.headers.get("Authorization", "")
+    if authorization.startswith("Bearer "):
+        token = authorization[len("Bearer "):]
+    if not token:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    return get_current_user(token)
+
+@app.get("/events/")
+async def stream_events(user: Caller = Depends(get_stream_user),
+                        last_event_id: Optional[int] = Header(None, alias="Last-Event-ID")):
+    did = await run_in_threadpool(accounts.account_did, user)
+    event_bus = accounts.event_bus
+    subscription = event_bus.subscribe(user.username, did)
+    return StreamingResponse(event_bus.stream(subscription, last_event_id), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+# 📋 Historique des transactions (pagination par curseur)
+@app.get("/transactions/")
+def list_transactions(
+    user: Caller = Depends(get_current_user),
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[int] = None,
+    type: Optional[str] = None,
+    since: Optional[datetime.datetime] = None,
+    until: Optional[datetime.datetime] = None,
+):
+    if type is not None and type not in ledger.ENTRY_TYPES:
+        raise HTTPException(status_code=400, detail=f"Type inconnu. Types possibles : {', '.join(ledger.ENTRY_TYPES)}")
 
-    db["users"][user]["balance_fcfa"] += data["amount"]
-    save_db(db)
+    def to_ts(value):
+        if value is None:
+            return None
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=datetime.timezone.utc)
+        return value.timestamp()
 
-    return {"message": "Dépôt réussi", "new_balance_fcfa": db["users"][user]["balance_fcfa"]}
+    items, next_cursor = accounts.history(user, limit=limit, cursor=cursor, entry_type=type,
+                                          since=to_ts(since), until=to_ts(until))
+    return {"items": items, "next_cursor": next_cursor}
 
 
 # 🔄 Transfert P2P via DID
 @app.post("/transfer/")
-def transfer_stablecoins(data: TransferRequest, user: str = Depends(get_current_user)):
-    db = load_db()
+def transfer_stablecoins(data: TransferRequest, user: Caller = Depends(get_current_user)):
+    accounts.transfer(user, data.receiver_did, data.amount)
 
-    if db["users"][user]["did"] == data.receiver_did:
-        raise HTTPException(status_code=400, detail="Vous ne pouvez pas vous envoyer de l'argent.")
-
-    receiver = next((u for u, v in db["users"].items() if v["did"] == data.receiver_did), None)
-    if not receiver:
-        raise HTTPException(status_code=404, detail="Destinataire non trouvé.")
+    return {"message": "Transfert réussi"}
 
-    db["users"][user]["balance_stablecoin"] -= data.amount
-    db["users"][receiver]["balance_stablecoin"] += data.amount
-    save_db(db)
 
-    return {"message": "Transfert réussi"}
+# 📦 Transfert groupé (paie, reversements marchands)
+@app.post("/transfer/batch/")
+def transfer_batch(data: BatchTransferRequest, user: Caller = Depends(get_current_user)):
+    return accounts.transfer_batch(user, [(item.receiver_did, item.amount) for item in data.transfers], data.mode)
@@ -0,0 +1,223 @@
+import time
+import threading
+import contextvars
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# 📊 Métriques au format texte Prometheus, sans dépendance externe
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            series = list(self._series.items())
+        for labelvalues, value in series:
+            lines.extend(self._render_series(labelvalues, value))
+        return lines
+
+    def _render_series(self, labelvalues, value):
+        return [f"{self.name}{_labels(self.labelnames, labelvalues)} {value}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, *labelvalues, amount=1):
+        with self._lock:
+            self._series[labelvalues] = self._series.get(labelvalues, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def inc(self, *labelvalues, amount=1):
+        with self._lock:
+            self._series[labelvalues] = self._series.get(labelvalues, 0) + amount
+
+    def dec(self, *labelvalues, amount=1):
+        self.inc(*labelvalues, amount=-amount)
+
+    def set(self, value, *labelvalues):
+        with self._lock:
+            self._series[labelvalues] = value
+
+
+# Résultats des fonctions per_scrape pendant le rendu en cours (None hors rendu)
+_SCRAPE_CACHE = contextvars.ContextVar("transferz_scrape_cache", default=None)
+
+
+def per_scrape(fn):
+    """`fn()` évaluée une seule fois par rendu du registre, quel que soit le
+    nombre de CallbackMetric qui la lisent ; appelée à chaque fois hors rendu."""
+    def cached():
+        cache = _SCRAPE_CACHE.get()
+        if cache is None:
+            return fn()
+        if fn not in cache:
+            cache[fn] = fn()
+        return cache[fn]
+    return cached
+
+
+class CallbackMetric(_Metric):
+    """Valeur lue au moment du scrape : `callback()` renvoie {labels: valeur}."""
+
+    def __init__(self, name, documentation, callback, labelnames=(), kind="gauge"):
+        super().__init__(name, documentation, labelnames)
+        self._callback = callback
+        self.kind = kind
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for labelvalues, value in self._callback().items():
+            lines.extend(self._render_series(labelvalues, value))
+        return lines
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labelvalues):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                # [compte par bucket (+Inf en dernier), somme, nombre]
+                series = self._series[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, *labelvalues):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labelvalues)
+
+    def _render_series(self, labelvalues, value):
+        counts, total, count = value[0][:], value[1], value[2]
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += bucket_count
+            le = "+Inf" if bound == float("inf") else repr(bound)
+            lines.append(f"{self.name}_bucket{_labels(self.labelnames, labelvalues, ('le', le))} {cumulative}")
+        lines.append(f"{self.name}_sum{_labels(self.labelnames, labelvalues)} {total}")
+        lines.append(f"{self.name}_count{_labels(self.labelnames, labelvalues)} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        token = _SCRAPE_CACHE.set({})
+        try:
+            lines = []
+            for metric in self._metrics:
+                lines.extend(metric.render())
+        finally:
+            _SCRAPE_CACHE.reset(token)
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+# ⏱️ Temps passé dans chaque phase coûteuse (journal, bcrypt, JWT, clés…)
+PHASE_SECONDS = REGISTRY.register(Histogram(
+    "transferz_phase_seconds", "Durée des phases internes d'une requête", ["phase"]))
+
+
+# Requête profilée en cours (profiling.py) : {phase: secondes} à compléter, sinon None
+PHASE_SINK = contextvars.ContextVar("transferz_phase_sink", default=None)
+
+
+@contextmanager
+def phase(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        PHASE_SECONDS.observe(elapsed, name)
+        sink = PHASE_SINK.get()
+        if sink is not None:
+            sink[name] = sink.get(name, 0.0) + elapsed
+
+
+# 🌐 Middleware ASGI : latence par route, requêtes en cours, codes HTTP
+HTTP_LATENCY = REGISTRY.register(Histogram(
+    "transferz_http_request_duration_seconds", "Latence des requêtes HTTP", ["method", "route"]))
+HTTP_IN_FLIGHT = REGISTRY.register(Gauge(
+    "transferz_http_requests_in_flight", "Requêtes HTTP en cours de traitement", ["method"]))
+HTTP_RESPONSES = REGISTRY.register(Counter(
+    "transferz_http_responses_total", "Réponses HTTP par route et statut", ["method", "route", "status"]))
+HTTP_ERRORS = REGISTRY.register(Counter(
+    "transferz_http_errors_total", "Réponses HTTP en erreur (4xx/5xx) par statut", ["status"]))
+
+
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        method = scope["method"]
+        status = 500
+        start = time.perf_counter()
+        HTTP_IN_FLIGHT.inc(method)
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            HTTP_IN_FLIGHT.dec(method)
+            route = getattr(scope.get("route"), "path", "unmatched")
+            HTTP_LATENCY.observe(elapsed, method, route)
+            HTTP_RESPONSES.inc(method, route, str(status))
+            if status >= 400:
+                HTTP_ERRORS.inc(str(status))
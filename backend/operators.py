@@ -0,0 +1,51 @@
+import os
+import uuid
+import random
+import asyncio
+
+# 📡 Opérateurs Mobile Money
+OPERATORS = ("MTN", "Orange", "Moov", "Wave")
+SIM_MAX_LATENCY = float(os.getenv("TRANSFERZ_OPERATOR_SIM_LATENCY", "1.0"))
+SIM_FAILURE_RATE = float(os.getenv("TRANSFERZ_OPERATOR_SIM_FAILURE_RATE", "0.05"))
+
+
+class OperatorError(Exception):
+    """Refus définitif de l'opérateur (le dépôt échoue)."""
+
+
+class OperatorUnavailable(Exception):
+    """Panne passagère (le dépôt est retenté)."""
+
+
+class OperatorAdapter:
+    """Encaisse un montant sur un numéro Mobile Money.
+
+    `reference` est l'id du dépôt : un vrai adaptateur le transmet à
+    l'opérateur pour qu'un nouvel essai après un arrêt brutal ne débite pas
+    deux fois le client. Renvoie la référence de transaction de l'opérateur.
+    """
+
+    async def collect(self, phone_number, amount, reference):
+        raise NotImplementedError
+
+
+class SimulatedOperator(OperatorAdapter):
+    """Simulateur local : latence aléatoire, pannes passagères, plafond par opération."""
+
+    def __init__(self, name, max_latency=SIM_MAX_LATENCY, failure_rate=SIM_FAILURE_RATE, ceiling=2_000_000):
+        self.name = name
+        self.max_latency = max_latency
+        self.failure_rate = failure_rate
+        self.ceiling = ceiling
+
+    async def collect(self, phone_number, amount, reference):
+        await asyncio.sleep(random.uniform(0, self.max_latency))
+        if random.random() < self.failure_rate:
+            raise OperatorUnavailable(f"{self.name} indisponible")
+        if amount > self.ceiling:
+            raise OperatorError(f"Plafond {self.name} dépassé ({self.ceiling} FCFA)")
+        return f"{self.name.upper()}-{uuid.uuid4().hex[:12]}"
+
+
+def simulated_operators():
+    return {name: SimulatedOperator(name) for name in OPERATORS}
@@ -0,0 +1,294 @@
+import os
+import hmac
+import time
+import heapq
+import random
+import cProfile
+import marshal
+import asyncio
+import functools
+import itertools
+import threading
+import contextvars
+
+from fastapi.routing import APIRoute
+
+from metrics import PHASE_SINK
+
+# 🔬 Profilage à la demande (TRANSFERZ_PROFILE_SAMPLE_RATE, TRANSFERZ_PROFILE_TOKEN)
+SAMPLE_RATE = float(os.getenv("TRANSFERZ_PROFILE_SAMPLE_RATE", "0"))
+TOKEN = os.getenv("TRANSFERZ_PROFILE_TOKEN", "")
+KEEP_PER_ROUTE = int(os.getenv("TRANSFERZ_PROFILE_KEEP", "5"))
+HEADER = b"x-transferz-profile"
+ENABLED = SAMPLE_RATE > 0 or bool(TOKEN)
+
+_current = contextvars.ContextVar("transferz_profile", default=None)
+_ids = itertools.count(1)
+
+
+def token_matches(value):
+    """En-tête `X-Transferz-Profile` (octets ou texte latin-1) égal à TOKEN, comparé en temps constant."""
+    if not TOKEN or value is None:
+        return False
+    if isinstance(value, str):
+        value = value.encode("latin-1")
+    return hmac.compare_digest(value, TOKEN.encode())
+
+
+class RequestProfile:
+    """Une requête profilée : durée, phases (metrics.phase) et profil cProfile de la route."""
+
+    __slots__ = ("id", "method", "path", "route", "status", "started_at", "duration", "phases", "stats")
+
+    def __init__(self, method, path):
+        self.id = next(_ids)
+        self.method = method
+        self.path = path
+        self.route = "unmatched"
+        self.status = 500
+        self.started_at = time.time()
+        self.duration = 0.0
+        self.phases = {}
+        self.stats = None  # {(fichier, ligne, fonction): (cc, nc, tt, ct, appelants)}
+
+    def summary(self):
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "route": self.route,
+            "status": self.status,
+            "started_at": self.started_at,
+            "duration_ms": round(self.duration * 1000, 3),
+            "phases_ms": {name: round(s * 1000, 3) for name, s in self.phases.items()},
+            "profiled": self.stats is not None,
+        }
+
+
+# 🐢 Les N requêtes les plus lentes de chaque route
+class SlowRequestLog:
+    """Un tas borné (min-tas sur la durée) par route : une requête plus rapide
+    que la plus rapide des N conservées est écartée en O(1), sinon elle la
+    remplace en O(log N). La mémoire est bornée par N × nombre de routes.
+    """
+
+    def __init__(self, keep=KEEP_PER_ROUTE):
+        self.keep = keep
+        self._heaps = {}
+        self._lock = threading.Lock()
+
+    def offer(self, profile):
+        item = (profile.duration, profile.id, profile)
+        with self._lock:
+            heap = self._heaps.setdefault((profile.method, profile.route), [])
+            if len(heap) < self.keep:
+                heapq.heappush(heap, item)
+            elif item[0] > heap[0][0]:
+                heapq.heapreplace(heap, item)
+
+    def slowest(self):
+        with self._lock:
+            heaps = {key: sorted(heap, reverse=True) for key, heap in self._heaps.items()}
+        return {f"{method} {route}": [profile.summary() for _, _, profile in heap]
+                for (method, route), heap in sorted(heaps.items())}
+
+    def get(self, profile_id):
+        with self._lock:
+            for heap in self._heaps.values():
+                for _, _, profile in heap:
+                    if profile.id == profile_id:
+                        return profile
+        return None
+
+
+# 🎯 Middleware : choix des requêtes profilées
+class ProfilingMiddleware:
+    """Middleware ASGI : profile une fraction `sample_rate` des requêtes, et
+    toute requête portant l'en-tête `X-Transferz-Profile` égal à `token`.
+
+    Une requête non retenue ne coûte qu'un tirage aléatoire ; les routes
+    `/admin/profiles/`, qui exigent l'en-tête, ne sont jamais retenues
+    (chaque lecture remplirait le journal). Une requête retenue collecte ses phases (`metrics.phase`) et, via `ProfiledRoute`,
+    un profil cProfile de la fonction de route ; elle est ensuite proposée
+    à `log`.
+    """
+
+    def __init__(self, app, log, sample_rate=SAMPLE_RATE, token=TOKEN):
+        self.app = app
+        self.log = log
+        self.sample_rate = sample_rate
+        self.token = token.encode() if token else None
+
+    def _wanted(self, scope):
+        if scope["path"].startswith("/admin/profiles/"):
+            return False
+        if self.token is not None:
+            for name, value in scope["headers"]:
+                if name == HEADER:
+                    return hmac.compare_digest(value, self.token)
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self._wanted(scope):
+            return await self.app(scope, receive, send)
+
+        profile = RequestProfile(scope["method"], scope["path"])
+        profile_token = _current.set(profile)
+        sink_token = PHASE_SINK.set(profile.phases)
+        start = time.perf_counter()
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                profile.status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            profile.duration = time.perf_counter() - start
+            PHASE_SINK.reset(sink_token)
+            _current.reset(profile_token)
+            profile.route = getattr(scope.get("route"), "path", "unmatched")
+            self.log.offer(profile)
+
+
+# 🧵 cProfile autour de la fonction de route, dans le thread qui l'exécute
+_busy = threading.local()
+
+
+def _start():
+    # Un seul profileur actif par thread (boucle asyncio comprise) ; sous
+    # Python ≥ 3.12, cProfile refuse un second profileur dans le processus
+    if getattr(_busy, "active", False):
+        return None
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        return None
+    _busy.active = True
+    return profiler
+
+
+def _stop(profile, profiler):
+    profiler.disable()
+    _busy.active = False
+    profiler.create_stats()
+    profile.stats = profiler.stats
+
+
+def profiled(endpoint):
+    """Enveloppe une fonction de route : profilée seulement pendant une requête retenue.
+
+    Une route async est profilée sur la boucle : les autres tâches qui
+    s'exécutent pendant ses `await` apparaissent aussi dans son profil.
+    """
+    if asyncio.iscoroutinefunction(endpoint):
+        @functools.wraps(endpoint)
+        async def wrapper(*args, **kwargs):
+            profile = _current.get()
+            profiler = _start() if profile is not None else None
+            if profiler is None:
+                return await endpoint(*args, **kwargs)
+            try:
+                return await endpoint(*args, **kwargs)
+            finally:
+                _stop(profile, profiler)
+    else:
+        @functools.wraps(endpoint)
+        def wrapper(*args, **kwargs):
+            profile = _current.get()
+            profiler = _start() if profile is not None else None
+            if profiler is None:
+                return endpoint(*args, **kwargs)
+            try:
+                return endpoint(*args, **kwargs)
+            finally:
+                _stop(profile, profiler)
+    return wrapper
+
+
+class ProfiledRoute(APIRoute):
+    """`app.router.route_class` : chaque route déclarée ensuite passe par `profiled`."""
+
+    def __init__(self, path, endpoint, **kwargs):
+        super().__init__(path, profiled(endpoint), **kwargs)
+
+
+# 📤 Exports
+def to_pstats(profile):
+    """Contenu d'un fichier .pstats (format de `pstats.Stats.dump_stats`)."""
+    return marshal.dumps(profile.stats)
+
+
+def _is_profiler_frame(func):
+    return "_lsprof.Profiler" in func[2]
+
+
+def to_speedscope(profile, min_weight=1e-6, max_depth=128):
+    """Profil au format speedscope (type "sampled", poids en secondes).
+
+    cProfile ne garde que les arcs appelant → appelé : les piles sont
+    reconstituées depuis les fonctions sans appelant, le temps inclusif d'un
+    arc étant réparti au prorata entre les appelants de l'appelant. Les
+    branches de moins de `min_weight` s et les récursions sont coupées.
+    """
+    stats = {func: value for func, value in profile.stats.items() if not _is_profiler_frame(func)}
+    children = {}
+    roots = []
+    for func, (_, _, _, ct, callers) in stats.items():
+        known = [caller for caller in callers if caller in stats]
+        if not known:
+            roots.append((func, ct))
+        for caller in known:
+            children.setdefault(caller, []).append((func, callers[caller][3]))
+
+    frames, frame_index = [], {}
+    samples, weights = [], []
+
+    def frame(func):
+        index = frame_index.get(func)
+        if index is None:
+            filename, line, name = func
+            index = frame_index[func] = len(frames)
+            entry = {"name": name}
+            if filename != "~":
+                entry.update({"file": filename, "line": line})
+            frames.append(entry)
+        return index
+
+    def expand(func, weight, stack, on_stack):
+        _, _, tt, ct, _ = stats[func]
+        scale = weight / ct if ct else 0.0
+        stack = stack + [frame(func)]
+        if tt * scale > 0:
+            samples.append(stack)
+            weights.append(tt * scale)
+        if len(stack) >= max_depth:
+            return
+        on_stack.add(func)
+        for child, child_ct in children.get(func, ()):
+            if child not in on_stack and child_ct * scale >= min_weight:
+                expand(child, child_ct * scale, stack, on_stack)
+        on_stack.discard(func)
+
+    for func, ct in roots:
+        if ct >= min_weight:
+            expand(func, ct, [], set())
+
+    name = f"{profile.method} {profile.path} #{profile.id}"
+    return {
+        "$schema": "https://www.speedscope.app/file-format-schema.json",
+        "name": name,
+        "exporter": "transferz",
+        "shared": {"frames": frames},
+        "profiles": [{
+            "type": "sampled",
+            "name": name,
+            "unit": "seconds",
+            "startValue": 0,
+            "endValue": sum(weights),
+            "samples": samples,
+            "weights": weights,
+        }],
+    }
@@ -0,0 +1,127 @@
+import os
+import json
+import math
+import time
+from collections import OrderedDict
+
+import metrics
+
+RATE_LIMITED = metrics.REGISTRY.register(metrics.Counter(
+    "transferz_rate_limited_total", "Requêtes refusées (429) par classe de route et type de clé",
+    ["route_class", "key"]))
+
+
+# 🪣 Seaux à jetons par clé (IP ou utilisateur)
+class RateLimiter:
+    """`rate` jetons par seconde, au plus `burst` en réserve, par clé.
+
+    Chaque clé active coûte une entrée [jetons, dernier accès] dans un
+    OrderedDict trié par dernier accès. Un seau resté inactif assez
+    longtemps pour être de nouveau plein équivaut à une clé absente : il est
+    évincé en tête de liste au fil des appels (O(1) amorti). `max_keys`
+    borne la mémoire si trop de clés sont actives en même temps.
+    """
+
+    def __init__(self, rate, burst, max_keys=100_000):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self.idle_after = burst / rate
+        self._buckets = OrderedDict()
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def acquire(self, key, now=None):
+        """Consomme un jeton ; renvoie 0 si accepté, sinon le délai d'attente en secondes."""
+        now = time.monotonic() if now is None else now
+        buckets = self._buckets
+        while buckets:
+            oldest_key, oldest = next(iter(buckets.items()))
+            if now - oldest[1] < self.idle_after and len(buckets) < self.max_keys:
+                break
+            del buckets[oldest_key]
+
+        bucket = buckets.get(key)
+        if bucket is None:
+            bucket = buckets[key] = [self.burst, now]
+        else:
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            buckets.move_to_end(key)
+        if bucket[0] >= 1:
+            bucket[0] -= 1
+            return 0.0
+        return (1 - bucket[0]) / self.rate
+
+
+def limiter_from_env(name, default):
+    """TRANSFERZ_RATE_LIMIT_<NAME>="rate:burst" (jetons/s : réserve), "0" désactive."""
+    value = os.getenv(f"TRANSFERZ_RATE_LIMIT_{name.upper()}", default)
+    if not value or value == "0":
+        return None
+    rate, _, burst = value.partition(":")
+    return RateLimiter(float(rate), float(burst or rate))
+
+
+# 🚦 Contrôle d'admission avant le routage
+class RateLimitMiddleware:
+    """Middleware ASGI : un budget par classe de route, par IP et par utilisateur.
+
+    `classify(path)` renvoie la classe de route (None : pas de limite) ;
+    `identify(token)` renvoie le nom d'utilisateur d'un token Bearer, ou
+    None s'il est invalide (la route répondra 401 elle-même). Au-delà du
+    budget : 429 avec `Retry-After`, sans toucher à bcrypt ni au store.
+    `trust_proxy` : nombre de proxys de confiance devant l'application.
+    Chacun ajoute à droite de `X-Forwarded-For` l'adresse qui s'est
+    connectée à lui : l'IP retenue est la `trust_proxy`-ième en partant de
+    la droite. Les entrées plus à gauche viennent du client, qui peut les
+    falsifier pour changer de budget à chaque requête.
+    """
+
+    def __init__(self, app, limits, classify, identify, trust_proxy=0):
+        self.app = app
+        self.limits = limits  # classe -> {"ip": RateLimiter | None, "user": RateLimiter | None}
+        self.classify = classify
+        self.identify = identify
+        self.trust_proxy = trust_proxy
+
+    def _client_ip(self, scope, headers):
+        if self.trust_proxy and b"x-forwarded-for" in headers:
+            forwarded = headers[b"x-forwarded-for"].split(b",")
+            return forwarded[max(len(forwarded) - self.trust_proxy, 0)].strip().decode()
+        client = scope.get("client")
+        return client[0] if client else "unknown"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        route_class = self.classify(scope["path"])
+        limits = self.limits.get(route_class)
+        if limits is None:
+            return await self.app(scope, receive, send)
+
+        headers = dict(scope["headers"])
+        wait = 0.0
+        key_type = None
+        if limits.get("ip") is not None:
+            wait = limits["ip"].acquire(self._client_ip(scope, headers))
+            key_type = "ip"
+        if not wait and limits.get("user") is not None:
+            authorization = headers.get(b"authorization", b"").decode()
+            username = self.identify(authorization[7:]) if authorization.startswith("Bearer ") else None
+            if username is not None:
+                wait = limits["user"].acquire(username)
+                key_type = "user"
+        if not wait:
+            return await self.app(scope, receive, send)
+
+        RATE_LIMITED.inc(route_class, key_type)
+        retry_after = max(1, math.ceil(wait))
+        body = json.dumps({"detail": f"Trop de requêtes, réessayez dans {retry_after} s."}).encode()
+        await send({"type": "http.response.start", "status": 429, "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", str(retry_after).encode()),
+        ]})
+        await send({"type": "http.response.body", "body": body})
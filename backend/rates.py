@@ -0,0 +1,115 @@
+import os
+import json
+import time
+import logging
+import threading
+from collections import namedtuple
+
+logger = logging.getLogger("transferz.rates")
+
+# 💱 Taux de change (ex. FCFA -> USDT)
+DEFAULT_RATES = {("FCFA", "USDT"): 0.0016}
+RATE_TTL = float(os.getenv("TRANSFERZ_RATE_TTL", "60"))
+
+Rate = namedtuple("Rate", ["base", "quote", "value", "fetched_at"])
+
+
+class RateUnavailable(Exception):
+    pass
+
+
+class RateProvider:
+    """Source de taux : renvoie le prix d'une unité de `base` en `quote`."""
+
+    def fetch(self, base, quote):
+        raise NotImplementedError
+
+
+class StaticRateProvider(RateProvider):
+    def __init__(self, rates=None):
+        self.rates = dict(rates or DEFAULT_RATES)
+
+    def fetch(self, base, quote):
+        try:
+            return self.rates[(base, quote)]
+        except KeyError:
+            raise RateUnavailable(f"Taux {base}/{quote} inconnu")
+
+
+class FileRateProvider(RateProvider):
+    """Taux lus dans un fichier JSON local, ex. {"FCFA/USDT": 0.0016} (tests, démo)."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def fetch(self, base, quote):
+        try:
+            with open(self.path, "r") as f:
+                rates = json.load(f)
+            return float(rates[f"{base}/{quote}"])
+        except (OSError, ValueError, KeyError) as e:
+            raise RateUnavailable(f"Taux {base}/{quote} indisponible : {e}")
+
+
+# ⏱️ Cache des taux avec rafraîchissement unique
+class CachedRates:
+    """Garde chaque taux `ttl` secondes.
+
+    Quand un taux expire, un seul appelant interroge le fournisseur ; les
+    appels simultanés attendent ce résultat au lieu de lancer leur propre
+    requête. Si le fournisseur échoue, le dernier taux connu est servi
+    (et gardé un TTL de plus).
+    """
+
+    def __init__(self, provider, ttl=RATE_TTL):
+        self.provider = provider
+        self.ttl = ttl
+        self._rates = {}
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+
+        self.hits = 0
+        self.fetches = 0
+        self.failures = 0
+
+    def _lock_for(self, key):
+        with self._locks_guard:
+            return self._locks.setdefault(key, threading.Lock())
+
+    def _fresh(self, rate):
+        return rate is not None and time.monotonic() - rate.fetched_at < self.ttl
+
+    def get(self, base, quote):
+        key = (base, quote)
+        rate = self._rates.get(key)
+        if self._fresh(rate):
+            self.hits += 1
+            return rate
+
+        with self._lock_for(key):
+            rate = self._rates.get(key)
+            if self._fresh(rate):
+                self.hits += 1
+                return rate
+            self.fetches += 1
+            try:
+                value = self.provider.fetch(base, quote)
+            except RateUnavailable as e:
+                self.failures += 1
+                if rate is None:
+                    raise
+                logger.warning("⚠️ %s ; dernier taux connu conservé", e)
+                # Prochain essai après un nouveau TTL, pas à chaque appel
+                rate = self._rates[key] = rate._replace(fetched_at=time.monotonic())
+                return rate
+            rate = self._rates[key] = Rate(base, quote, value, time.monotonic())
+            return rate
+
+    def stats(self):
+        return {"ttl_s": self.ttl, "hits": self.hits, "fetches": self.fetches, "failures": self.failures,
+                "rates": {f"{r.base}/{r.quote}": r.value for r in self._rates.values()}}
+
+
+def default_provider():
+    path = os.getenv("TRANSFERZ_RATES_FILE")
+    return FileRateProvider(path) if path else StaticRateProvider()
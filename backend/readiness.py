@@ -0,0 +1,83 @@
+import json
+import time
+import logging
+import threading
+from contextlib import contextmanager
+
+logger = logging.getLogger("transferz.readiness")
+
+STARTING = "starting"
+WARMING_UP = "warming_up"
+READY = "ready"
+FAILED = "failed"
+
+
+# 🚦 État du démarrage
+class Readiness:
+    """Chargement de l'état puis chauffe, chronométrés étape par étape.
+
+    `serving` est levé dès que l'état est chargé et les services créés : les
+    routes peuvent répondre. `/ready` ne passe au vert qu'une fois tous les
+    contrôles de chauffe réussis (`check`).
+    """
+
+    def __init__(self, checks=()):
+        self.started = time.perf_counter()
+        self.serving = threading.Event()
+        self.steps = {}
+        self.checks = {name: False for name in checks}
+        self.error = None
+        self.ready_after = None
+
+    @contextmanager
+    def step(self, name):
+        start = time.perf_counter()
+        yield
+        self.steps[name] = round(time.perf_counter() - start, 4)
+
+    def check(self, name, ok=True):
+        self.checks[name] = ok
+        if self.ready_after is None and all(self.checks.values()):
+            self.ready_after = round(time.perf_counter() - self.started, 4)
+            logger.info("✅ Prêt en %.2f s", self.ready_after, extra={"steps": self.steps})
+
+    def fail(self, error):
+        self.error = f"{type(error).__name__}: {error}"
+        logger.error("🚨 Échec du démarrage : %s", self.error)
+
+    @property
+    def status(self):
+        if self.error is not None:
+            return FAILED
+        if not self.serving.is_set():
+            return STARTING
+        return READY if self.ready_after is not None else WARMING_UP
+
+    def report(self):
+        return {"status": self.status, "checks": self.checks, "steps_s": self.steps,
+                "ready_after_s": self.ready_after, "error": self.error}
+
+
+# ⏳ Middleware ASGI : 503 tant que l'état n'est pas chargé
+class ReadinessMiddleware:
+    """Laisse passer `allow` (ex. /ready) ; les autres routes répondent 503
+    avec `Retry-After` tant que `readiness.serving` n'est pas levé."""
+
+    def __init__(self, app, readiness, allow=("/ready",)):
+        self.app = app
+        self.readiness = readiness
+        self.allow = set(allow)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or self.readiness.serving.is_set() or scope["path"] in self.allow:
+            return await self.app(scope, receive, send)
+
+        failed = self.readiness.error is not None
+        detail = "Échec du démarrage du service." if failed else "Service en cours de démarrage, réessayez."
+        body = json.dumps({"detail": detail}).encode()
+        await send({"type": "http.response.start", "status": 503, "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", b"1"),
+        ]})
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,145 @@
+import time
+import logging
+import threading
+
+import storage
+import ledger
+from balances import CURRENCIES, from_minor
+
+logger = logging.getLogger("transferz.reconcile")
+
+
+def expected_column(currency):
+    return f"expected_{currency}"
+
+
+# ⚖️ Rapprochement grand livre / soldes
+class Reconciler:
+    """Compare les soldes du store à ceux déduits du grand livre.
+
+    Les soldes attendus sont des colonnes de `store.balances`, alignées sur
+    les soldes réels. Chaque écriture les met à jour et marque ses comptes
+    comme « à vérifier » : `check()` ne compare que ces comptes, `audit()`
+    compare toutes les colonnes d'un coup. Un thread de fond lance `check()`
+    toutes les `interval` secondes.
+    """
+
+    def __init__(self, store, interval=5.0):
+        self.store = store
+        self.interval = interval
+        self.discrepancies = {}
+        # Monnaie entrée hors transferts (dépôts, éditions admin, conversions)
+        self.net_issued = {c: 0 for c in CURRENCIES}
+        self._dirty = set()
+
+        self.checks = 0
+        self.accounts_checked = 0
+        self.last_check = None
+        self.last_audit = None
+
+        with store.lock:
+            for c in CURRENCIES:
+                store.balances.add_column(expected_column(c))
+            for e in store.transactions:
+                self._apply_entry(e)
+            store.add_listener(self._on_record)
+            self.audit()
+        if self.discrepancies:
+            logger.warning("⚠️ %d comptes non rapprochés au démarrage", len(self.discrepancies))
+
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._check_loop, name="reconciler", daemon=True)
+        self._thread.start()
+
+    def _apply_entry(self, e):
+        for username, did, currency, delta in ledger.balance_deltas(e):
+            user = self.store.users.get(username)
+            # Écriture d'un ancien compte supprimé portant le même nom : pas pour ce compte
+            if user is not None and did in (None, user["did"]):
+                self.store.balances.add_to(username, expected_column(currency), delta)
+            if e["type"] != ledger.TRANSFER:
+                self.net_issued[currency] += delta
+
+    def _on_record(self, record):
+        op = record["op"]
+        if op == storage.APPEND_LEDGER:
+            self._apply_entry(record["entry"])
+            self._dirty.update(ledger.accounts_of(record["entry"]))
+        elif op in (storage.PUT_USER, storage.SET_BALANCE):
+            self._dirty.add(record["username"])
+        elif op == storage.DELETE_USER:
+            self._dirty.discard(record["username"])
+            self.discrepancies.pop(record["username"], None)
+
+    def _compare(self, username):
+        table = self.store.balances
+        found = {}
+        for c in CURRENCIES:
+            stored = table.get(username, c)
+            expected = table.get(username, expected_column(c))
+            if stored != expected:
+                found[c] = {"stored": from_minor(c, stored), "expected": from_minor(c, expected)}
+        return found
+
+    # 🔍 Vérification incrémentale : comptes modifiés depuis le dernier point de contrôle
+    def check(self):
+        with self.store.lock:
+            dirty, self._dirty = self._dirty, set()
+            for username in dirty:
+                found = self._compare(username) if username in self.store.balances else None
+                if found:
+                    if username not in self.discrepancies:
+                        logger.warning("⚠️ Écart grand livre / solde", extra={"user": username, "diff": found})
+                    self.discrepancies[username] = found
+                else:
+                    self.discrepancies.pop(username, None)
+            self.checks += 1
+            self.accounts_checked += len(dirty)
+            self.last_check = time.time()
+        return len(dirty)
+
+    # 🧮 Audit complet, vectorisé sur les colonnes de la table
+    def audit(self):
+        with self.store.lock:
+            found = {}
+            for c in CURRENCIES:
+                for username, stored, expected in self.store.balances.diff(c, expected_column(c)):
+                    found.setdefault(username, {})[c] = {
+                        "stored": from_minor(c, stored), "expected": from_minor(c, expected)}
+            self.discrepancies = found
+            self._dirty.clear()
+            self.last_audit = self.last_check = time.time()
+        return len(found)
+
+    def totals(self):
+        table = self.store.balances
+        with self.store.lock:
+            return {c: {
+                "stored": from_minor(c, table.total_supply(c)),
+                "expected": from_minor(c, table.total_supply(expected_column(c))),
+                "net_issued": from_minor(c, self.net_issued[c]),
+            } for c in CURRENCIES}
+
+    def report(self, limit=100):
+        with self.store.lock:
+            items = [{"username": u, "currencies": d} for u, d in list(self.discrepancies.items())[:limit]]
+            return {
+                "discrepancy_count": len(self.discrepancies),
+                "discrepancies": items,
+                "totals": self.totals(),
+                "pending_accounts": len(self._dirty),
+                "checks": self.checks,
+                "accounts_checked": self.accounts_checked,
+                "last_check": self.last_check,
+                "last_audit": self.last_audit,
+            }
+
+    def _check_loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.check()
+            except Exception as e:
+                logger.error("❌ Erreur de rapprochement : %s", e)
+
+    def close(self):
+        self._stop.set()
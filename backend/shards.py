@@ -0,0 +1,931 @@
+import os
+import sys
+import time
+import uuid
+import zlib
+import heapq
+import queue
+import atexit
+import signal
+import asyncio
+import logging
+import threading
+import multiprocessing
+from multiprocessing.connection import Listener, Client
+
+import storage
+import balances
+import ledger
+from balances import STABLECOIN
+from ledger import parties
+from events import EventBus, HEARTBEAT
+from accounts import (AccountService, AccountError, Caller, USERNAME_TAKEN, PHONE_TAKEN, USER_EXISTS,
+                      refuse_batch, batch_summary, balances_report)
+
+logger = logging.getLogger("transferz.shards")
+
+# 🧩 Configuration du mode multi-processus
+SHARD_DIR = os.getenv("TRANSFERZ_SHARD_DIR", "/tmp/transferz-shards")
+AUTHKEY = os.getenv("TRANSFERZ_SHARD_AUTHKEY", "transferz").encode()
+PREPARE_TIMEOUT = float(os.getenv("TRANSFERZ_2PC_TIMEOUT", "10"))
+CALL_TIMEOUT = float(os.getenv("TRANSFERZ_SHARD_CALL_TIMEOUT", "30"))
+
+# Espaces de la table kv d'un shard
+CLAIMS = "claims"    # nom d'utilisateur -> réservation (sur le shard du nom)
+PHONES = "phones"    # numéro Mobile Money -> réservation (sur le shard du numéro)
+FENCES = "fences"    # réservation abandonnée -> horodatage (sur le shard du compte)
+INTENTS = "intents"  # txid -> transfert inter-shards en cours
+
+# États d'une réservation
+PENDING = "pending"
+ACTIVE = "active"
+
+# États d'une intention de transfert
+PREPARED = "prepared"
+COMMITTED = "committed"
+ABORTED = "aborted"
+
+# Écritures renvoyées au plus par appel de `events_after`
+EVENTS_BATCH = 1000
+
+# Méthodes de AccountService servies telles quelles par un shard
+ACCOUNT_OPS = frozenset({
+    "credentials", "account_did", "profile", "phones", "history", "create_deposit", "deposit",
+    "transfer", "transfer_batch", "set_balances", "velocity_usage", "reconciliation", "gauges",
+    "balance_range", "balance_aggregates", "did_page", "users_etag",
+})
+
+
+def shard_of(key, shards):
+    """Shard propriétaire d'une clé (DID, nom ou numéro) : CRC32 stable entre processus."""
+    return zlib.crc32(key.encode()) % shards
+
+
+def socket_path(index, directory=SHARD_DIR):
+    return os.path.join(directory, f"shard-{index}.sock")
+
+
+class ShardError(AccountError):
+    """Refus renvoyé par un shard, ou shard injoignable (503)."""
+
+
+# 🗃️ Processus propriétaire d'un shard
+class ShardServer:
+    """Sert un shard de comptes : son store, son AccountService, son fichier.
+
+    Les requêtes arrivent sur un socket Unix (`multiprocessing.connection`),
+    un thread par connexion. Les opérations qui ne touchent qu'un compte (ou
+    des comptes du shard) sont celles de AccountService. Un transfert vers
+    d'autres shards suit un commit à deux phases dont le shard de
+    l'expéditeur est le point de décision : `prepare_debit` /
+    `prepare_transfer` réservent les fonds, `prepare_credit` vérifie les
+    destinataires de chaque autre shard, puis `commit_debit` (décision
+    durable) et `commit_credit`. Une intention expéditeur inconnue vaut
+    abandon. Un thread de fond résout les intentions et les réservations
+    restées en suspens plus de TRANSFERZ_2PC_TIMEOUT s (worker tombé,
+    redémarrage).
+    """
+
+    def __init__(self, index, shards, directory=SHARD_DIR):
+        from operators import simulated_operators
+
+        self.index = index
+        self.shards = shards
+        self.directory = directory
+        self.store = storage.open_store(suffix=f"shard-{index}")
+        self.accounts = AccountService(self.store)
+        self.accounts.start_deposits(simulated_operators())
+        self.txm = self.accounts.txm
+        self.peers = ShardRouter(shards, directory)
+        self.transfers = {"cross": 0, "aborted": 0}
+
+    def close(self):
+        self.accounts.close()
+        self.store.close()
+
+    def serve(self):
+        path = socket_path(self.index, self.directory)
+        if os.path.exists(path):
+            os.unlink(path)
+        listener = Listener(path, family="AF_UNIX", authkey=AUTHKEY)
+        threading.Thread(target=self._resolve_loop, name=f"shard-{self.index}-resolver", daemon=True).start()
+        logger.info("🧩 Shard %d/%d prêt (%d comptes)", self.index, self.shards, len(self.store.users))
+        try:
+            while True:
+                try:
+                    conn = listener.accept()
+                except (OSError, EOFError):
+                    # Poignée de main refusée (mauvaise clé)
+                    continue
+                threading.Thread(target=self._serve_connection, args=(conn,), daemon=True).start()
+        finally:
+            listener.close()
+
+    def _serve_connection(self, conn):
+        with conn:
+            while True:
+                try:
+                    op, kwargs = conn.recv()
+                except (EOFError, OSError):
+                    return
+                handler = getattr(self, f"op_{op}", None)
+                if handler is None and op in ACCOUNT_OPS:
+                    handler = getattr(self.accounts, op)
+                try:
+                    if handler is None:
+                        raise ShardError(400, f"Opération inconnue : {op}")
+                    reply = ("ok", handler(**kwargs))
+                except AccountError as e:
+                    reply = ("error", e.status, e.detail)
+                except Exception as e:
+                    logger.exception("🚨 Erreur shard %d sur %s", self.index, op)
+                    reply = ("error", 500, str(e))
+                conn.send(reply)
+
+    def _intent(self, txid):
+        return self.store.kv.get(INTENTS, {}).get(txid)
+
+    # 🏷️ Réservations de noms et de numéros (sur le shard de la clé)
+    def _claim(self, namespace, key):
+        claim = self.store.kv.get(namespace, {}).get(key)
+        if isinstance(claim, str):
+            # Réservation d'avant les états : compte créé
+            return {"did": claim, "claim": None, "state": ACTIVE, "at": 0}
+        return claim
+
+    def op_claim(self, namespace, key, did, claim_id, replace=None):
+        """Réserve `key` pour `did` (en attente) ; renvoie la réservation en place
+        si elle existe et diffère de `replace`, sinon None."""
+        with self.store.lock:
+            current = self._claim(namespace, key)
+            if current is not None and current != replace:
+                return current
+            seq = self.store.submit(storage.put_kv(namespace, key, {
+                "did": did, "claim": claim_id, "state": PENDING, "at": time.time(),
+            }))
+        self.store.wait(seq)
+        return None
+
+    def op_activate(self, namespace, key, claim_id):
+        with self.store.lock:
+            current = self._claim(namespace, key)
+            if current is None or current["claim"] != claim_id or current["state"] == ACTIVE:
+                return
+            seq = self.store.submit(storage.put_kv(namespace, key, {**current, "state": ACTIVE}))
+        self.store.wait(seq)
+
+    def op_release(self, namespace, key, did, claim_id=None):
+        with self.store.lock:
+            current = self._claim(namespace, key)
+            if current is None or current["did"] != did or claim_id not in (None, current["claim"]):
+                return
+            seq = self.store.submit(storage.put_kv(namespace, key, None))
+        self.store.wait(seq)
+
+    def op_lookup(self, namespace, key, pending=False):
+        """DID qui détient `key` (réservations en attente comprises si `pending`), sinon None."""
+        claim = self._claim(namespace, key)
+        if claim is None or (claim["state"] != ACTIVE and not pending):
+            return None
+        return claim["did"]
+
+    # 👤 Comptes (sur le shard du DID)
+    def _fence(self, claims):
+        fences = self.store.kv.get(FENCES, {})
+        if any(claim_id in fences for claim_id in claims):
+            raise ShardError(409, "Inscription expirée, réessayez.")
+
+    def op_create_account(self, username, user, source=None, claims=()):
+        self.accounts.create_account(username, user, source, guard=lambda: self._fence(claims))
+
+    def op_add_phone(self, caller, phone_number, claim_id):
+        self.accounts.add_phone(caller, phone_number, guard=lambda: self._fence([claim_id]))
+
+    def op_settle_claim(self, did, claim_id, phone_number=None):
+        """Issue d'une réservation restée en attente : "created" si le compte (et
+        le numéro) existe, sinon "abandoned" — la réservation est alors
+        clôturée et la création ou l'ajout en retard seront refusés."""
+        with self.store.lock:
+            username = self.store.by_did.get(did)
+            if username is not None and (phone_number is None
+                                         or phone_number in self.store.users[username]["phone_numbers"]):
+                return "created"
+            if claim_id is None or claim_id in self.store.kv.get(FENCES, {}):
+                return "abandoned"
+            seq = self.store.submit(storage.put_kv(FENCES, claim_id, time.time()))
+        self.store.wait(seq)
+        return "abandoned"
+
+    def _no_pending_transfer(self, username):
+        for intent in self.store.kv.get(INTENTS, {}).values():
+            if intent["state"] != PREPARED:
+                continue
+            involved = [intent["account"]] if intent["role"] == "debit" else [l["receiver"] for l in intent["lines"]]
+            if username in involved:
+                raise ShardError(409, "Transfert en cours sur ce compte, réessayez.")
+
+    def op_delete_account(self, username, did):
+        if self.store.by_did.get(did) != username:
+            raise ShardError(404, "Utilisateur introuvable")
+        return self.accounts.delete_account(username, guard=self._no_pending_transfer)
+
+    def op_resolve_dids(self, dids):
+        """{DID: nom} des comptes du shard parmi `dids`."""
+        by_did = self.store.by_did
+        return {did: by_did[did] for did in dids if did in by_did}
+
+    # 🤝 Commit à deux phases (transfert inter-shards)
+    def _reserve(self, txid, username, sender_did, debit, local, entries, legs):
+        """Sous les verrous de l'expéditeur : débite `debit` et enregistre l'intention.
+
+        Les fonds sont réservés tout de suite, rendus si la transaction est
+        abandonnée. `local` {nom: unités} et `entries` (écritures des lignes
+        du shard et des lignes débit) seront appliqués par `commit_debit`.
+        """
+        balance = self.store.balances.get(username, STABLECOIN)
+        return self.store.submit(
+            storage.set_balance(username, balance_stablecoin=balances.from_minor(STABLECOIN, balance - debit)),
+            storage.put_kv(INTENTS, txid, {
+                "role": "debit", "state": PREPARED, "account": username, "did": sender_did, "amount": debit,
+                "local": local, "entries": entries, "legs": sorted(legs), "created_at": time.time(),
+            }),
+        )
+
+    def _remote_line(self, txid, entry, legs):
+        legs.setdefault(shard_of(entry["receiver_did"], self.shards), []).append(entry)
+        return {**entry, "txid": txid, "leg": "debit"}
+
+    def op_prepare_transfer(self, txid, caller, receiver_did, receiver, amount):
+        """Phase 1 d'un transfert simple vers un autre shard ; renvoie les lignes par shard."""
+        sender_did, minor = self.accounts.check_transfer(caller, receiver_did, amount)
+        with self.txm.locked(sender_did):
+            self.accounts.check_funds(caller, receiver, minor)
+            legs = {}
+            entry = {"type": ledger.TRANSFER, "sender": caller.username, "receiver": receiver, "currency": "USDT",
+                     "amount": amount, "sender_did": sender_did, "receiver_did": receiver_did}
+            entries = [self._remote_line(txid, entry, legs)]
+            seq = self._reserve(txid, caller.username, sender_did, minor, {}, entries, legs)
+        self.store.wait(seq)
+        return legs
+
+    def op_prepare_debit(self, txid, caller, transfers, mode, remote):
+        """Phase 1 d'un lot : valide les lignes comme AccountService.transfer_batch.
+
+        `remote` : {DID: nom} des destinataires existants des autres shards.
+        Sans ligne distante acceptée, le lot est appliqué tout de suite.
+        Renvoie {"summary": réponse du lot, "legs": {shard: lignes}}.
+        """
+        sender_did = self.accounts.account(caller)["did"]
+        if not transfers:
+            raise ShardError(400, "Aucun transfert fourni.")
+        username = caller.username
+        dids = {sender_did}.union(did for did, _ in transfers if did not in remote)
+
+        with self.txm.locked(*dids):
+            self.accounts.account(caller)
+            debit, credits, entries, results = self.accounts.plan_batch(
+                username, sender_did, transfers, lambda did: self.store.by_did.get(did) or remote.get(did))
+            if mode == "atomic" and len(entries) < len(results):
+                refuse_batch(results)
+
+            legs = {}
+            local = {}
+            lines = []
+            for record in entries:
+                entry = record["entry"]
+                if entry["receiver_did"] in remote:
+                    lines.append(self._remote_line(txid, entry, legs))
+                else:
+                    minor = balances.to_minor(STABLECOIN, entry["amount"])
+                    local[entry["receiver"]] = local.get(entry["receiver"], 0) + minor
+                    lines.append(entry)
+            if not legs:
+                seq = self.accounts.commit_batch(username, debit, credits, entries) if credits else None
+            else:
+                seq = self._reserve(txid, username, sender_did, debit, local, lines, legs)
+        if seq is not None:
+            self.store.wait(seq)
+        return {"summary": batch_summary(results, debit), "legs": legs}
+
+    def op_prepare_credit(self, txid, lines, coordinator):
+        with self.store.lock:
+            for line in lines:
+                if self.store.by_did.get(line["receiver_did"]) != line["receiver"]:
+                    raise ShardError(404, "Destinataire non trouvé.")
+            seq = self.store.submit(storage.put_kv(INTENTS, txid, {
+                "role": "credit", "state": PREPARED, "lines": lines, "peer_shard": coordinator,
+                "created_at": time.time(),
+            }))
+        self.store.wait(seq)
+
+    def op_commit_debit(self, txid):
+        intent = self._intent(txid)
+        if intent is None or intent["state"] == ABORTED:
+            raise ShardError(409, "Transfert annulé (délai dépassé).")
+        if intent["state"] == COMMITTED:
+            return
+        dids = [self.store.users[u]["did"] for u in intent["local"] if u in self.store.users]
+        with self.txm.locked(*dids):
+            with self.store.lock:
+                intent = self._intent(txid)
+                if intent is None or intent["state"] == ABORTED:
+                    raise ShardError(409, "Transfert annulé (délai dépassé).")
+                if intent["state"] == COMMITTED:
+                    return
+                table = self.store.balances
+                records = [storage.set_balance(receiver, balance_stablecoin=balances.from_minor(
+                               STABLECOIN, table.get(receiver, STABLECOIN) + minor))
+                           for receiver, minor in intent["local"].items()]
+                records.extend(storage.append_ledger(dict(e)) for e in intent["entries"])
+                records.append(storage.put_kv(INTENTS, txid, {
+                    "role": "debit", "state": COMMITTED, "account": intent["account"], "did": intent["did"],
+                    "legs": intent["legs"], "created_at": intent["created_at"], "committed_at": time.time(),
+                }))
+                seq = self.store.submit(*records)
+                self.transfers["cross"] += 1
+        self.store.wait(seq)
+
+    def op_commit_credit(self, txid):
+        intent = self._intent(txid)
+        if intent is None:
+            return  # Déjà appliqué
+        with self.txm.locked(*{line["receiver_did"] for line in intent["lines"]}):
+            with self.store.lock:
+                intent = self._intent(txid)
+                if intent is None:
+                    return
+                credits = {}
+                for line in intent["lines"]:
+                    credits[line["receiver"]] = (credits.get(line["receiver"], 0)
+                                                 + balances.to_minor(STABLECOIN, line["amount"]))
+                table = self.store.balances
+                records = [storage.set_balance(receiver, balance_stablecoin=balances.from_minor(
+                               STABLECOIN, table.get(receiver, STABLECOIN) + minor))
+                           for receiver, minor in credits.items()]
+                records.extend(storage.append_ledger({**line, "txid": txid, "leg": "credit"})
+                               for line in intent["lines"])
+                records.append(storage.put_kv(INTENTS, txid, None))
+                seq = self.store.submit(*records)
+        self.store.wait(seq)
+
+    def op_abort(self, txid):
+        intent = self._intent(txid)
+        if intent is None:
+            return
+        with self.txm.locked(*([intent["did"]] if intent["role"] == "debit" else [])):
+            with self.store.lock:
+                intent = self._intent(txid)
+                if intent is None:
+                    return
+                if intent["state"] == COMMITTED:
+                    raise ShardError(409, "Transfert déjà validé.")
+                records = [storage.put_kv(INTENTS, txid, None)]
+                if intent["role"] == "debit":
+                    account = intent["account"]
+                    records.insert(0, storage.set_balance(account, balance_stablecoin=balances.from_minor(
+                        STABLECOIN, self.store.balances.get(account, STABLECOIN) + intent["amount"])))
+                seq = self.store.submit(*records)
+                self.transfers["aborted"] += 1
+        self.store.wait(seq)
+
+    def op_intent_state(self, txid):
+        """État de la décision côté expéditeur ; intention inconnue = abandon."""
+        intent = self._intent(txid)
+        return intent["state"] if intent else ABORTED
+
+    def op_forget(self, txid, shard):
+        """Crédit appliqué sur `shard` : l'intention validée n'a plus à le suivre."""
+        with self.store.lock:
+            intent = self._intent(txid)
+            if intent is None or intent["state"] != COMMITTED or shard not in intent["legs"]:
+                return
+            legs = [leg for leg in intent["legs"] if leg != shard]
+            seq = self.store.submit(storage.put_kv(INTENTS, txid, {**intent, "legs": legs} if legs else None))
+        self.store.wait(seq)
+
+    # 📡 Écritures durables servies aux workers HTTP
+    def _party_balances(self, entry):
+        """Soldes {DID: champs} des comptes du shard concernés par l'écriture."""
+        fields = {}
+        for username, did in parties(entry):
+            user = self.store.users.get(username)
+            if user is not None and did in (None, user["did"]):
+                fields[user["did"]] = self.store.balances.as_fields(username)
+        return fields
+
+    def op_events_after(self, after_id, timeout):
+        """Attend des écritures publiées d'id > `after_id` ; None : renvoie seulement le dernier id."""
+        bus = self.accounts.event_bus
+        if after_id is None:
+            return {"last_id": bus.last_id, "events": []}
+        last_id = bus.wait(after_id, timeout)
+        with self.store.lock:
+            entries = self.store.transactions[after_id:min(last_id, after_id + EVENTS_BATCH)]
+            events = [(e, self._party_balances(e)) for e in entries]
+        return {"last_id": entries[-1]["id"] if entries else after_id, "events": events}
+
+    def op_replay(self, did, after_id, limit):
+        with self.store.lock:
+            return [(e, self._party_balances(e).get(did, {}))
+                    for e, _ in self.accounts.event_bus.replay(did, after_id, limit)]
+
+    def op_stats(self):
+        with self.store.lock:
+            intents = self.store.kv.get(INTENTS, {})
+            return {
+                "shard": self.index,
+                "accounts": len(self.store.users),
+                "total_supply_stablecoin": balances.from_minor(STABLECOIN, self.store.balances.total_supply(STABLECOIN)),
+                "pending_intents": sum(1 for i in intents.values() if i["state"] == PREPARED),
+                "open_intents": len(intents),
+                "pending_claims": sum(1 for ns in (CLAIMS, PHONES) for c in self.store.kv.get(ns, {}).values()
+                                      if isinstance(c, dict) and c["state"] == PENDING),
+                "transfers": dict(self.transfers),
+            }
+
+    # ⏱️ Résolution des intentions et réservations orphelines
+    def _resolve_loop(self):
+        while True:
+            time.sleep(min(1.0, PREPARE_TIMEOUT / 2))
+            try:
+                self._resolve()
+            except Exception as e:
+                logger.error("❌ Résolution des opérations en suspens (shard %d) : %s", self.index, e)
+
+    def _resolve(self):
+        deadline = time.time() - PREPARE_TIMEOUT
+        with self.store.lock:
+            intents = [(txid, dict(intent)) for txid, intent in self.store.kv.get(INTENTS, {}).items()
+                       if intent.get("committed_at", intent["created_at"]) < deadline]
+            claims = [(namespace, key, dict(claim)) for namespace in (CLAIMS, PHONES)
+                      for key, claim in self.store.kv.get(namespace, {}).items()
+                      if isinstance(claim, dict) and claim["state"] == PENDING and claim["at"] < deadline]
+        for txid, intent in intents:
+            try:
+                self._resolve_intent(txid, intent)
+            except AccountError as e:
+                logger.warning("⚠️ Transfert %s non résolu : %s", txid, e.detail)
+        for namespace, key, claim in claims:
+            try:
+                outcome = self.peers.call(shard_of(claim["did"], self.shards), "settle_claim", did=claim["did"],
+                                          claim_id=claim["claim"], phone_number=key if namespace == PHONES else None)
+                if outcome == "created":
+                    self.op_activate(namespace, key, claim["claim"])
+                else:
+                    self.op_release(namespace, key, claim["did"], claim["claim"])
+                logger.info("🔁 Réservation %s résolue (%s)", claim["claim"], outcome)
+            except AccountError as e:
+                logger.warning("⚠️ Réservation %s non résolue : %s", claim["claim"], e.detail)
+
+    def _resolve_intent(self, txid, intent):
+        if intent["role"] == "debit":
+            if intent["state"] == PREPARED:
+                # Point de décision : pas de commit dans le délai -> abandon
+                self.op_abort(txid)
+            else:
+                # Décision validée, crédits non confirmés : on les rejoue (idempotents)
+                for shard in intent["legs"]:
+                    self.peers.call(shard, "commit_credit", txid=txid)
+                    self.op_forget(txid, shard)
+            logger.info("🔁 Transfert %s résolu (%s)", txid, intent["state"])
+            return
+        state = self.peers.call(intent["peer_shard"], "intent_state", txid=txid)
+        if state == COMMITTED:
+            self.op_commit_credit(txid)
+            self.peers.call(intent["peer_shard"], "forget", txid=txid, shard=self.index)
+        elif state == ABORTED:
+            self.op_abort(txid)
+        logger.info("🔁 Transfert %s résolu (%s)", txid, state)
+
+
+# 🧭 Client des shards (dans chaque worker HTTP)
+class ShardRouter:
+    """Route les opérations vers un shard ; une petite réserve de connexions
+    par shard est réutilisée entre les requêtes."""
+
+    def __init__(self, shards, directory=SHARD_DIR, pool_size=16):
+        self.shards = shards
+        self.directory = directory
+        self.pool_size = pool_size
+        self._idle = [queue.LifoQueue() for _ in range(shards)]
+
+    def shard_for(self, key):
+        return shard_of(key, self.shards)
+
+    def call(self, index, op, **kwargs):
+        try:
+            conn = self._idle[index].get_nowait()
+        except queue.Empty:
+            try:
+                conn = Client(socket_path(index, self.directory), family="AF_UNIX", authkey=AUTHKEY)
+            except OSError:
+                raise ShardError(503, f"Shard {index} injoignable.")
+        try:
+            conn.send((op, kwargs))
+            if not conn.poll(CALL_TIMEOUT):
+                raise TimeoutError()
+            reply = conn.recv()
+        except (OSError, EOFError, TimeoutError):
+            conn.close()
+            raise ShardError(503, f"Shard {index} injoignable.")
+        if self._idle[index].qsize() < self.pool_size:
+            self._idle[index].put(conn)
+        else:
+            conn.close()
+        if reply[0] == "error":
+            raise ShardError(reply[1], reply[2])
+        return reply[1]
+
+    def call_all(self, op, **kwargs):
+        return [self.call(index, op, **kwargs) for index in range(self.shards)]
+
+    def stats(self):
+        return self.call_all("stats")
+
+    def close(self):
+        for idle in self._idle:
+            while not idle.empty():
+                idle.get_nowait().close()
+
+
+# 📡 Flux /events/ d'un worker en mode multi-processus
+class ShardEventBus(EventBus):
+    """Abonnés du worker alimentés par les shards.
+
+    Un thread par shard (démarré au premier abonné d'un compte du shard)
+    attend ses écritures durables (`events_after`) et les publie avec les
+    soldes des comptes du shard : un abonné ne reçoit que les écritures du
+    shard de son compte, dont les ids se suivent. `Last-Event-ID` est rejoué
+    par ce même shard.
+    """
+
+    def __init__(self, router, queue_size=1000, replay_limit=1000):
+        super().__init__(None, None, queue_size, replay_limit)
+        self.router = router
+        self._pumps = set()
+
+    def subscribe(self, username, did):
+        index = self.router.shard_for(did)
+        with self._lock:
+            start = index not in self._pumps
+            self._pumps.add(index)
+        if start:
+            threading.Thread(target=self._pump, args=(index,), name=f"events-shard-{index}", daemon=True).start()
+        return super().subscribe(username, did)
+
+    def _pump(self, index):
+        after_id = None
+        while True:
+            try:
+                reply = self.router.call(index, "events_after", after_id=after_id, timeout=HEARTBEAT)
+            except ShardError as e:
+                logger.warning("⚠️ Événements du shard %d indisponibles : %s", index, e.detail)
+                time.sleep(1)
+                continue
+            self.publish(reply["events"])
+            after_id = reply["last_id"]
+
+    def balances(self, username, did):
+        return {}
+
+    async def _replay(self, subscription, after_id):
+        return await asyncio.to_thread(self.router.call, self.router.shard_for(subscription.did), "replay",
+                                       did=subscription.did, after_id=after_id, limit=self.replay_limit + 1)
+
+
+# 🧭 Comptes répartis entre shards (dans chaque worker HTTP)
+class ShardedAccounts:
+    """Mêmes méthodes que accounts.AccountService, sur des comptes répartis.
+
+    Un compte vit sur le shard de son DID. Son nom et chacun de ses numéros
+    sont réservés sur le shard de la clé, en deux temps : réservation en
+    attente, création du compte, activation. Si le worker tombe entre les
+    deux, le shard de la réservation la tranche après
+    TRANSFERZ_2PC_TIMEOUT s : compte créé -> activée ; sinon le shard du
+    compte clôt la réservation (une création en retard sera refusée) et
+    elle est libérée.
+    """
+
+    def __init__(self, router):
+        self.router = router
+        # 📡 Écritures durables des shards poussées aux abonnés de /events/ de ce worker
+        self.event_bus = ShardEventBus(router)
+
+    def close(self):
+        self.router.close()
+
+    def _shard(self, key):
+        return self.router.shard_for(key)
+
+    def _lookup(self, namespace, key, pending=False):
+        return self.router.call(self._shard(key), "lookup", namespace=namespace, key=key, pending=pending)
+
+    def _did(self, username, detail="Utilisateur introuvable"):
+        did = self._lookup(CLAIMS, username)
+        if did is None:
+            raise ShardError(404, detail)
+        return did
+
+    def _caller(self, caller):
+        # Token émis avant l'ajout du claim `did` : DID retrouvé par le nom
+        if caller.did is None:
+            return Caller(caller.username, self._did(caller.username, "Utilisateur non trouvé."))
+        return caller
+
+    def _on_account(self, caller, op, **kwargs):
+        caller = self._caller(caller)
+        return self.router.call(self._shard(caller.did), op, caller=caller, **kwargs)
+
+    def _quietly(self, index, op, **kwargs):
+        try:
+            self.router.call(index, op, **kwargs)
+        except ShardError as e:
+            # Le résolveur du shard s'en chargera
+            logger.warning("⚠️ %s différé sur le shard %d : %s", op, index, e.detail)
+
+    # 🏷️ Réservations
+    def _claim(self, namespace, key, did):
+        """Réserve `key` pour `did` ; renvoie l'id de réservation ou lève un 400."""
+        taken = USERNAME_TAKEN if namespace == CLAIMS else PHONE_TAKEN
+        index = self._shard(key)
+        claim_id = uuid.uuid4().hex
+        replace = None
+        for _ in range(2):
+            current = self.router.call(index, "claim", namespace=namespace, key=key, did=did,
+                                       claim_id=claim_id, replace=replace)
+            if current is None:
+                return claim_id
+            if current["did"] == did:
+                raise ShardError(400, "Numéro déjà lié à votre compte." if namespace == PHONES else taken)
+            if current["state"] == PENDING and current["at"] > time.time() - PREPARE_TIMEOUT:
+                raise ShardError(400, taken)
+            # Réservation ancienne : création aboutie ou abandonnée ?
+            outcome = self.router.call(self._shard(current["did"]), "settle_claim", did=current["did"],
+                                       claim_id=current["claim"], phone_number=key if namespace == PHONES else None)
+            if outcome == "created":
+                if current["state"] == PENDING:
+                    self._quietly(index, "activate", namespace=namespace, key=key, claim_id=current["claim"])
+                raise ShardError(400, taken)
+            replace = current
+        raise ShardError(400, taken)
+
+    def _claimed(self, did, keys, create):
+        """Réserve les clés [(espace, clé)], exécute `create(ids)` puis active les réservations."""
+        claims = {}
+        try:
+            for namespace, key in keys:
+                claims[namespace, key] = self._claim(namespace, key, did)
+            create(list(claims.values()))
+        except ShardError as e:
+            # Refus certain : réservations libérées ; sinon le résolveur tranchera
+            if e.status < 500:
+                for (namespace, key), claim_id in claims.items():
+                    self._quietly(self._shard(key), "release", namespace=namespace, key=key, did=did,
+                                  claim_id=claim_id)
+            raise
+        for (namespace, key), claim_id in claims.items():
+            self._quietly(self._shard(key), "activate", namespace=namespace, key=key, claim_id=claim_id)
+
+    # 👤 Comptes
+    def exists(self, username):
+        return self._lookup(CLAIMS, username, pending=True) is not None
+
+    def conflicts(self, rows):
+        return [USER_EXISTS if self._lookup(CLAIMS, username, pending=True) is not None
+                else PHONE_TAKEN if self._lookup(PHONES, phone_number, pending=True) is not None else None
+                for username, phone_number in rows]
+
+    def credentials(self, username):
+        did = self._lookup(CLAIMS, username)
+        if did is None:
+            return None
+        credentials = self.router.call(self._shard(did), "credentials", username=username)
+        return credentials if credentials is not None and credentials[0] == did else None
+
+    def create_account(self, username, user, source=None):
+        did = user["did"]
+        keys = [(CLAIMS, username)] + [(PHONES, p) for p in user.get("phone_numbers", [])]
+        self._claimed(did, keys, lambda claims: self.router.call(
+            self._shard(did), "create_account", username=username, user=user, source=source, claims=claims))
+
+    def import_accounts(self, rows, source="bulk_import"):
+        # Un compte à la fois : chaque création réserve son nom et ses numéros
+        errors = []
+        for number, username, user in rows:
+            try:
+                self.create_account(username, user, source)
+            except ShardError as e:
+                errors.append((number, USER_EXISTS if e.detail == USERNAME_TAKEN else e.detail))
+        return errors
+
+    def delete_account(self, username):
+        did = self._did(username)
+        deleted = self.router.call(self._shard(did), "delete_account", username=username, did=did)
+        self._quietly(self._shard(username), "release", namespace=CLAIMS, key=username, did=did)
+        for phone_number in deleted["phone_numbers"]:
+            self._quietly(self._shard(phone_number), "release", namespace=PHONES, key=phone_number, did=did)
+        return deleted
+
+    def set_balances(self, username, balance_fcfa, balance_stablecoin):
+        self.router.call(self._shard(self._did(username)), "set_balances", username=username,
+                         balance_fcfa=balance_fcfa, balance_stablecoin=balance_stablecoin)
+
+    # 📊 Agrégats des soldes : histogramme sur les bornes globales, puis somme des shards
+    def balances_summary(self, currency, top, bins):
+        bounds = [b for b in self.router.call_all("balance_range", currency=currency) if b is not None]
+        value_range = (min(lo for lo, _ in bounds), max(hi for _, hi in bounds)) if bounds else None
+        parts = self.router.call_all("balance_aggregates", currency=currency, top=top, bins=bins,
+                                     value_range=value_range)
+        counts = [sum(column) for column in zip(*(p["counts"] for p in parts))]
+        return balances_report(currency, {
+            "accounts": sum(p["accounts"] for p in parts),
+            "supply": {c: sum(p["supply"][c] for p in parts) for c in balances.CURRENCIES},
+            "top": heapq.nlargest(top, (h for p in parts for h in p["top"]), key=lambda h: h[1]),
+            "counts": counts,
+            "edges": next((p["edges"] for p in parts if p["edges"]), []),
+        })
+
+    def velocity_usage(self, username):
+        return self.router.call(self._shard(self._did(username, "Utilisateur non trouvé.")), "velocity_usage",
+                                username=username)
+
+    def reconciliation(self, full=False, limit=100):
+        reports = self.router.call_all("reconciliation", full=full, limit=limit)
+        checks = [r["last_check"] for r in reports]
+        audits = [r["last_audit"] for r in reports]
+        return {
+            "discrepancy_count": sum(r["discrepancy_count"] for r in reports),
+            "discrepancies": [d for r in reports for d in r["discrepancies"]][:limit],
+            "totals": {c: {key: balances.from_minor(c, sum(balances.to_minor(c, r["totals"][c][key]) for r in reports))
+                           for key in ("stored", "expected", "net_issued")} for c in balances.CURRENCIES},
+            "pending_accounts": sum(r["pending_accounts"] for r in reports),
+            "checks": sum(r["checks"] for r in reports),
+            "accounts_checked": sum(r["accounts_checked"] for r in reports),
+            # Le plus ancien des shards : tout le système a été vérifié depuis
+            "last_check": None if None in checks else min(checks),
+            "last_audit": None if None in audits else min(audits),
+        }
+
+    def gauges(self):
+        parts = self.router.call_all("gauges")
+        settled = {}
+        tracked = {}
+        for p in parts:
+            for status, count in p["deposits_settled"].items():
+                settled[status] = settled.get(status, 0) + count
+            for rule, count in p["velocity_tracked"].items():
+                tracked[rule] = tracked.get(rule, 0) + count
+        return {
+            "total_supply": {c: sum(p["total_supply"][c] for p in parts) for c in balances.CURRENCIES},
+            "discrepancies": sum(p["discrepancies"] for p in parts),
+            "deposit_queue_depth": sum(p["deposit_queue_depth"] for p in parts),
+            "deposits_settled": settled,
+            "velocity_tracked": tracked,
+        }
+
+    # 👤 Compte de l'appelant (sur le shard de son DID)
+    def profile(self, caller, transactions=10):
+        return self._on_account(caller, "profile", transactions=transactions)
+
+    def account_did(self, caller):
+        return self._on_account(caller, "account_did")
+
+    def phones(self, caller):
+        return self._on_account(caller, "phones")
+
+    def add_phone(self, caller, phone_number):
+        caller = self._caller(caller)
+        self._claimed(caller.did, [(PHONES, phone_number)], lambda claims: self.router.call(
+            self._shard(caller.did), "add_phone", caller=caller, phone_number=phone_number, claim_id=claims[0]))
+
+    # 📌 Annuaire des DID
+    def lookup(self, username=None, phone_number=None):
+        if username is not None:
+            return self._lookup(CLAIMS, username)
+        return self._lookup(PHONES, phone_number)
+
+    def users_etag(self):
+        return ".".join(self.router.call_all("users_etag"))
+
+    def did_page(self, cursor, q, match, limit):
+        pages = self.router.call_all("did_page", cursor=cursor, q=q, match=match, limit=limit)
+        return list(heapq.merge(*pages))[:limit + 1]
+
+    def history(self, caller, **kwargs):
+        return self._on_account(caller, "history", **kwargs)
+
+    def create_deposit(self, caller, phone_number, amount, operator, key):
+        return self._on_account(caller, "create_deposit", phone_number=phone_number, amount=amount,
+                                operator=operator, key=key)
+
+    def deposit(self, caller, deposit_id):
+        return self._on_account(caller, "deposit", deposit_id=deposit_id)
+
+    # 🔄 Transferts : en un appel sur un shard, sinon commit à deux phases
+    def transfer(self, caller, receiver_did, amount):
+        caller = self._caller(caller)
+        s, r = self._shard(caller.did), self._shard(receiver_did)
+        if s == r:
+            return self.router.call(s, "transfer", caller=caller, receiver_did=receiver_did, amount=amount)
+        receiver = self.router.call(r, "resolve_dids", dids=[receiver_did]).get(receiver_did)
+        txid = uuid.uuid4().hex
+        legs = self.router.call(s, "prepare_transfer", txid=txid, caller=caller, receiver_did=receiver_did,
+                                receiver=receiver, amount=amount)
+        self._complete(s, txid, legs)
+
+    def transfer_batch(self, caller, transfers, mode="atomic"):
+        caller = self._caller(caller)
+        s = self._shard(caller.did)
+        remote_dids = {}
+        for receiver_did, _ in transfers:
+            r = self._shard(receiver_did)
+            if r != s:
+                remote_dids.setdefault(r, set()).add(receiver_did)
+        if not remote_dids:
+            return self.router.call(s, "transfer_batch", caller=caller, transfers=transfers, mode=mode)
+
+        remote = {}
+        for r, dids in remote_dids.items():
+            remote.update(self.router.call(r, "resolve_dids", dids=sorted(dids)))
+        txid = uuid.uuid4().hex
+        plan = self.router.call(s, "prepare_debit", txid=txid, caller=caller, transfers=transfers,
+                                mode=mode, remote=remote)
+        self._complete(s, txid, plan["legs"])
+        return plan["summary"]
+
+    def _complete(self, s, txid, legs):
+        """Phases 2 du transfert `txid` préparé sur le shard `s` (lignes par shard destinataire)."""
+        if not legs:
+            return
+        try:
+            for r, lines in legs.items():
+                self.router.call(r, "prepare_credit", txid=txid, lines=lines, coordinator=s)
+        except ShardError:
+            for r in [*legs, s]:
+                self._quietly(r, "abort", txid=txid)
+            raise
+
+        try:
+            self.router.call(s, "commit_debit", txid=txid)
+        except ShardError as e:
+            if e.status == 409:
+                for r in legs:
+                    self._quietly(r, "abort", txid=txid)
+            # Sinon décision inconnue : les shards des destinataires interrogeront l'expéditeur
+            raise
+
+        # Décision prise : les crédits finiront par être appliqués (ici ou par le résolveur)
+        for r in legs:
+            try:
+                self.router.call(r, "commit_credit", txid=txid)
+                self.router.call(s, "forget", txid=txid, shard=r)
+            except ShardError as e:
+                logger.warning("⚠️ Crédit %s différé : %s", txid, e.detail)
+
+
+# 🚀 Lancement des shards
+def _run_shard(index, shards, directory):
+    from logging_setup import setup_logging
+
+    setup_logging()
+    # SIGTERM -> SystemExit : atexit ferme le store (snapshot / WAL propre)
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    server = ShardServer(index, shards, directory)
+    atexit.register(server.close)
+    server.serve()
+
+
+def start_shards(shards, directory=SHARD_DIR, timeout=60):
+    """Démarre un processus par shard et attend que leurs sockets répondent."""
+    os.makedirs(directory, exist_ok=True)
+    for index in range(shards):
+        if os.path.exists(socket_path(index, directory)):
+            os.unlink(socket_path(index, directory))
+    ctx = multiprocessing.get_context("spawn")
+    processes = [ctx.Process(target=_run_shard, args=(index, shards, directory), name=f"shard-{index}")
+                 for index in range(shards)]
+    for process in processes:
+        process.start()
+
+    router = ShardRouter(shards, directory)
+    deadline = time.time() + timeout
+    for index in range(shards):
+        while True:
+            try:
+                router.call(index, "stats")
+                break
+            except ShardError:
+                if time.time() > deadline or not processes[index].is_alive():
+                    stop_shards(processes)
+                    raise RuntimeError(f"Le shard {index} n'a pas démarré")
+                time.sleep(0.05)
+    router.close()
+    return processes
+
+
+def stop_shards(processes, timeout=10):
+    for process in processes:
+        if process.is_alive():
+            process.terminate()
+    for process in processes:
+        process.join(timeout)
@@ -0,0 +1,242 @@
+import json
+import queue
+import sqlite3
+import logging
+import threading
+from contextlib import contextmanager
+
+import storage
+from balances import CURRENCIES, FIELDS, to_minor, from_minor
+
+logger = logging.getLogger("transferz.sqlite")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    username TEXT PRIMARY KEY,
+    did TEXT NOT NULL UNIQUE,
+    password TEXT NOT NULL,
+    private_key TEXT NOT NULL DEFAULT '',
+    blockchain_address TEXT NOT NULL DEFAULT '',
+    balance_fcfa INTEGER NOT NULL DEFAULT 0,
+    balance_stablecoin INTEGER NOT NULL DEFAULT 0,
+    extra TEXT
+);
+CREATE INDEX IF NOT EXISTS users_address ON users(blockchain_address);
+CREATE TABLE IF NOT EXISTS phones (
+    phone_number TEXT PRIMARY KEY,
+    username TEXT NOT NULL,
+    position INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS phones_username ON phones(username, position);
+CREATE TABLE IF NOT EXISTS ledger (
+    id INTEGER PRIMARY KEY,
+    ts REAL NOT NULL,
+    type TEXT NOT NULL,
+    account TEXT,
+    sender TEXT,
+    receiver TEXT,
+    entry TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ledger_account ON ledger(account, id);
+CREATE INDEX IF NOT EXISTS ledger_sender ON ledger(sender, id);
+CREATE INDEX IF NOT EXISTS ledger_receiver ON ledger(receiver, id);
+CREATE TABLE IF NOT EXISTS deposits (
+    id TEXT PRIMARY KEY,
+    username TEXT NOT NULL,
+    idempotency_key TEXT NOT NULL,
+    status TEXT NOT NULL,
+    deposit TEXT NOT NULL,
+    UNIQUE (username, idempotency_key)
+);
+CREATE INDEX IF NOT EXISTS deposits_status ON deposits(status);
+CREATE TABLE IF NOT EXISTS kv (
+    namespace TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    PRIMARY KEY (namespace, key)
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value
+);
+"""
+
+# Requêtes paramétrées : compilées une fois, puis servies par le cache de
+# requêtes préparées de chaque connexion (`cached_statements`)
+UPSERT_USER = """
+INSERT INTO users (username, did, password, private_key, blockchain_address, balance_fcfa, balance_stablecoin, extra)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (username) DO UPDATE SET
+    did = excluded.did, password = excluded.password, private_key = excluded.private_key,
+    blockchain_address = excluded.blockchain_address, balance_fcfa = excluded.balance_fcfa,
+    balance_stablecoin = excluded.balance_stablecoin, extra = excluded.extra
+"""
+DELETE_USER = "DELETE FROM users WHERE username = ?"
+DELETE_PHONES = "DELETE FROM phones WHERE username = ?"
+INSERT_PHONE = """
+INSERT OR REPLACE INTO phones (phone_number, username, position)
+VALUES (?, ?, (SELECT COUNT(*) FROM phones WHERE username = ?))
+"""
+SET_BALANCE = {c: f"UPDATE users SET {FIELDS[c]} = ? WHERE username = ?" for c in CURRENCIES}
+INSERT_LEDGER = "INSERT INTO ledger (id, ts, type, account, sender, receiver, entry) VALUES (?, ?, ?, ?, ?, ?, ?)"
+UPSERT_DEPOSIT = """
+INSERT INTO deposits (id, username, idempotency_key, status, deposit) VALUES (?, ?, ?, ?, ?)
+ON CONFLICT (id) DO UPDATE SET status = excluded.status, deposit = excluded.deposit
+"""
+UPSERT_KV = """
+INSERT INTO kv (namespace, key, value) VALUES (?, ?, ?)
+ON CONFLICT (namespace, key) DO UPDATE SET value = excluded.value
+"""
+DELETE_KV = "DELETE FROM kv WHERE namespace = ? AND key = ?"
+SET_SEQ = "INSERT INTO meta (key, value) VALUES ('seq', ?) ON CONFLICT (key) DO UPDATE SET value = excluded.value"
+
+_USER_COLUMNS = ("password", "did", "private_key", "blockchain_address")
+
+
+# 🏊 Pool de connexions SQLite
+class ConnectionPool:
+    """Connexions réutilisées entre threads (au plus `size`, créées à la demande)."""
+
+    def __init__(self, path, size=4):
+        self.path = path
+        self.size = size
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._all = []
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, cached_statements=256)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=FULL")
+        conn.execute("PRAGMA busy_timeout=5000")
+        self._all.append(conn)
+        return conn
+
+    @contextmanager
+    def connection(self):
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                create = self._created < self.size
+                if create:
+                    self._created += 1
+            conn = self._connect() if create else self._idle.get()
+        try:
+            yield conn
+        finally:
+            self._idle.put(conn)
+
+    def close(self):
+        for conn in self._all:
+            conn.close()
+
+
+# 🗄️ Persistance ligne à ligne dans SQLite (WAL)
+class SqliteBackend:
+    """Backend du store : chaque opération met à jour sa propre ligne.
+
+    Un dépôt modifie une ligne de `users` et ajoute une ligne à `ledger`,
+    au lieu de réécrire tout l'état. Un lot de commits (group commit du
+    store) est écrit dans une seule transaction SQLite.
+    """
+
+    def __init__(self, path, pool_size=4):
+        self.path = path
+        self.lock_path = f"{path}.lock"
+        self.pool = ConnectionPool(path, pool_size)
+        with self.pool.connection() as conn:
+            conn.executescript(SCHEMA)
+
+    def load(self, store):
+        with self.pool.connection() as conn:
+            row = conn.execute("SELECT value FROM meta WHERE key = 'seq'").fetchone()
+            seq = row[0] if row else 0
+
+            phones = {}
+            for phone_number, username in conn.execute(
+                    "SELECT phone_number, username FROM phones ORDER BY username, position"):
+                phones.setdefault(username, []).append(phone_number)
+
+            for row in conn.execute(
+                    "SELECT username, password, did, private_key, blockchain_address, balance_fcfa, "
+                    "balance_stablecoin, extra FROM users"):
+                username = row[0]
+                user = dict(zip(_USER_COLUMNS, row[1:5]))
+                user["phone_numbers"] = phones.get(username, [])
+                for c, value in zip(CURRENCIES, row[5:7]):
+                    user[FIELDS[c]] = from_minor(c, value)
+                if row[7]:
+                    user.update(json.loads(row[7]))
+                store._load_user(username, user)
+
+            store.transactions = [json.loads(entry) for (entry,) in conn.execute("SELECT entry FROM ledger ORDER BY id")]
+            for (deposit,) in conn.execute("SELECT deposit FROM deposits"):
+                store._put_deposit(json.loads(deposit))
+            for namespace, key, value in conn.execute("SELECT namespace, key, value FROM kv"):
+                store._put_kv(namespace, key, json.loads(value))
+        return seq, 0
+
+    # Appelé sous `store.lock` : les enregistrements sont figés au moment du commit
+    def encode(self, seq, records):
+        return records
+
+    def write(self, batch):
+        with self.pool.connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                for _, records in batch:
+                    for record in records:
+                        self._write_record(conn, record)
+                conn.execute(SET_SEQ, (batch[-1][0],))
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+    def _write_record(self, conn, record):
+        op = record["op"]
+        username = record.get("username")
+        if op == storage.PUT_USER:
+            user = record["user"]
+            extra = {k: v for k, v in user.items()
+                     if k not in _USER_COLUMNS and k != "phone_numbers" and k not in FIELDS.values()}
+            conn.execute(UPSERT_USER, (
+                username, user["did"], user["password"], user.get("private_key") or "",
+                user.get("blockchain_address") or "",
+                *(to_minor(c, user.get(FIELDS[c]) or 0) for c in CURRENCIES),
+                json.dumps(extra) if extra else None,
+            ))
+            conn.execute(DELETE_PHONES, (username,))
+            for phone_number in user.get("phone_numbers", []):
+                conn.execute(INSERT_PHONE, (phone_number, username, username))
+        elif op == storage.DELETE_USER:
+            conn.execute(DELETE_USER, (username,))
+            conn.execute(DELETE_PHONES, (username,))
+        elif op == storage.ADD_PHONE:
+            conn.execute(INSERT_PHONE, (record["phone_number"], username, username))
+        elif op == storage.SET_BALANCE:
+            for c in CURRENCIES:
+                if FIELDS[c] in record:
+                    conn.execute(SET_BALANCE[c], (to_minor(c, record[FIELDS[c]]), username))
+        elif op == storage.APPEND_LEDGER:
+            e = record["entry"]
+            conn.execute(INSERT_LEDGER, (e["id"], e["ts"], e["type"], e.get("account"), e.get("sender"),
+                                         e.get("receiver"), json.dumps(e)))
+        elif op == storage.PUT_DEPOSIT:
+            d = record["deposit"]
+            conn.execute(UPSERT_DEPOSIT, (d["id"], d["username"], d["idempotency_key"], d["status"], json.dumps(d)))
+        elif op == storage.PUT_KV:
+            if record["value"] is None:
+                conn.execute(DELETE_KV, (record["namespace"], record["key"]))
+            else:
+                conn.execute(UPSERT_KV, (record["namespace"], record["key"], json.dumps(record["value"])))
+        else:
+            raise storage.StoreError(f"Opération inconnue : {op}")
+
+    def after_write(self, store, count):
+        pass
+
+    def close(self, store, clean=True):
+        self.pool.close()
@@ -1,7 +1,17 @@
 from fastapi import FastAPI, HTTPException
+from fastapi.exceptions import RequestValidationError
 from pydantic import BaseModel
-import json
+from typing import List, Literal, Optional
+import uuid
+import atexit
 from fastapi.middleware.cors import CORSMiddleware
+import storage
+import ledger
+from balances import FCFA, STABLECOIN, MAX_MINOR, to_minor, from_minor
+import amounts
+from amounts import FcfaAmount, StablecoinAmount, FcfaBalance, StablecoinBalance
+from locking import TransactionManager
+from rates import CachedRates, RateUnavailable, default_provider
 
 app = FastAPI()
 
@@ -14,88 +24,226 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Base de données fictive (stockée en JSON)
-DB_FILE = "database.json"
+# Montants et soldes bornés comme dans backend/main.py : 422 plutôt qu'un débordement dans to_minor
+app.add_exception_handler(RequestValidationError, amounts.validation_error)
 
-def load_db():
-    try:
-        with open(DB_FILE, "r") as f:
-            return json.load(f)
-    except FileNotFoundError:
-        return {"users": {}}
+# Store propre au service de conversion (/tmp/database.poc.json ou /tmp/transferz.poc.db) : une base
+# n'a qu'un processus écrivain, backend/main.py garde la sienne. Les comptes sont désignés ici par
+# leur numéro Mobile Money.
+store = storage.open_store(suffix="poc")
+atexit.register(store.close)
+txm = TransactionManager()
+
+def account_of(phone):
+    username = store.by_phone.get(phone)
+    if username is None or username not in store.users:
+        raise HTTPException(status_code=404, detail="Utilisateur non trouvé")
+    return username
 
-def save_db(data):
-    with open(DB_FILE, "w") as f:
-        json.dump(data, f, indent=4)
+def credited_balance(balance, amount):
+    """Solde après crédit, en unités entières ; 400 au-delà de MAX_MINOR (refusé par le store)."""
+    if balance + amount > MAX_MINOR:
+        raise HTTPException(status_code=400, detail="Solde maximal dépassé")
+    return balance + amount
 
 # Modèle utilisateur
 class User(BaseModel):
     phone: str
-    balance_fcfa: float = 0.0
-    balance_stablecoin: float = 0.0
+    balance_fcfa: FcfaBalance = 0
+    balance_stablecoin: StablecoinBalance = 0.0
+
+# Modèles de conversion groupée
+class ConversionItem(BaseModel):
+    phone: str
+    amount: Optional[FcfaAmount] = None  # None : tout le solde FCFA
+
+class BatchConversionRequest(BaseModel):
+    conversions: List[ConversionItem]
+    mode: Literal["atomic", "best_effort"] = "atomic"
 
 # Modèle de transaction
 class Transaction(BaseModel):
     sender: str
     receiver: str
-    amount: float
+    amount: StablecoinAmount
 
 # Endpoint pour ajouter un utilisateur
 @app.post("/add_user/")
 def add_user(user: User):
-    db = load_db()
-    if user.phone in db["users"]:
-        raise HTTPException(status_code=400, detail="Utilisateur déjà existant")
-    db["users"][user.phone] = user.dict()
-    save_db(db)
+    with store.lock:
+        if user.phone in store.by_phone or user.phone in store.users:
+            raise HTTPException(status_code=400, detail="Utilisateur déjà existant")
+        records = [storage.put_user(user.phone, {
+            "password": "",
+            "did": f"did:transferz:{uuid.uuid4()}",
+            "private_key": "",
+            "blockchain_address": "",
+            "phone_numbers": [user.phone],
+            "balance_fcfa": user.balance_fcfa,
+            "balance_stablecoin": user.balance_stablecoin,
+        })]
+        if user.balance_fcfa or user.balance_stablecoin:
+            records.append(ledger.entry(
+                ledger.ADMIN_BALANCE, account=user.phone,
+                balance_fcfa=user.balance_fcfa, balance_stablecoin=user.balance_stablecoin,
+                delta_fcfa=user.balance_fcfa, delta_stablecoin=user.balance_stablecoin,
+            ))
+        seq = store.submit(*records)
+    store.wait(seq)
     return {"message": "Utilisateur ajouté"}
 
 # Endpoint pour effectuer un dépôt
 @app.post("/deposit/")
-def deposit(phone: str, amount: float):
-    db = load_db()
-    if phone not in db["users"]:
-        raise HTTPException(status_code=404, detail="Utilisateur non trouvé")
-    db["users"][phone]["balance_fcfa"] += amount
-    save_db(db)
-    return {"message": "Dépôt réussi", "new_balance": db["users"][phone]["balance_fcfa"]}
+def deposit(phone: str, amount: FcfaAmount):
+    username = account_of(phone)
+    if amount != int(amount):
+        raise HTTPException(status_code=400, detail="Montant invalide")
+    with txm.locked(store.users[username]["did"]):
+        new_balance = credited_balance(store.balances.get(username, FCFA), int(amount))
+        seq = store.submit(
+            storage.set_balance(username, balance_fcfa=new_balance),
+            ledger.entry(ledger.DEPOSIT, account=username, currency="FCFA", amount=int(amount), phone_number=phone),
+        )
+    store.wait(seq)
+    return {"message": "Dépôt réussi", "new_balance": new_balance}
+
+# Taux FCFA -> USDT : fournisseur (TRANSFERZ_RATES_FILE ou taux fixe) derrière un cache TTL
+rates = CachedRates(default_provider())
+
+def current_rate():
+    try:
+        return rates.get("FCFA", "USDT")
+    except RateUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e))
 
-# Endpoint pour convertir en stablecoin
+def _convert_one(username, amount, rate, pending):
+    """Prépare la conversion de `amount` FCFA (tout le solde si None).
+
+    `pending` accumule les soldes déjà convertis dans le même lot.
+    Renvoie (montant FCFA, montant crédité en micro-unités) ou lève ValueError.
+    """
+    fcfa, stable = pending.get(username) or (store.balances.get(username, FCFA),
+                                              store.balances.get(username, STABLECOIN))
+    amount_fcfa = fcfa if amount is None else amount
+    if amount_fcfa <= 0 or amount_fcfa != int(amount_fcfa):
+        raise ValueError("Solde insuffisant" if amount is None else "Montant invalide")
+    if amount_fcfa > fcfa:
+        raise ValueError("Solde insuffisant")
+    amount_fcfa = int(amount_fcfa)
+    credited = to_minor(STABLECOIN, amount_fcfa * rate.value)
+    if stable + credited > MAX_MINOR:
+        raise ValueError("Solde maximal dépassé")
+    pending[username] = (fcfa - amount_fcfa, stable + credited)
+    return amount_fcfa, credited
+
+def _conversion_records(pending, entries):
+    records = [storage.set_balance(username, balance_fcfa=fcfa, balance_stablecoin=from_minor(STABLECOIN, stable))
+               for username, (fcfa, stable) in pending.items()]
+    records.extend(entries)
+    return records
+
+def _conversion_entry(username, amount_fcfa, credited, rate):
+    return ledger.entry(ledger.CONVERSION, account=username, rate=rate.value,
+                        delta_fcfa=-amount_fcfa, delta_stablecoin=from_minor(STABLECOIN, credited))
+
+# Endpoint pour convertir en stablecoin (tout le solde, ou `amount` FCFA)
 @app.post("/convert/")
-def convert(phone: str):
-    db = load_db()
-    if phone not in db["users"]:
-        raise HTTPException(status_code=404, detail="Utilisateur non trouvé")
-    rate = 0.0016  # Exemple de taux de conversion FCFA -> USDT
-    amount_fcfa = db["users"][phone]["balance_fcfa"]
-    if amount_fcfa <= 0:
-        raise HTTPException(status_code=400, detail="Solde insuffisant")
-    db["users"][phone]["balance_stablecoin"] += amount_fcfa * rate
-    db["users"][phone]["balance_fcfa"] = 0
-    save_db(db)
-    return {"message": "Conversion réussie", "new_balance": db["users"][phone]["balance_stablecoin"]}
+def convert(phone: str, amount: Optional[FcfaAmount] = None):
+    username = account_of(phone)
+    rate = current_rate()
+    pending = {}
+    with txm.locked(store.users[username]["did"]):
+        try:
+            amount_fcfa, credited = _convert_one(username, amount, rate, pending)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        seq = store.submit(*_conversion_records(pending, [_conversion_entry(username, amount_fcfa, credited, rate)]))
+    store.wait(seq)
+    return {"message": "Conversion réussie", "rate": rate.value,
+            "new_balance": from_minor(STABLECOIN, pending[username][1])}
+
+# Endpoint pour convertir plusieurs comptes au même taux, en un seul commit
+@app.post("/convert/batch/")
+def convert_batch(data: BatchConversionRequest):
+    if not data.conversions:
+        raise HTTPException(status_code=400, detail="Aucune conversion fournie")
+    rate = current_rate()
+    usernames = [store.by_phone.get(item.phone) for item in data.conversions]
+    dids = {store.users[u]["did"] for u in usernames if u in store.users}
+
+    with txm.locked(*dids):
+        pending = {}
+        entries = []
+        results = []
+        for index, (item, username) in enumerate(zip(data.conversions, usernames)):
+            try:
+                if username not in store.users:
+                    raise ValueError("Utilisateur non trouvé")
+                amount_fcfa, credited = _convert_one(username, item.amount, rate, pending)
+            except ValueError as e:
+                results.append({"index": index, "phone": item.phone, "status": "rejected", "detail": str(e)})
+                continue
+            entries.append(_conversion_entry(username, amount_fcfa, credited, rate))
+            results.append({"index": index, "phone": item.phone, "status": "ok",
+                            "amount_fcfa": amount_fcfa, "credited_stablecoin": from_minor(STABLECOIN, credited)})
+
+        rejected = sum(1 for r in results if r["status"] == "rejected")
+        if rejected and data.mode == "atomic":
+            for r in results:
+                if r["status"] == "ok":
+                    r["status"] = "not_applied"
+            raise HTTPException(status_code=400, detail={
+                "message": "Conversion groupée refusée : aucune ligne appliquée.",
+                "results": results,
+            })
+        seq = store.submit(*_conversion_records(pending, entries)) if entries else None
+    if seq is not None:
+        store.wait(seq)
+    return {"message": "Conversion groupée traitée", "rate": rate.value,
+            "applied": len(results) - rejected, "rejected": rejected, "results": results}
+
+@app.get("/rates/")
+def rates_stats():
+    return rates.stats()
 
 # Endpoint pour transfert P2P
 @app.post("/transfer/")
 def transfer(transaction: Transaction):
-    db = load_db()
-    if transaction.sender not in db["users"] or transaction.receiver not in db["users"]:
+    sender, receiver = store.by_phone.get(transaction.sender), store.by_phone.get(transaction.receiver)
+    if sender not in store.users or receiver not in store.users:
         raise HTTPException(status_code=404, detail="Expéditeur ou destinataire non trouvé")
-    if db["users"][transaction.sender]["balance_stablecoin"] < transaction.amount:
-        raise HTTPException(status_code=400, detail="Solde insuffisant")
-    db["users"][transaction.sender]["balance_stablecoin"] -= transaction.amount
-    db["users"][transaction.receiver]["balance_stablecoin"] += transaction.amount
-    save_db(db)
+    amount = to_minor(STABLECOIN, transaction.amount)
+    if amount <= 0 or sender == receiver:
+        raise HTTPException(status_code=400, detail="Montant invalide")
+    with txm.locked(store.users[sender]["did"], store.users[receiver]["did"]):
+        balance = store.balances.get(sender, STABLECOIN)
+        if balance < amount:
+            raise HTTPException(status_code=400, detail="Solde insuffisant")
+        received = credited_balance(store.balances.get(receiver, STABLECOIN), amount)
+        seq = store.submit(
+            storage.set_balance(sender, balance_stablecoin=from_minor(STABLECOIN, balance - amount)),
+            storage.set_balance(receiver, balance_stablecoin=from_minor(STABLECOIN, received)),
+            ledger.entry(ledger.TRANSFER, sender=sender, receiver=receiver, currency="USDT",
+                         amount=from_minor(STABLECOIN, amount)),
+        )
+    store.wait(seq)
     return {"message": "Transfert réussi"}
 
 # Endpoint pour retrait
 @app.post("/withdraw/")
-def withdraw(phone: str, amount: float):
-    db = load_db()
-    if phone not in db["users"]:
-        raise HTTPException(status_code=404, detail="Utilisateur non trouvé")
-    if db["users"][phone]["balance_stablecoin"] < amount:
-        raise HTTPException(status_code=400, detail="Solde insuffisant")
-    db["users"][phone]["balance_stablecoin"] -= amount
-    save_db(db)
+def withdraw(phone: str, amount: StablecoinAmount):
+    username = account_of(phone)
+    amount = to_minor(STABLECOIN, amount)
+    if amount <= 0:
+        raise HTTPException(status_code=400, detail="Montant invalide")
+    with txm.locked(store.users[username]["did"]):
+        balance = store.balances.get(username, STABLECOIN)
+        if balance < amount:
+            raise HTTPException(status_code=400, detail="Solde insuffisant")
+        seq = store.submit(
+            storage.set_balance(username, balance_stablecoin=from_minor(STABLECOIN, balance - amount)),
+            ledger.entry(ledger.WITHDRAWAL, account=username, phone_number=phone,
+                         delta_stablecoin=-from_minor(STABLECOIN, amount)),
+        )
+    store.wait(seq)
     return {"message": "Retrait enregistré, traitement manuel requis"}
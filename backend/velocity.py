@@ -0,0 +1,291 @@
+import os
+import json
+import time
+import logging
+import threading
+from collections import OrderedDict, namedtuple
+
+import storage
+import ledger
+import metrics
+import deposits
+from balances import FCFA, STABLECOIN, to_minor, from_minor
+
+logger = logging.getLogger("transferz.velocity")
+
+VELOCITY_REJECTED = metrics.REGISTRY.register(metrics.Counter(
+    "transferz_velocity_rejected_total", "Opérations refusées par une règle de vélocité", ["rule"]))
+
+# 🏎️ Événements surveillés et devise de leurs montants
+TRANSFER = "transfer"
+DEPOSIT = "deposit"
+EVENT_CURRENCIES = {TRANSFER: STABLECOIN, DEPOSIT: FCFA}
+
+# Mesures : somme des montants, nombre d'opérations, destinataires distincts
+AMOUNT = "amount"
+COUNT = "count"
+DISTINCT_RECEIVERS = "distinct_receivers"
+METRICS = (AMOUNT, COUNT, DISTINCT_RECEIVERS)
+
+Rule = namedtuple("Rule", ["name", "event", "metric", "window", "limit", "buckets"])
+
+# Montants en unités affichées (USDT pour les transferts, FCFA pour les dépôts).
+# Règles proposées, actives seulement avec TRANSFERZ_VELOCITY_RULES=default : transfer_receivers_24h
+# refuse par exemple un lot de paie de plus de 50 destinataires.
+DEFAULT_RULES = [
+    {"name": "transfer_amount_1h", "event": TRANSFER, "metric": AMOUNT, "window": 3600, "limit": 1_000},
+    {"name": "transfer_amount_24h", "event": TRANSFER, "metric": AMOUNT, "window": 86400, "limit": 5_000},
+    {"name": "transfer_count_1h", "event": TRANSFER, "metric": COUNT, "window": 3600, "limit": 120},
+    {"name": "transfer_receivers_24h", "event": TRANSFER, "metric": DISTINCT_RECEIVERS, "window": 86400, "limit": 50},
+    {"name": "deposit_amount_24h", "event": DEPOSIT, "metric": AMOUNT, "window": 86400, "limit": 2_000_000},
+    {"name": "deposit_count_1h", "event": DEPOSIT, "metric": COUNT, "window": 3600, "limit": 20},
+]
+
+
+def make_rule(spec):
+    event, metric = spec["event"], spec["metric"]
+    if event not in EVENT_CURRENCIES or metric not in METRICS:
+        raise ValueError(f"Règle de vélocité invalide : {spec}")
+    limit = to_minor(EVENT_CURRENCIES[event], spec["limit"]) if metric == AMOUNT else int(spec["limit"])
+    return Rule(spec["name"], event, metric, float(spec["window"]), limit, int(spec.get("buckets", 12)))
+
+
+def rules_from_env():
+    """TRANSFERZ_VELOCITY_RULES : fichier JSON (liste de règles), "default" : règles par défaut, absent ou "0" : aucune."""
+    path = os.getenv("TRANSFERZ_VELOCITY_RULES")
+    if not path or path == "0":
+        return []
+    if path == "default":
+        return [make_rule(spec) for spec in DEFAULT_RULES]
+    with open(path, "r") as f:
+        return [make_rule(spec) for spec in json.load(f)]
+
+
+# 🪟 Fenêtres glissantes par seaux
+class _Window:
+    """Fenêtre de `window` secondes découpée en `buckets` seaux en anneau.
+
+    Le seau courant est celui de l'horodatage le plus récent ; avancer
+    l'horloge vide les seaux sortis de la fenêtre et retranche leur contenu
+    du total (au plus `buckets` seaux par appel, chaque valeur n'est ajoutée
+    et retirée qu'une fois). La fenêtre réelle glisse par pas de
+    `window / buckets`.
+    """
+
+    __slots__ = ("width", "slots", "epoch", "total", "last")
+
+    def __init__(self, window, buckets):
+        self.width = window / buckets
+        self.slots = [None] * buckets
+        self.epoch = None
+        self.total = 0
+        self.last = 0.0
+
+    def _advance(self, ts):
+        epoch = int(ts // self.width)
+        if self.epoch is None:
+            self.epoch = epoch
+        elif epoch > self.epoch:
+            size = len(self.slots)
+            for e in range(max(self.epoch + 1, epoch - size + 1), epoch + 1):
+                self._evict(e % size)
+            self.epoch = epoch
+        return epoch
+
+    def bucket_of(self, ts):
+        # Une écriture plus ancienne (horloges décalées) va dans le seau de son époque sans reculer la
+        # fenêtre ; sortie de la fenêtre, dans le plus ancien seau plutôt que dans celui d'une époque récente
+        epoch = max(self._advance(ts), self.epoch - len(self.slots) + 1)
+        return epoch % len(self.slots)
+
+
+class _SumWindow(_Window):
+    __slots__ = ()
+
+    def _evict(self, i):
+        if self.slots[i]:
+            self.total -= self.slots[i]
+        self.slots[i] = None
+
+    def add(self, ts, value):
+        i = self.bucket_of(ts)
+        self.slots[i] = (self.slots[i] or 0) + value
+        self.total += value
+        self.last = max(self.last, ts)
+
+    def value(self, ts):
+        self._advance(ts)
+        return self.total
+
+
+class _DistinctWindow(_Window):
+    """Destinataires distincts : un compteur par destinataire et par seau, et leur union."""
+
+    __slots__ = ("seen",)
+
+    def __init__(self, window, buckets):
+        super().__init__(window, buckets)
+        self.seen = {}
+
+    def _evict(self, i):
+        for key, n in (self.slots[i] or {}).items():
+            left = self.seen[key] - n
+            if left:
+                self.seen[key] = left
+            else:
+                del self.seen[key]
+        self.slots[i] = None
+
+    def add(self, ts, key):
+        i = self.bucket_of(ts)
+        if self.slots[i] is None:
+            self.slots[i] = {}
+        self.slots[i][key] = self.slots[i].get(key, 0) + 1
+        self.seen[key] = self.seen.get(key, 0) + 1
+        self.total = len(self.seen)
+        self.last = max(self.last, ts)
+
+    def value(self, ts, extra=()):
+        self._advance(ts)
+        self.total = len(self.seen)
+        return self.total + sum(1 for key in extra if key not in self.seen)
+
+
+class VelocityExceeded(Exception):
+    def __init__(self, rule):
+        super().__init__(rule.name)
+        self.rule = rule
+
+    @property
+    def detail(self):
+        rule = self.rule
+        window = f"{rule.window / 3600:g} h" if rule.window >= 3600 else f"{rule.window / 60:g} min"
+        if rule.metric == AMOUNT:
+            limit = f"{from_minor(EVENT_CURRENCIES[rule.event], rule.limit):g} " \
+                    f"{'USDT' if rule.event == TRANSFER else 'FCFA'}"
+        elif rule.metric == COUNT:
+            limit = f"{rule.limit} opérations"
+        else:
+            limit = f"{rule.limit} destinataires distincts"
+        return f"Limite de vélocité atteinte ({rule.name}) : au plus {limit} sur {window}."
+
+
+# 🏎️ Limites de vélocité sur les transferts et les dépôts
+class VelocityEngine:
+    """Compteurs glissants par (règle, compte), tenus en mémoire.
+
+    Les compteurs sont alimentés par le store (`add_listener`) : un
+    transfert compte pour l'expéditeur quand son écriture est appliquée, un
+    dépôt quand sa demande est journalisée (statut pending, qu'il aboutisse
+    ou non). Au démarrage, seules les écritures et demandes encore dans la
+    plus longue fenêtre sont rejouées. `check` coûte O(nombre de règles),
+    quelle que soit la longueur de l'historique ; il doit être appelé sous
+    le verrou du compte (transferts) ou sous `store.lock` (dépôts) pour que
+    le contrôle et l'enregistrement ne se croisent pas. Les comptes sans
+    activité dans la fenêtre sont évincés au fil des écritures.
+    """
+
+    def __init__(self, store, rules, clock=time.time):
+        self.store = store
+        self.rules = list(rules)
+        self.clock = clock
+        self.horizon = max((rule.window for rule in self.rules), default=0)
+        self._by_event = {event: [r for r in self.rules if r.event == event] for event in EVENT_CURRENCIES}
+        self._windows = {rule.name: OrderedDict() for rule in self.rules}
+        self._lock = threading.Lock()
+        if not self.rules:
+            return
+        with store.lock:
+            self._restore()
+            store.add_listener(self._on_record)
+
+    def _restore(self):
+        since = self.clock() - self.horizon
+        recent = []
+        for e in reversed(self.store.transactions):
+            if e["ts"] < since:
+                break
+            if e["type"] == ledger.TRANSFER:
+                recent.append(e)
+        for e in reversed(recent):
+            self._record_transfer(e)
+        requests = sorted((d for d in self.store.deposits.values() if d["created_at"] >= since),
+                          key=lambda d: d["created_at"])
+        for deposit in requests:
+            self._record_deposit(deposit)
+        logger.info("🏎️ Vélocité : %d transferts et %d dépôts rejoués", len(recent), len(requests))
+
+    # Appelé sous `store.lock` après chaque opération appliquée
+    def _on_record(self, record):
+        op = record["op"]
+        if op == storage.APPEND_LEDGER and record["entry"]["type"] == ledger.TRANSFER:
+            self._record_transfer(record["entry"])
+        elif op == storage.PUT_DEPOSIT and record["deposit"]["status"] == deposits.PENDING:
+            self._record_deposit(record["deposit"])
+
+    def _record_transfer(self, e):
+        amount = to_minor(STABLECOIN, e["amount"])
+        self._record(TRANSFER, e["sender"], e["ts"], amount, e["receiver"])
+
+    def _record_deposit(self, deposit):
+        self._record(DEPOSIT, deposit["username"], deposit["created_at"], deposit["amount"], None)
+
+    def _record(self, event, username, ts, amount, receiver):
+        with self._lock:
+            for rule in self._by_event[event]:
+                windows = self._windows[rule.name]
+                window = windows.get(username)
+                if window is None:
+                    window = windows[username] = (_DistinctWindow if rule.metric == DISTINCT_RECEIVERS
+                                                  else _SumWindow)(rule.window, rule.buckets)
+                else:
+                    windows.move_to_end(username)
+                if rule.metric == AMOUNT:
+                    window.add(ts, amount)
+                elif rule.metric == COUNT:
+                    window.add(ts, 1)
+                else:
+                    window.add(ts, receiver)
+                # Comptes dont la dernière opération est sortie de la fenêtre : compteurs vides
+                while windows:
+                    oldest_key, oldest = next(iter(windows.items()))
+                    if ts - oldest.last < rule.window:
+                        break
+                    del windows[oldest_key]
+
+    def check(self, event, username, amount, receivers=(), count=1, now=None):
+        """Lève VelocityExceeded si `count` opérations de plus, totalisant `amount`
+        (unités entières) vers `receivers` (distincts, parcourus seulement s'il
+        existe une règle de destinataires), dépassent une règle.
+        """
+        now = self.clock() if now is None else now
+        with self._lock:
+            for rule in self._by_event[event]:
+                window = self._windows[rule.name].get(username)
+                if rule.metric == DISTINCT_RECEIVERS:
+                    used = window.value(now, receivers) if window else sum(1 for _ in receivers)
+                else:
+                    used = (window.value(now) if window else 0) + (amount if rule.metric == AMOUNT else count)
+                if used > rule.limit:
+                    VELOCITY_REJECTED.inc(rule.name)
+                    raise VelocityExceeded(rule)
+
+    def usage(self, username, now=None):
+        """Consommation actuelle de chaque règle pour un compte (montants en unités affichées)."""
+        now = self.clock() if now is None else now
+        report = {}
+        with self._lock:
+            for rule in self.rules:
+                window = self._windows[rule.name].get(username)
+                used = window.value(now) if window else 0
+                limit = rule.limit
+                if rule.metric == AMOUNT:
+                    currency = EVENT_CURRENCIES[rule.event]
+                    used, limit = from_minor(currency, used), from_minor(currency, limit)
+                report[rule.name] = {"event": rule.event, "metric": rule.metric, "window": rule.window,
+                                     "used": used, "limit": limit}
+        return report
+
+    def tracked(self):
+        with self._lock:
+            return {name: len(windows) for name, windows in self._windows.items()}
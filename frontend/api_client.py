@@ -0,0 +1,82 @@
+import time
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+# 🌐 Client HTTP partagé par toutes les pages
+class ApiClient:
+    """Session `requests` unique vers le backend.
+
+    Connexions keep-alive réutilisées (pool urllib3), délais de connexion et
+    de lecture sur chaque appel, nouvel essai avec délai croissant sur les
+    erreurs réseau et les 502/503/504 (GET, ou POST portant une clé
+    d'idempotence). Les GET peuvent être mis en cache par token ; une entrée
+    expirée qui a un ETag est revalidée (304 -> pas de corps). `invalidate()`
+    vide le cache d'un token après une écriture (dépôt, numéro, transfert).
+    """
+
+    def __init__(self, base_url, timeout=(3.05, 15), retries=3, backoff=0.3, pool_size=10):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=Retry(
+            total=retries, backoff_factor=backoff, status_forcelist=(502, 503, 504),
+            allowed_methods=frozenset({"GET"}), respect_retry_after_header=True, raise_on_status=False,
+        ))
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._cache = {}  # (token, path, params) -> (expiration, réponse)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _headers(token, headers=None):
+        result = dict(headers or {})
+        if token:
+            result["Authorization"] = f"Bearer {token}"
+        return result
+
+    def get(self, path, token=None, params=None, ttl=0):
+        """GET ; avec `ttl` > 0, la réponse 200 est servie depuis le cache pendant `ttl` secondes."""
+        key = (token, path, tuple(sorted((params or {}).items())))
+        with self._lock:
+            cached = self._cache.get(key)
+        if cached and cached[0] > time.monotonic():
+            return cached[1]
+
+        headers = self._headers(token)
+        if cached and cached[1].headers.get("ETag"):
+            headers["If-None-Match"] = cached[1].headers["ETag"]
+        response = self.session.get(f"{self.base_url}{path}", headers=headers, params=params, timeout=self.timeout)
+        if response.status_code == 304 and cached:
+            response = cached[1]
+        if ttl and response.status_code == 200:
+            with self._lock:
+                self._cache[key] = (time.monotonic() + ttl, response)
+        return response
+
+    def post(self, path, token=None, json=None, headers=None):
+        """POST ; retenté seulement si la requête porte un en-tête Idempotency-Key."""
+        headers = self._headers(token, headers)
+        attempts = self.retries + 1 if "Idempotency-Key" in headers else 1
+        for attempt in range(attempts):
+            if attempt:
+                time.sleep(self.backoff * 2 ** (attempt - 1))
+            try:
+                response = self.session.post(f"{self.base_url}{path}", headers=headers, json=json,
+                                             timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == attempts - 1:
+                    raise
+                continue
+            if response.status_code not in (502, 503, 504) or attempt == attempts - 1:
+                return response
+
+    def invalidate(self, token):
+        with self._lock:
+            for key in [key for key in self._cache if key[0] == token]:
+                del self._cache[key]
@@ -1,8 +1,17 @@
+import uuid
 import requests
 import streamlit as st
+from api_client import ApiClient
 
 API_URL = "https://transferz-poc.onrender.com"
 
+# 🌐 Un client (pool keep-alive + cache) partagé par toutes les exécutions du script
+@st.cache_resource
+def get_client(base_url):
+    return ApiClient(base_url)
+
+api = get_client(API_URL)
+
 # 🎨 UI Personnalisée
 st.markdown(
     """
@@ -32,7 +41,7 @@ new_username = st.text_input("Nom d'utilisateur (Inscription)")
 new_password = st.text_input("Mot de passe (Inscription)", type="password")
 
 if st.button("S'inscrire"):
-    response = requests.post(f"{API_URL}/register/", json={"username": new_username, "password": new_password})
+    response = api.post("/register/", json={"username": new_username, "password": new_password})
     if response.status_code == 200:
         data = response.json()
         st.success(f"✅ Inscription réussie ! DID : {data['did']}")
@@ -48,7 +57,7 @@ username = st.text_input("Nom d'utilisateur")
 password = st.text_input("Mot de passe", type="password")
 
 if st.button("Se connecter"):
-    resp = requests.post(f"{API_URL}/login/", json={"username": username, "password": password})
+    resp = api.post("/login/", json={"username": username, "password": password})
     if resp.status_code == 200:
         st.session_state["access_token"] = resp.json()["access_token"]
         st.success("✅ Connexion réussie !")
@@ -56,6 +65,17 @@ if st.button("Se connecter"):
         st.error("❌ Identifiants incorrects")
 # Interface après connexion
 if st.session_state["access_token"]:
+    token = st.session_state["access_token"]
+
+    # Profil, soldes, numéros et historique récent : un seul aller-retour (mis en cache)
+    me_resp = api.get("/me/", token, params={"transactions": 50}, ttl=30)
+    if me_resp.status_code != 200:
+        st.error("❌ Session expirée, reconnectez-vous.")
+        st.session_state["access_token"] = None
+        st.stop()
+    me = me_resp.json()
+    st.session_state["did"] = me["did"]
+
     st.sidebar.title("📌 Menu")
     option = st.sidebar.radio(
         "Navigation",
@@ -73,6 +93,8 @@ if st.session_state["access_token"]:
         st.subheader("📌 Identité Décentralisée (DID)")
         if st.session_state.get("did"):
             st.write(f"🎯 **Votre DID** : `{st.session_state['did']}`")
+            st.write(f"💰 **Solde FCFA** : {me['balance_fcfa']}")
+            st.write(f"💱 **Solde Stablecoin** : {me['balance_stablecoin']}")
         else:
             st.error("❌ Impossible de récupérer votre DID.")
 
@@ -82,13 +104,9 @@ if st.session_state["access_token"]:
         phone_number = st.text_input("Numéro Mobile Money")
 
         if st.button("Ajouter"):
-            headers = {"Authorization": f"Bearer {st.session_state['access_token']}"}
-            resp = requests.post(
-                f"{API_URL}/user/add_phone/",
-                headers=headers,
-                json={"phone_number": phone_number},
-            )
+            resp = api.post("/user/add_phone/", token, json={"phone_number": phone_number})
             if resp.status_code == 200:
+                api.invalidate(token)
                 st.success("✅ Numéro ajouté avec succès !")
             else:
                 st.error(f"❌ Erreur : {resp.json().get('detail', 'Échec de l\'ajout')}")
@@ -107,14 +125,8 @@ if st.session_state["access_token"]:
         op = st.radio("Choisissez votre opérateur :", list(operator_icons.keys()))
         st.image(operator_icons[op], width=100)
 
-        # 2️⃣  Liste dynamique des numéros enregistrés
-        @st.cache_data(ttl=60)
-        def get_registered_numbers(token):
-            h = {"Authorization": f"Bearer {token}"}
-            r = requests.get(f"{API_URL}/user/phones/", headers=h)
-            return r.json() if r.status_code == 200 else []
-
-        numbers = get_registered_numbers(st.session_state["access_token"])
+        # 2️⃣  Numéros enregistrés (profil /me/)
+        numbers = me["phone_numbers"]
         if not numbers:
             st.warning("⚠️ Aucun numéro enregistré. Ajoutez‑en un d’abord.")
             st.stop()
@@ -126,17 +138,42 @@ if st.session_state["access_token"]:
 
         # 4️⃣  Bouton Dépôt
         if st.button("Déposer"):
-            headers = {"Authorization": f"Bearer {st.session_state['access_token']}"}
-            payload = {"phone_number": phone_sel, "amount": amount_fcfa}
+            payload = {"phone_number": phone_sel, "amount": amount_fcfa, "operator": op}
+            # Même clé d'idempotence tant que le dépôt n'a pas abouti : un nouveau clic ne crédite pas deux fois
+            pending = st.session_state.get("deposit_pending")
+            if not pending or pending["payload"] != payload:
+                pending = st.session_state["deposit_pending"] = {"payload": payload, "key": uuid.uuid4().hex}
+            headers = {"Idempotency-Key": pending["key"]}
 
             st.write(f"📡 Requête envoyée : {payload}")  # debug
 
-            resp = requests.post(f"{API_URL}/deposit/", headers=headers, json=payload)
-            if resp.status_code == 200:
-                st.success(f"✅ Dépôt réussi de {amount_fcfa:.0f} FCFA sur TransferZ !")
+            try:
+                resp = api.post("/deposit/", token, json=payload, headers=headers)
+            except requests.RequestException:
+                st.error("❌ Serveur injoignable, réessayez : le dépôt ne sera pas crédité deux fois.")
+                st.stop()
+            if resp.status_code == 202:
+                st.session_state["deposit_id"] = resp.json()["id"]
+                st.info("⏳ Dépôt accepté, en attente de confirmation de l'opérateur…")
             else:
                 st.error(f"❌ Erreur : {resp.json().get('detail', 'Échec du dépôt')}")
 
+        # 5️⃣  Suivi du dernier dépôt
+        if st.session_state.get("deposit_id"):
+            r = api.get(f"/deposits/{st.session_state['deposit_id']}", token)
+            if r.status_code == 200:
+                dep = r.json()
+                if dep["status"] == "completed":
+                    st.success(f"✅ Dépôt réussi de {dep['amount']} FCFA sur TransferZ ! (réf. {dep['operator_reference']})")
+                    if st.session_state.pop("deposit_pending", None):
+                        api.invalidate(token)
+                elif dep["status"] == "failed":
+                    st.error(f"❌ Dépôt échoué : {dep.get('error')}")
+                    st.session_state.pop("deposit_pending", None)
+                else:
+                    st.info("⏳ Dépôt en cours de traitement…")
+                    st.button("🔄 Actualiser le statut")
+
 # ------------------------------------------------------------------
 
 
@@ -146,14 +183,18 @@ if st.session_state["access_token"]:
     elif option == "Transfert P2P":
         st.subheader("🔄 Transfert P2P via DID")
 
-        headers = {"Authorization": f"Bearer {st.session_state['access_token']}"}
-        r = requests.get(f"{API_URL}/list_did_users/", headers=headers)
+        search = st.text_input("🔎 Rechercher un DID (début du DID)")
 
+        # Page de DID en cache 30 s, puis revalidée avec son ETag (304 si rien n'a changé)
+        params = {"limit": 100}
+        if search:
+            params["q"] = search
+        r = api.get("/list_did_users/", token, params=params, ttl=30)
         if r.status_code != 200:
             st.error("❌ Impossible de récupérer les destinataires.")
             st.stop()
-
         all_dids = r.json()["users"]
+
         my_did   = st.session_state.get("did")
 
         # ⚠️  retire le DID courant
@@ -168,9 +209,10 @@ if st.session_state["access_token"]:
 
         if st.button("Transférer"):
             payload = {"receiver_did": receiver_did, "amount": amount_usdt}
-            tx = requests.post(f"{API_URL}/transfer/", headers=headers, json=payload)
+            tx = api.post("/transfer/", token, json=payload)
 
             if tx.status_code == 200:
+                api.invalidate(token)
                 st.success("✅ Transfert réussi !")
             else:
                 st.error(f"❌ Erreur : {tx.json().get('detail', 'Échec du transfert')}")
@@ -179,14 +221,7 @@ if st.session_state["access_token"]:
 
     elif option == "Historique des Transactions":
         st.subheader("📋 Historique des Transactions")
-        headers = {"Authorization": f"Bearer {st.session_state['access_token']}"}
-        response = requests.get(f"{API_URL}/transactions/", headers=headers)
-
-        if response.status_code == 200:
-            transactions = response.json()
-            st.write(transactions)
-        else:
-            st.error("❌ Erreur lors de la récupération de l'historique des transactions.")
+        st.write(me["transactions"])
             
             
             # ----------------- SECTION ADMIN COMPLETE ------------------
@@ -194,9 +229,9 @@ if st.session_state["access_token"]:
 
 # Importation
 import streamlit as st
-import requests
 
 API_URL = "https://transferz-api.onrender.com"
+admin_api = get_client(API_URL)
 
 # Initialisation des variables de session
 if "admin_authenticated" not in st.session_state:
@@ -233,7 +268,7 @@ if st.session_state.admin_authenticated:
                     "balance_fcfa": fcfa,
                     "balance_stablecoin": stable
                 }
-                r = requests.post(f"{API_URL}/admin/add_user/", json=payload)
+                r = admin_api.post("/admin/add_user/", json=payload)
                 if r.status_code == 200:
                     st.success(f"✅ Utilisateur ajouté avec DID : {r.json().get('did')}")
                 else:
@@ -243,7 +278,7 @@ if st.session_state.admin_authenticated:
     with st.expander("🗑 Supprimer un utilisateur"):
         user_to_delete = st.text_input("Nom d'utilisateur à supprimer")
         if st.button("Supprimer"):
-            r = requests.post(f"{API_URL}/admin/delete_user/", json={"username": user_to_delete})
+            r = admin_api.post("/admin/delete_user/", json={"username": user_to_delete})
             if r.status_code == 200:
                 st.success("✅ Utilisateur supprimé.")
             else:
@@ -255,7 +290,7 @@ if st.session_state.admin_authenticated:
         new_fcfa = st.number_input("Nouveau solde FCFA", min_value=0, step=1000, key="fcfa_update")
         new_stable = st.number_input("Nouveau solde Stablecoin", min_value=0.0, step=10.0, key="stable_update")
         if st.button("Mettre à jour le solde"):
-            r = requests.post(f"{API_URL}/admin/update_balance/", json={
+            r = admin_api.post("/admin/update_balance/", json={
                 "username": user_to_edit,
                 "balance_fcfa": new_fcfa,
                 "balance_stablecoin": new_stable
@@ -0,0 +1,298 @@
+"""Harnais de benchmark du backend (backend/main.py).
+
+Lance l'application en process (ASGI, via httpx) ou contre un uvicorn local
+(--url), avec une population synthétique, et rejoue un mélange de routes à
+une concurrence donnée. Chaque taille de population tourne dans un process
+neuf ; les résultats (débit, p50/p95/p99 par route) sont enregistrés en JSON
+pour comparer les commits entre eux.
+
+    python scripts/bench_backend.py --users 1000,10000,100000 --requests 5000 --concurrency 64
+    python scripts/bench_backend.py --mix deposit=5,transfer=5,list_did_users=1 --users 1000000
+    python scripts/bench_backend.py --compare bench_results/a.json bench_results/b.json
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+import subprocess
+import datetime
+
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+BACKEND_DIR = os.path.join(ROOT_DIR, "backend")
+DEFAULT_MIX = "register=1,login=1,add_phone=1,deposit=10,transfer=10,list_did_users=5"
+PASSWORD = "bench-password"
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        mix[name.strip()] = float(weight or 1)
+    unknown = set(mix) - set(OPERATIONS)
+    if unknown:
+        raise SystemExit(f"Routes inconnues dans --mix : {', '.join(sorted(unknown))}")
+    return mix
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+# 👥 Population synthétique écrite directement comme snapshot (chargée au démarrage)
+def seed_snapshot(path, users, password_hash):
+    with open(path, "w") as f:
+        f.write('{"users":{')
+        for i in range(users):
+            user = {
+                "password": password_hash,
+                "did": f"did:transferz:bench-{i:08d}",
+                "private_key": "",
+                "blockchain_address": f"0xbench{i:08d}",
+                "phone_numbers": [f"bench-{i}"],
+                "balance_fcfa": 0,
+                "balance_stablecoin": 10 ** 9,
+            }
+            f.write(("," if i else "") + json.dumps(f"bench{i}") + ":" + json.dumps(user))
+        f.write('},"transactions":[],"seq":0}')
+
+
+class Context:
+    def __init__(self, backend, users, rng):
+        self.backend = backend
+        self.users = users
+        self.rng = rng
+        self.counter = 0
+        self._tokens = {}
+
+    def random_user(self):
+        return self.rng.randrange(self.users)
+
+    def auth(self, i):
+        token = self._tokens.get(i)
+        if token is None:
+            token = self._tokens[i] = self.backend.create_access_token({"sub": f"bench{i}"})
+        return {"Authorization": f"Bearer {token}"}
+
+    def unique(self):
+        self.counter += 1
+        return self.counter
+
+
+# 🎯 Une requête par route du mélange
+def op_register(ctx):
+    return "POST", "/register/", {"json": {"username": f"bench-new-{ctx.unique()}", "password": PASSWORD}}
+
+
+def op_login(ctx):
+    return "POST", "/login/", {"json": {"username": f"bench{ctx.random_user()}", "password": PASSWORD}}
+
+
+def op_add_phone(ctx):
+    i = ctx.random_user()
+    return "POST", "/user/add_phone/", {"json": {"phone_number": f"bench-extra-{ctx.unique()}"}, "headers": ctx.auth(i)}
+
+
+def op_deposit(ctx):
+    i = ctx.random_user()
+    return "POST", "/deposit/", {"json": {"phone_number": f"bench-{i}", "amount": 100}, "headers": ctx.auth(i)}
+
+
+def op_transfer(ctx):
+    sender = ctx.random_user()
+    receiver = (sender + 1 + ctx.rng.randrange(ctx.users - 1)) % ctx.users
+    return "POST", "/transfer/", {"json": {"receiver_did": f"did:transferz:bench-{receiver:08d}", "amount": 0.01},
+                                  "headers": ctx.auth(sender)}
+
+
+def op_list_did_users(ctx):
+    return "GET", "/list_did_users/", {"params": {"limit": 100}}
+
+
+OPERATIONS = {
+    "register": op_register,
+    "login": op_login,
+    "add_phone": op_add_phone,
+    "deposit": op_deposit,
+    "transfer": op_transfer,
+    "list_did_users": op_list_did_users,
+}
+
+
+async def drive(client, ctx, mix, requests, concurrency):
+    names = list(mix)
+    weights = [mix[n] for n in names]
+    plan = ctx.rng.choices(names, weights=weights, k=requests)
+    latencies = {name: [] for name in names}
+    errors = {name: {} for name in names}
+    position = 0
+
+    async def worker():
+        nonlocal position
+        while position < len(plan):
+            name = plan[position]
+            position += 1
+            method, url, kwargs = OPERATIONS[name](ctx)
+            start = time.perf_counter()
+            try:
+                response = await client.request(method, url, **kwargs)
+                status = response.status_code
+            except Exception as e:
+                status = type(e).__name__
+            latencies[name].append(time.perf_counter() - start)
+            if not (isinstance(status, int) and 200 <= status < 300):
+                errors[name][str(status)] = errors[name].get(str(status), 0) + 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    routes = {}
+    for name in names:
+        values = sorted(latencies[name])
+        routes[name] = {
+            "requests": len(values),
+            "throughput_rps": len(values) / elapsed if elapsed else 0,
+            "p50_ms": percentile(values, 0.50) * 1000 if values else None,
+            "p95_ms": percentile(values, 0.95) * 1000 if values else None,
+            "p99_ms": percentile(values, 0.99) * 1000 if values else None,
+            "errors": errors[name],
+        }
+    return {"elapsed_s": elapsed, "throughput_rps": requests / elapsed, "routes": routes}
+
+
+async def run_single(args):
+    import httpx
+
+    workdir = tempfile.mkdtemp(prefix="transferz-bench-")
+    os.environ["TRANSFERZ_DB_PATH"] = os.path.join(workdir, "database.json")
+    os.environ.setdefault("TRANSFERZ_BCRYPT_ROUNDS", str(args.bcrypt_rounds))
+    # Toute la charge vient d'une seule IP : pas de limitation de débit
+    os.environ.setdefault("TRANSFERZ_RATE_LIMIT", "0")
+    os.environ.setdefault("TRANSFERZ_VELOCITY_RULES", "0")
+    sys.path.insert(0, BACKEND_DIR)
+
+    from passlib.context import CryptContext
+    password_hash = CryptContext(schemes=["bcrypt"], bcrypt__rounds=args.bcrypt_rounds).hash(PASSWORD)
+    start = time.perf_counter()
+    seed_snapshot(os.environ["TRANSFERZ_DB_PATH"], args.users, password_hash)
+    seed_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    import main as backend
+    backend.start(warm_up=False)
+    startup_s = time.perf_counter() - start
+
+    ctx = Context(backend, args.users, random.Random(args.seed))
+    mix = parse_mix(args.mix)
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url, timeout=60)
+        result = await drive(client, ctx, mix, args.requests, args.concurrency)
+        await client.aclose()
+    else:
+        async with backend.app.router.lifespan_context(backend.app):
+            transport = httpx.ASGITransport(app=backend.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+                await drive(client, ctx, {"list_did_users": 1}, min(200, args.requests), args.concurrency)  # chauffe
+                result = await drive(client, ctx, mix, args.requests, args.concurrency)
+
+    result.update({"users": args.users, "seed_s": seed_s, "startup_s": startup_s})
+    return result
+
+
+def print_result(result):
+    print(f"\n👥 {result['users']} utilisateurs — {result['throughput_rps']:.0f} req/s "
+          f"(démarrage {result['startup_s']:.2f}s)")
+    print(f"  {'route':<16}{'req':>8}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}  erreurs")
+    for name, r in result["routes"].items():
+        fmt = lambda v: f"{v:>10.2f}" if v is not None else f"{'-':>10}"
+        print(f"  {name:<16}{r['requests']:>8}{r['throughput_rps']:>10.0f}"
+              f"{fmt(r['p50_ms'])}{fmt(r['p95_ms'])}{fmt(r['p99_ms'])}  {r['errors'] or ''}")
+
+
+def compare(old_path, new_path):
+    with open(old_path) as f:
+        old = {r["users"]: r for r in json.load(f)["results"]}
+    with open(new_path) as f:
+        new = {r["users"]: r for r in json.load(f)["results"]}
+    for users in sorted(set(old) & set(new)):
+        print(f"\n👥 {users} utilisateurs")
+        for name, r in new[users]["routes"].items():
+            before = old[users]["routes"].get(name)
+            if not before or not before["p95_ms"] or not r["p95_ms"]:
+                continue
+            print(f"  {name:<16} p95 {before['p95_ms']:>8.2f} -> {r['p95_ms']:>8.2f} ms "
+                  f"({(r['p95_ms'] / before['p95_ms'] - 1) * 100:+.0f}%)  "
+                  f"débit {before['throughput_rps']:.0f} -> {r['throughput_rps']:.0f} req/s")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", default="1000,10000,100000",
+                        help="tailles de population, séparées par des virgules")
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--mix", default=DEFAULT_MIX)
+    parser.add_argument("--bcrypt-rounds", type=int, default=12)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--url", help="cible un uvicorn local au lieu de l'app en process")
+    parser.add_argument("--output", help="fichier JSON de résultats (défaut bench_results/<commit>-<date>.json)")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"))
+    parser.add_argument("--single", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--result-file", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    if args.single:
+        args.users = int(args.users)
+        result = asyncio.run(run_single(args))
+        with open(args.result_file, "w") as f:
+            json.dump(result, f)
+        return
+
+    parse_mix(args.mix)
+    revision = git_revision()
+    results = []
+    for users in (int(u) for u in args.users.split(",")):
+        # Un process neuf par taille : état, caches et pools repartent de zéro
+        with tempfile.NamedTemporaryFile(suffix=".json", delete=False) as tmp:
+            result_file = tmp.name
+        cmd = [sys.executable, os.path.abspath(__file__), "--single", "--users", str(users),
+               "--requests", str(args.requests), "--concurrency", str(args.concurrency), "--mix", args.mix,
+               "--bcrypt-rounds", str(args.bcrypt_rounds), "--seed", str(args.seed), "--result-file", result_file]
+        if args.url:
+            cmd += ["--url", args.url]
+        subprocess.run(cmd, check=True, env=dict(os.environ, TRANSFERZ_LOG_LEVEL="WARNING"))
+        with open(result_file) as f:
+            result = json.load(f)
+        os.unlink(result_file)
+        print_result(result)
+        results.append(result)
+
+    output = args.output or os.path.join(
+        ROOT_DIR, "bench_results", f"{revision}-{datetime.datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump({"revision": revision, "date": datetime.datetime.now().isoformat(), "mix": args.mix,
+                   "requests": args.requests, "concurrency": args.concurrency, "results": results}, f, indent=2)
+    print(f"\n💾 Résultats enregistrés dans {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""Benchmark de /transfer/batch/ comparé à des /transfer/ unitaires.
+
+    python scripts/bench_batch_transfer.py --recipients 10000 --single-sample 500
+"""
+import os
+import sys
+import argparse
+import tempfile
+import time
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--recipients", type=int, default=10000)
+    parser.add_argument("--single-sample", type=int, default=500,
+                        help="nombre de /transfer/ unitaires mesurés pour comparaison")
+    args = parser.parse_args()
+
+    os.environ["TRANSFERZ_DB_PATH"] = os.path.join(tempfile.mkdtemp(prefix="transferz-bench-"), "database.json")
+    os.environ.setdefault("TRANSFERZ_RATE_LIMIT", "0")
+    os.environ.setdefault("TRANSFERZ_VELOCITY_RULES", "0")
+    sys.path.insert(0, BACKEND_DIR)
+    import logging
+    import main as backend
+    backend.start(warm_up=False)
+    import storage
+    from fastapi.testclient import TestClient
+    logging.getLogger().setLevel(logging.WARNING)
+
+    def account(did, balance):
+        return {"password": "", "did": did, "private_key": "", "blockchain_address": "",
+                "phone_numbers": [], "balance_fcfa": 0, "balance_stablecoin": balance}
+
+    backend.store.apply(storage.put_user("payer", account("did:transferz:payer", 10 ** 9)))
+    backend.store.apply(*(storage.put_user(f"r{i}", account(f"did:transferz:r{i}", 0))
+                          for i in range(args.recipients)))
+    headers = {"Authorization": f"Bearer {backend.create_access_token({'sub': 'payer'})}"}
+    client = TestClient(backend.app)
+
+    payload = {"mode": "atomic",
+               "transfers": [{"receiver_did": f"did:transferz:r{i}", "amount": 1} for i in range(args.recipients)]}
+    start = time.perf_counter()
+    r = client.post("/transfer/batch/", headers=headers, json=payload)
+    batch_elapsed = time.perf_counter() - start
+    assert r.status_code == 200 and r.json()["applied"] == args.recipients, r.text[:200]
+
+    sample = min(args.single_sample, args.recipients)
+    start = time.perf_counter()
+    for i in range(sample):
+        r = client.post("/transfer/", headers=headers, json={"receiver_did": f"did:transferz:r{i}", "amount": 1})
+        assert r.status_code == 200, r.text
+    single_elapsed = time.perf_counter() - start
+
+    print(f"batch   : {args.recipients} destinataires en {batch_elapsed:.3f}s "
+          f"({args.recipients / batch_elapsed:.0f} destinataires/s)")
+    print(f"unitaire: {sample} transferts en {single_elapsed:.3f}s "
+          f"({sample / single_elapsed:.0f} transferts/s, {args.recipients * single_elapsed / sample:.1f}s estimées "
+          f"pour {args.recipients})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""Benchmark du mode multi-processus : débit des transferts pour 1..N shards.
+
+Pour chaque nombre de shards, démarre les processus shards sur un répertoire
+neuf, crée les comptes, puis lance autant de processus clients que de
+shards (chacun avec --threads threads) qui enchaînent des transferts pendant
+--duration secondes via ShardedAccounts (comme les workers HTTP). Une fraction --cross des transferts
+vise un compte d'un autre shard (commit à deux phases), le reste reste local.
+Vérifie ensuite que la masse totale est conservée et affiche le facteur
+d'accélération par rapport à 1 shard.
+
+    python scripts/bench_sharding.py --shards 1,2,4,8 --accounts 2000 --duration 10 --cross 0.1
+"""
+import os
+import sys
+import time
+import json
+import random
+import argparse
+import tempfile
+import threading
+import multiprocessing
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend")
+INITIAL = 1_000_000  # micro-unités par compte
+
+
+def client(shards, directory, accounts, duration, cross, threads, seed, results):
+    sys.path.insert(0, BACKEND_DIR)
+    from accounts import Caller
+    from shards import ShardRouter, ShardedAccounts, ShardError
+
+    router = ShardRouter(shards, directory, pool_size=threads)
+    service = ShardedAccounts(router)
+    dids = list(accounts)
+    by_shard = [[did for did in dids if router.shard_for(did) == i] for i in range(shards)]
+    counts = {"ok": 0, "cross": 0, "rejected": 0}
+    lock = threading.Lock()
+    deadline = time.time() + duration
+
+    def run(rng):
+        while time.time() < deadline:
+            sender = rng.choice(dids)
+            home = router.shard_for(sender)
+            if shards > 1 and rng.random() < cross:
+                pool = by_shard[rng.choice([i for i in range(shards) if i != home])]
+            else:
+                pool = by_shard[home]
+            receiver = rng.choice(pool)
+            if receiver == sender:
+                continue
+            try:
+                service.transfer(Caller(accounts[sender], sender), receiver, rng.randint(1, 1000) / 1_000_000)
+                key = "cross" if router.shard_for(receiver) != home else "ok"
+            except ShardError:
+                key = "rejected"
+            with lock:
+                counts[key] += 1
+
+    workers = [threading.Thread(target=run, args=(random.Random(seed * 1000 + i),)) for i in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    router.close()
+    results.put(counts)
+
+
+def run_once(shards, args):
+    directory = tempfile.mkdtemp(prefix=f"transferz-shards-{shards}-")
+    os.environ["TRANSFERZ_DB_PATH"] = os.path.join(directory, "database.json")
+    os.environ["TRANSFERZ_SQLITE_PATH"] = os.path.join(directory, "transferz.db")
+
+    from shards import ShardRouter, ShardedAccounts, start_shards, stop_shards
+
+    processes = start_shards(shards, directory)
+    try:
+        router = ShardRouter(shards, directory)
+        service = ShardedAccounts(router)
+        accounts = {}
+        for i in range(args.accounts):
+            did = f"did:transferz:bench-{i}"
+            service.create_account(f"bench{i}", {
+                "password": "", "did": did, "private_key": "", "blockchain_address": "",
+                "phone_numbers": [], "balance_fcfa": 0, "balance_stablecoin": INITIAL / 1_000_000,
+            })
+            accounts[did] = f"bench{i}"
+
+        ctx = multiprocessing.get_context("spawn")
+        results = ctx.Queue()
+        clients = [ctx.Process(target=client, args=(shards, directory, accounts, args.duration, args.cross,
+                                                    args.threads, seed, results))
+                   for seed in range(args.clients or shards)]
+        start = time.perf_counter()
+        for process in clients:
+            process.start()
+        totals = {"ok": 0, "cross": 0, "rejected": 0}
+        for _ in clients:
+            for key, value in results.get().items():
+                totals[key] += value
+        elapsed = time.perf_counter() - start
+        for process in clients:
+            process.join()
+
+        stats = router.stats()
+        pending = sum(s["pending_intents"] for s in stats)
+        supply = round(sum(s["total_supply_stablecoin"] for s in stats) * 1_000_000)
+        router.close()
+    finally:
+        stop_shards(processes)
+
+    done = totals["ok"] + totals["cross"]
+    return {
+        "shards": shards,
+        "transfers": done,
+        "cross_shard": totals["cross"],
+        "rejected": totals["rejected"],
+        "throughput": done / elapsed,
+        "pending_intents": pending,
+        "supply_conserved": pending == 0 and supply == INITIAL * args.accounts,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--shards", default=",".join(str(n) for n in (1, 2, 4, 8) if n <= (os.cpu_count() or 1)) or "1")
+    parser.add_argument("--accounts", type=int, default=2000)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--cross", type=float, default=0.1, help="fraction de transferts inter-shards")
+    parser.add_argument("--threads", type=int, default=16, help="threads par processus client")
+    parser.add_argument("--clients", type=int, default=0, help="processus clients (défaut : un par shard)")
+    parser.add_argument("--output")
+    args = parser.parse_args()
+
+    sys.path.insert(0, BACKEND_DIR)
+    os.environ.setdefault("TRANSFERZ_LOG_LEVEL", "WARNING")
+
+    rows = []
+    for shards in (int(n) for n in args.shards.split(",")):
+        row = run_once(shards, args)
+        row["speedup"] = row["throughput"] / rows[0]["throughput"] if rows else 1.0
+        row["efficiency"] = row["speedup"] / (shards / int(args.shards.split(",")[0]))
+        rows.append(row)
+        status = "✅" if row["supply_conserved"] else "❌"
+        print(f"{status} {shards:>2} shards : {row['throughput']:8.0f} transferts/s "
+              f"(x{row['speedup']:.2f}, efficacité {row['efficiency']:.0%}) "
+              f"{row['cross_shard']} inter-shards, {row['rejected']} refusés")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"args": vars(args), "results": rows}, f, indent=2)
+    if not all(row["supply_conserved"] for row in rows):
+        raise SystemExit("❌ Masse totale non conservée")
+
+
+if __name__ == "__main__":
+    main()
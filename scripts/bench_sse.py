@@ -0,0 +1,178 @@
+"""Test de charge du flux SSE /events/ (backend/main.py).
+
+Démarre un uvicorn sur une population synthétique, ouvre --connections flux
+/events/ répartis sur --users comptes, mesure la mémoire et le CPU du
+serveur au repos, puis envoie --transfers transferts et mesure le délai
+entre l'envoi et la réception de l'événement chez les abonnés (expéditeur
+et destinataire).
+
+    python scripts/bench_sse.py --users 500 --connections 5000 --transfers 1000
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import resource
+import tempfile
+import subprocess
+import datetime
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.join(SCRIPTS_DIR, "..", "backend")
+SECRET_KEY = os.getenv("TRANSFERZ_SECRET_KEY", "your_secret_key")  # backend/main.py
+MICRO = 1_000_000
+
+
+def server_stats(pid):
+    with open(f"/proc/{pid}/status") as f:
+        rss_kb = next(int(line.split()[1]) for line in f if line.startswith("VmRSS:"))
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    cpu_s = (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+    return rss_kb / 1024, cpu_s
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))] if values else None
+
+
+def token_for(i):
+    import jwt
+
+    exp = datetime.datetime.utcnow() + datetime.timedelta(days=1)
+    return jwt.encode({"sub": f"bench{i}", "exp": exp, "iat": datetime.datetime.utcnow()}, SECRET_KEY)
+
+
+async def subscriber(client, user, sent, latencies, connected):
+    headers = {"Authorization": f"Bearer {token_for(user)}"}
+    async with client.stream("GET", "/events/", headers=headers) as response:
+        response.raise_for_status()
+        connected.release()
+        async for line in response.aiter_lines():
+            if line.startswith("data: "):
+                amount = round(json.loads(line[6:])["entry"]["amount"] * MICRO)
+                if amount in sent:
+                    latencies.append(time.perf_counter() - sent[amount])
+
+
+async def run(args, base_url, pid):
+    import httpx
+
+    limits = httpx.Limits(max_connections=args.connections + 100, max_keepalive_connections=args.connections + 100)
+    timeout = httpx.Timeout(60, read=None)
+    sent, latencies = {}, []
+    connected = asyncio.Semaphore(0)
+
+    rss_before, _ = server_stats(pid)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=timeout) as client:
+        start = time.perf_counter()
+        tasks = []
+        for c in range(args.connections):
+            tasks.append(asyncio.create_task(subscriber(client, c % args.users, sent, latencies, connected)))
+            if c % 200 == 199:
+                await asyncio.sleep(0)
+        for _ in range(args.connections):
+            await connected.acquire()
+        connect_s = time.perf_counter() - start
+
+        rss_after, cpu_start = server_stats(pid)
+        await asyncio.sleep(args.idle)
+        _, cpu_end = server_stats(pid)
+        idle_cpu = (cpu_end - cpu_start) / args.idle
+
+        rng = random.Random(args.seed)
+        subscribed_users = min(args.users, args.connections)
+        per_user = args.connections / subscribed_users
+        expected = 0
+        start = time.perf_counter()
+        for k in range(1, args.transfers + 1):
+            sender = rng.randrange(subscribed_users)
+            receiver = (sender + 1 + rng.randrange(subscribed_users - 1)) % subscribed_users
+            sent[k] = time.perf_counter()
+            response = await client.post("/transfer/", headers={"Authorization": f"Bearer {token_for(sender)}"},
+                                         json={"receiver_did": f"did:transferz:bench-{receiver:08d}",
+                                               "amount": k / MICRO})
+            if response.status_code == 200:
+                expected += 2 * per_user
+            if args.rate:
+                await asyncio.sleep(1 / args.rate)
+        send_s = time.perf_counter() - start
+
+        deadline = time.perf_counter() + 10
+        while len(latencies) < expected and time.perf_counter() < deadline:
+            await asyncio.sleep(0.1)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    return {
+        "connections": args.connections,
+        "connect_s": connect_s,
+        "server_rss_mb": rss_after,
+        "kb_per_connection": (rss_after - rss_before) * 1024 / args.connections,
+        "idle_cpu": idle_cpu,
+        "transfers_per_s": args.transfers / send_s,
+        "events_expected": int(expected),
+        "events_received": len(latencies),
+        "delivery_p50_ms": percentile(latencies, 0.50) * 1000 if latencies else None,
+        "delivery_p99_ms": percentile(latencies, 0.99) * 1000 if latencies else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--connections", type=int, default=2000)
+    parser.add_argument("--transfers", type=int, default=500)
+    parser.add_argument("--rate", type=float, default=0, help="transferts/s (0 : au plus vite)")
+    parser.add_argument("--idle", type=float, default=5, help="secondes de mesure au repos")
+    parser.add_argument("--port", type=int, default=8799)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output")
+    args = parser.parse_args()
+
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    wanted = min(hard, args.connections * 2 + 1024)
+    if soft < wanted:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (wanted, hard))
+
+    sys.path.insert(0, SCRIPTS_DIR)
+    from bench_backend import seed_snapshot
+
+    workdir = tempfile.mkdtemp(prefix="transferz-sse-")
+    db_path = os.path.join(workdir, "database.json")
+    seed_snapshot(db_path, args.users, "")
+    env = dict(os.environ, TRANSFERZ_DB_PATH=db_path, TRANSFERZ_STORAGE="json", TRANSFERZ_LOG_LEVEL="WARNING",
+               TRANSFERZ_RATE_LIMIT="0", TRANSFERZ_VELOCITY_RULES="0")
+    server = subprocess.Popen([sys.executable, "-m", "uvicorn", "main:app", "--port", str(args.port),
+                               "--log-level", "warning", "--no-access-log"], cwd=BACKEND_DIR, env=env)
+    base_url = f"http://127.0.0.1:{args.port}"
+    try:
+        import httpx
+
+        for _ in range(300):
+            try:
+                if httpx.get(f"{base_url}/metrics").status_code == 200:
+                    break
+            except httpx.HTTPError:
+                time.sleep(0.1)
+        result = asyncio.run(run(args, base_url, server.pid))
+    finally:
+        server.terminate()
+        server.wait()
+
+    print(f"📡 {result['connections']} flux ouverts en {result['connect_s']:.2f}s — serveur {result['server_rss_mb']:.0f} Mo "
+          f"({result['kb_per_connection']:.1f} Ko/flux), CPU au repos {result['idle_cpu']:.1%}")
+    print(f"🔄 {result['transfers_per_s']:.0f} transferts/s, {result['events_received']}/{result['events_expected']} "
+          f"événements reçus, délai p50 {result['delivery_p50_ms']:.1f} ms, p99 {result['delivery_p99_ms']:.1f} ms")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"args": vars(args), "result": result}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""Mesure du démarrage à froid du backend (backend/main.py).
+
+1. Temps d'import de `main` dans un interpréteur neuf (`python -X importtime`),
+   meilleur de --repeat essais, avec les modules importés les plus coûteux.
+2. Pour un snapshot de --users comptes, JSON puis pickle
+   (TRANSFERZ_SNAPSHOT_BINARY=1) : délai entre le lancement d'uvicorn et
+   l'ouverture du port (première réponse de /ready), l'état chargé (routes
+   servies) et /ready au vert (chauffe terminée).
+
+Avec --max-import-ms / --max-ready-s, le script sort en erreur si un budget
+est dépassé (à lancer en CI pour repérer une régression).
+
+    python scripts/bench_startup.py --users 100000 --max-import-ms 1500
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.join(SCRIPTS_DIR, "..", "backend")
+
+
+def measure_import(env, repeat, top):
+    best = None
+    for _ in range(repeat):
+        result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main"], cwd=BACKEND_DIR,
+                                env=env, capture_output=True, text=True, check=True)
+        # "import time: self [us] | cumulative | module" : un module est listé après ses
+        # dépendances, les imports directs de main (indentés de 2) précèdent donc sa ligne
+        modules = {}
+        children = {}
+        total = None
+        for line in result.stderr.splitlines():
+            if not line.startswith("import time:") or "cumulative" in line:
+                continue
+            _, cumulative, name = line[len("import time:"):].split("|")
+            if not name.startswith("  "):
+                if name.strip() == "main":
+                    total, modules = int(cumulative) / 1000, children
+                children = {}
+            elif not name.startswith("    "):
+                children[name.strip()] = int(cumulative) / 1000
+        if best is None or total < best[0]:
+            best = (total, sorted(modules.items(), key=lambda m: m[1], reverse=True)[:top])
+    return best
+
+
+def measure_startup(env, port, timeout):
+    import httpx
+
+    start = time.perf_counter()
+    server = subprocess.Popen([sys.executable, "-m", "uvicorn", "main:app", "--port", str(port),
+                               "--log-level", "warning", "--no-access-log"], cwd=BACKEND_DIR, env=env)
+    timings = {}
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=5) as client:
+            while time.perf_counter() - start < timeout:
+                try:
+                    report = client.get("/ready").json()
+                except httpx.HTTPError:
+                    time.sleep(0.005)
+                    continue
+                now = time.perf_counter() - start
+                timings.setdefault("port_s", now)
+                if report["status"] != "starting":
+                    timings.setdefault("serving_s", now)
+                if report["status"] in ("ready", "failed"):
+                    timings["ready_s"] = now
+                    timings["status"] = report["status"]
+                    timings["steps_s"] = report["steps_s"]
+                    break
+                time.sleep(0.005)
+    finally:
+        server.terminate()
+        server.wait()
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--top", type=int, default=8, help="modules les plus coûteux affichés")
+    parser.add_argument("--port", type=int, default=8797)
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--max-import-ms", type=float)
+    parser.add_argument("--max-ready-s", type=float)
+    parser.add_argument("--output")
+    args = parser.parse_args()
+
+    sys.path.insert(0, SCRIPTS_DIR)
+    sys.path.insert(0, BACKEND_DIR)
+    from bench_backend import seed_snapshot
+
+    workdir = tempfile.mkdtemp(prefix="transferz-startup-")
+    db_path = os.path.join(workdir, "database.json")
+    env = dict(os.environ, TRANSFERZ_DB_PATH=db_path, TRANSFERZ_STORAGE="json", TRANSFERZ_LOG_LEVEL="WARNING",
+               TRANSFERZ_BCRYPT_ROUNDS="4", TRANSFERZ_RATE_LIMIT="0")
+
+    import_ms, heaviest = measure_import(env, args.repeat, args.top)
+    print(f"📦 import main : {import_ms:.0f} ms (meilleur de {args.repeat})")
+    for name, ms in heaviest:
+        print(f"   {name:<24} {ms:>7.1f} ms")
+
+    seed_snapshot(db_path, args.users, "")
+    os.environ.update(env)
+    import storage
+
+    results = {"import_ms": import_ms, "heaviest_imports_ms": dict(heaviest), "users": args.users}
+    for label, binary in (("json", "0"), ("pickle", "1")):
+        if binary == "1":
+            # Même état réécrit aussi en pickle (snapshot de fermeture) ; un arrêt sans binaire l'efface
+            storage.Store(backend=storage.JournalBackend(db_path, binary=True)).close()
+        timings = measure_startup(dict(env, TRANSFERZ_SNAPSHOT_BINARY=binary), args.port, args.timeout)
+        results[label] = timings
+        steps = ", ".join(f"{name} {s:.2f}s" for name, s in timings.get("steps_s", {}).items())
+        print(f"🚀 snapshot {label:<6} port {timings.get('port_s', float('nan')):.2f}s, "
+              f"état chargé {timings.get('serving_s', float('nan')):.2f}s, "
+              f"/ready {timings.get('ready_s', float('nan')):.2f}s ({timings.get('status', 'timeout')}) — {steps}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"args": vars(args), "result": results}, f, indent=2)
+
+    failures = []
+    if args.max_import_ms is not None and import_ms > args.max_import_ms:
+        failures.append(f"import {import_ms:.0f} ms > {args.max_import_ms:.0f} ms")
+    for label in ("json", "pickle"):
+        ready_s = results[label].get("ready_s")
+        if args.max_ready_s is not None and (ready_s is None or ready_s > args.max_ready_s):
+            failures.append(f"/ready ({label}) {ready_s} s > {args.max_ready_s} s")
+    if failures:
+        print("❌ Budget dépassé : " + " ; ".join(failures))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Migration d'un database.json vers la base SQLite (TRANSFERZ_STORAGE=sqlite).
+
+Accepte le format de backend/main.py (snapshot + journal `.journal`, rejoué
+avant la copie) et l'ancien format de transferz_poc.py (comptes indexés par
+numéro, sans DID : un DID est généré pour chacun). La base cible doit être
+vide. Le fichier source n'est pas modifié.
+
+    python scripts/migrate_to_sqlite.py /tmp/database.json /tmp/transferz.db
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import argparse
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend")
+CHUNK = 1000
+
+
+def read_source(path):
+    """Renvoie (users avec soldes, transactions, dépôts)."""
+    import storage
+
+    with open(path, "r") as f:
+        data = json.load(f)
+    users = data.get("users", {})
+
+    if users and not all("did" in user for user in users.values()):
+        # Ancien format transferz_poc.py : {"users": {phone: {phone, balance_fcfa, balance_stablecoin}}}
+        return {
+            phone: {
+                "password": "",
+                "did": f"did:transferz:{uuid.uuid4()}",
+                "private_key": "",
+                "blockchain_address": "",
+                "phone_numbers": [phone],
+                "balance_fcfa": user.get("balance_fcfa", 0),
+                "balance_stablecoin": user.get("balance_stablecoin", 0),
+            }
+            for phone, user in users.items()
+        }, [], []
+
+    # Format backend/main.py : le store rejoue le journal ; pas de close() (il réécrirait le snapshot)
+    source = storage.Store(path, snapshot_every=float("inf"))
+    with source.lock:
+        users = {username: {**user, **source.balances.as_fields(username)} for username, user in source.users.items()}
+        return users, list(source.transactions), list(source.deposits.values())
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("source", help="database.json à migrer")
+    parser.add_argument("target", help="fichier SQLite à créer")
+    args = parser.parse_args()
+
+    sys.path.insert(0, BACKEND_DIR)
+    import storage
+    from sqlite_store import SqliteBackend
+
+    start = time.perf_counter()
+    users, transactions, deposits = read_source(args.source)
+
+    target = storage.Store(backend=SqliteBackend(args.target))
+    if target.users or target.transactions:
+        target.close()
+        raise SystemExit(f"❌ {args.target} contient déjà des données")
+
+    records = [storage.put_user(username, user) for username, user in users.items()]
+    records += [storage.append_ledger(entry) for entry in transactions]
+    records += [storage.put_deposit(deposit) for deposit in deposits]
+    seq = None
+    for i in range(0, len(records), CHUNK):
+        seq = target.submit(*records[i:i + CHUNK])
+    if seq is not None:
+        target.wait(seq)
+
+    totals = {c: target.balances.total_supply(c) for c in ("fcfa", "stablecoin")}
+    target.close()
+    print(f"✅ {len(users)} utilisateurs, {len(transactions)} écritures, {len(deposits)} dépôts migrés "
+          f"en {time.perf_counter() - start:.2f}s vers {args.target}")
+    print(f"   masse totale : {totals['fcfa']} FCFA, {totals['stablecoin'] / 1_000_000} stablecoin")
+
+
+if __name__ == "__main__":
+    main()
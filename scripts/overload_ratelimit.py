@@ -0,0 +1,152 @@
+"""Test de surcharge de la limitation de débit (backend/ratelimit.py).
+
+Démarre deux fois un uvicorn sur la même population (limitation activée
+puis désactivée). Pendant --duration secondes, --abusers clients martèlent
+/login/ (mauvais mot de passe, donc bcrypt à chaque fois) et /register/,
+pendant que --clients utilisateurs « normaux » consultent /me/ et font un
+transfert toutes les --interval secondes, et se reconnectent (/login/) un
+tour sur --login-every. Chaque client a sa propre IP
+(en-tête X-Forwarded-For, TRANSFERZ_TRUST_PROXY=1). Compare la latence
+des clients normaux dans les deux cas.
+
+    python scripts/overload_ratelimit.py --abusers 8 --concurrency 16 --clients 20 --duration 20
+"""
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+import subprocess
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.join(SCRIPTS_DIR, "..", "backend")
+PASSWORD = "bench-password"
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))] if values else None
+
+
+async def well_behaved(client, i, args, deadline, latencies, statuses):
+    ip = {"X-Forwarded-For": f"10.1.{i // 250}.{i % 250}"}
+    login = {"json": {"username": f"bench{i}", "password": PASSWORD}}
+    r = await client.post("/login/", headers=ip, **login)
+    headers = {**ip, "Authorization": f"Bearer {r.json()['access_token']}"}
+    rng = random.Random(i)
+    turn = 0
+    while time.perf_counter() < deadline:
+        turn += 1
+        receiver = (i + 1 + rng.randrange(args.users - 1)) % args.users
+        requests = [
+            ("me", "GET", "/me/", {}),
+            ("transfer", "POST", "/transfer/",
+             {"json": {"receiver_did": f"did:transferz:bench-{receiver:08d}", "amount": 0.01}}),
+        ]
+        if turn % args.login_every == 0:
+            requests.append(("login", "POST", "/login/", login))
+        for name, method, url, kwargs in requests:
+            start = time.perf_counter()
+            try:
+                response = await client.request(method, url, headers=headers, **kwargs)
+                status = response.status_code
+            except Exception as e:
+                status = type(e).__name__
+            latencies.setdefault(name, []).append(time.perf_counter() - start)
+            statuses[status] = statuses.get(status, 0) + 1
+        await asyncio.sleep(args.interval)
+
+
+async def abuser(client, i, task, deadline, statuses):
+    headers = {"X-Forwarded-For": f"10.9.{i // 250}.{i % 250}"}
+    n = 0
+    while time.perf_counter() < deadline:
+        n += 1
+        if n % 2:
+            request = client.post("/login/", headers=headers, json={"username": "bench0", "password": "wrong"})
+        else:
+            request = client.post("/register/", headers=headers,
+                                  json={"username": f"abuse-{i}-{task}-{n}", "password": "x"})
+        try:
+            status = (await request).status_code
+        except Exception as e:
+            status = type(e).__name__
+        statuses[status] = statuses.get(status, 0) + 1
+        if status == 429:
+            await asyncio.sleep(0.01)
+
+
+async def drive(base_url, args):
+    import httpx
+
+    limits = httpx.Limits(max_connections=args.clients + args.abusers * args.concurrency + 10)
+    async with httpx.AsyncClient(base_url=base_url, timeout=120, limits=limits) as client:
+        latencies, good, bad = {}, {}, {}
+        deadline = time.perf_counter() + args.duration
+        await asyncio.gather(
+            *(well_behaved(client, i, args, deadline, latencies, good) for i in range(args.clients)),
+            *(abuser(client, a, c, deadline, bad)
+              for a in range(args.abusers) for c in range(args.concurrency)),
+        )
+    return {
+        "routes": {name: {"p50_ms": percentile(values, 0.50) * 1000, "p99_ms": percentile(values, 0.99) * 1000,
+                          "requests": len(values)} for name, values in latencies.items()},
+        "statuses": good,
+        "abuser_statuses": bad,
+    }
+
+
+def run_phase(args, limited, port):
+    from bench_backend import seed_snapshot
+    from passlib.context import CryptContext
+
+    workdir = tempfile.mkdtemp(prefix="transferz-overload-")
+    db_path = os.path.join(workdir, "database.json")
+    seed_snapshot(db_path, args.users, CryptContext(schemes=["bcrypt"], bcrypt__rounds=args.bcrypt_rounds).hash(PASSWORD))
+    env = dict(os.environ, TRANSFERZ_DB_PATH=db_path, TRANSFERZ_STORAGE="json", TRANSFERZ_LOG_LEVEL="WARNING",
+               TRANSFERZ_BCRYPT_ROUNDS=str(args.bcrypt_rounds), TRANSFERZ_TRUST_PROXY="1",
+               TRANSFERZ_VELOCITY_RULES="0", TRANSFERZ_RATE_LIMIT="1" if limited else "0")
+    server = subprocess.Popen([sys.executable, "-m", "uvicorn", "main:app", "--port", str(port),
+                               "--log-level", "warning", "--no-access-log"], cwd=BACKEND_DIR, env=env)
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        import httpx
+
+        for _ in range(300):
+            try:
+                if httpx.get(f"{base_url}/metrics").status_code == 200:
+                    break
+            except httpx.HTTPError:
+                time.sleep(0.1)
+        return asyncio.run(drive(base_url, args))
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--clients", type=int, default=20, help="utilisateurs normaux")
+    parser.add_argument("--interval", type=float, default=0.5, help="pause entre deux actions d'un client normal")
+    parser.add_argument("--login-every", type=int, default=5)
+    parser.add_argument("--abusers", type=int, default=8, help="IP abusives")
+    parser.add_argument("--concurrency", type=int, default=16, help="requêtes simultanées par IP abusive")
+    parser.add_argument("--duration", type=float, default=20)
+    parser.add_argument("--bcrypt-rounds", type=int, default=10)
+    parser.add_argument("--port", type=int, default=8798)
+    args = parser.parse_args()
+
+    sys.path.insert(0, SCRIPTS_DIR)
+    for limited in (True, False):
+        r = run_phase(args, limited, args.port)
+        label = "avec limitation" if limited else "sans limitation"
+        print(f"🚦 {label} — clients normaux {r['statuses']}, abus {r['abuser_statuses']}")
+        for name, route in r["routes"].items():
+            print(f"   {name:<10} p50 {route['p50_ms']:>7.0f} ms   p99 {route['p99_ms']:>7.0f} ms   ({route['requests']} requêtes)")
+
+
+if __name__ == "__main__":
+    main()
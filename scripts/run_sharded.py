@@ -0,0 +1,44 @@
+"""Lance TransferZ en mode multi-processus : N shards de comptes + uvicorn --workers W.
+
+Chaque shard écrit dans son propre fichier (TRANSFERZ_DB_PATH ou
+TRANSFERZ_SQLITE_PATH suffixé par `.shard-<i>`). Le nombre de shards doit
+rester le même d'un démarrage à l'autre : un compte appartient au shard de
+son DID.
+
+    python scripts/run_sharded.py --shards 4 --workers 4 --port 8000
+"""
+import os
+import sys
+import argparse
+import subprocess
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--shards", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args()
+
+    sys.path.insert(0, BACKEND_DIR)
+    from shards import start_shards, stop_shards
+
+    processes = start_shards(args.shards)
+    print(f"🧩 {args.shards} shards prêts, démarrage de {args.workers} workers HTTP")
+    try:
+        subprocess.run(
+            [sys.executable, "-m", "uvicorn", "main:app", "--host", args.host, "--port", str(args.port),
+             "--workers", str(args.workers)],
+            cwd=BACKEND_DIR, env={**os.environ, "TRANSFERZ_SHARDS": str(args.shards)},
+        )
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop_shards(processes)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""Stress test des transferts concurrents.
+
+Lance des milliers de /transfer/ en parallèle entre un petit groupe de
+comptes (beaucoup de conflits) et vérifie que la masse totale de
+stablecoins est conservée et qu'aucun solde n'est négatif.
+
+    python scripts/stress_transfers.py --accounts 20 --transfers 5000 --threads 32
+"""
+import os
+import sys
+import random
+import argparse
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--accounts", type=int, default=20)
+    parser.add_argument("--transfers", type=int, default=5000)
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--initial", type=int, default=1000)
+    args = parser.parse_args()
+
+    os.environ["TRANSFERZ_DB_PATH"] = os.path.join(tempfile.mkdtemp(prefix="transferz-stress-"), "database.json")
+    os.environ.setdefault("TRANSFERZ_RATE_LIMIT", "0")
+    os.environ.setdefault("TRANSFERZ_VELOCITY_RULES", "0")
+    sys.path.insert(0, BACKEND_DIR)
+    import logging
+    import main as backend
+    backend.start(warm_up=False)
+    import storage
+    from fastapi.testclient import TestClient
+    logging.getLogger().setLevel(logging.WARNING)
+
+    usernames = [f"stress{i}" for i in range(args.accounts)]
+    for username in usernames:
+        backend.store.apply(storage.put_user(username, {
+            "password": "",
+            "did": f"did:transferz:{username}",
+            "private_key": "",
+            "blockchain_address": "",
+            "phone_numbers": [],
+            "balance_fcfa": 0,
+            "balance_stablecoin": args.initial,
+        }))
+    headers = {u: {"Authorization": f"Bearer {backend.create_access_token({'sub': u})}"} for u in usernames}
+    expected_total = args.initial * args.accounts
+
+    client = TestClient(backend.app)
+    rng = random.Random(42)
+    jobs = []
+    for _ in range(args.transfers):
+        sender, receiver = rng.sample(usernames, 2)
+        jobs.append((sender, receiver, rng.randint(1, 50)))
+
+    def run(job):
+        sender, receiver, amount = job
+        r = client.post("/transfer/", headers=headers[sender],
+                        json={"receiver_did": f"did:transferz:{receiver}", "amount": amount})
+        return r.status_code
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as pool:
+        statuses = list(pool.map(run, jobs))
+    elapsed = time.perf_counter() - start
+
+    balances = [backend.store.balances.as_fields(u)["balance_stablecoin"] for u in usernames]
+    total = sum(balances)
+    print(f"{args.transfers} transferts en {elapsed:.2f}s ({args.transfers / elapsed:.0f}/s)")
+    print(f"réussis={statuses.count(200)} refusés={statuses.count(400)} autres={len(statuses) - statuses.count(200) - statuses.count(400)}")
+    print(f"total attendu={expected_total} total obtenu={total} min={min(balances)}")
+
+    ok = total == expected_total and min(balances) >= 0 and set(statuses) <= {200, 400}
+    print("✅ Masse conservée" if ok else "❌ Incohérence détectée")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+"""Environnement commun aux tests : bases dans un répertoire temporaire, backend importable.
+
+À importer avant tout module du backend : storage.py, hashing.py, main.py…
+lisent leurs variables TRANSFERZ_* à l'import.
+"""
+import os
+import sys
+import uuid
+import tempfile
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend")
+WORK_DIR = tempfile.mkdtemp(prefix="transferz-tests-")
+
+for name, value in {
+    "TRANSFERZ_DB_PATH": os.path.join(WORK_DIR, "database.json"),
+    "TRANSFERZ_SQLITE_PATH": os.path.join(WORK_DIR, "transferz.db"),
+    "TRANSFERZ_LOG_LEVEL": "WARNING",
+    "TRANSFERZ_BCRYPT_ROUNDS": "4",
+    "TRANSFERZ_RATE_LIMIT": "0",
+    "TRANSFERZ_VELOCITY_RULES": "0",
+}.items():
+    os.environ.setdefault(name, value)
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+
+def open_store():
+    """Store neuf sur un fichier propre à l'appelant, qui le ferme."""
+    import storage
+
+    return storage.open_store(suffix=f"test-{uuid.uuid4().hex[:8]}")
+
+
+def client():
+    """TestClient sur `main.app`, services démarrés une fois par processus."""
+    import main
+    from fastapi.testclient import TestClient
+
+    main.start(warm_up=False)
+    return TestClient(main.app)
+
+
+def unique(prefix):
+    """Nom d'utilisateur ou numéro jamais vu dans le store partagé de `main`."""
+    return f"{prefix}{uuid.uuid4().hex[:10]}"
@@ -0,0 +1,81 @@
+"""Cache des tokens vérifiés : LRU, expiration et révocation à la suppression d'un compte.
+
+    python -m unittest discover tests
+"""
+import time
+import unittest
+from unittest import mock
+
+import support
+
+from auth_cache import TokenCache  # noqa: E402
+
+
+class TokenCacheTest(unittest.TestCase):
+
+    def test_hits_misses_and_expiry(self):
+        cache = TokenCache()
+        self.assertIsNone(cache.get("t1"))
+        cache.put("t1", {"sub": "alice", "exp": time.time() + 60})
+        cache.put("t2", {"sub": "bob", "exp": time.time() - 1})
+        self.assertEqual(cache.get("t1")["sub"], "alice")
+        self.assertIsNone(cache.get("t2"))  # Expiré : retiré du cache
+        self.assertEqual(cache.stats()["size"], 1)
+        self.assertEqual((cache.hits, cache.misses), (1, 2))
+
+    def test_lru_eviction(self):
+        cache = TokenCache(max_size=2)
+        for token in ("a", "b"):
+            cache.put(token, {"sub": token, "exp": time.time() + 60})
+        cache.get("a")
+        cache.put("c", {"sub": "c", "exp": time.time() + 60})
+        self.assertIsNotNone(cache.get("a"))
+        self.assertIsNone(cache.get("b"))
+
+    def test_revocation_orders_tokens_within_the_same_second(self):
+        cache = TokenCache()
+        with mock.patch("auth_cache.time.time", return_value=1000.5):
+            cache.revoke("alice")
+        self.assertTrue(cache.is_revoked({"sub": "alice", "iat": 1000.2}))
+        self.assertTrue(cache.is_revoked({"sub": "alice", "iat": 1000.5}))
+        self.assertFalse(cache.is_revoked({"sub": "alice", "iat": 1000.7}))
+        self.assertFalse(cache.is_revoked({"sub": "bob", "iat": 1000.2}))
+
+    def test_old_revocations_are_forgotten(self):
+        cache = TokenCache(token_lifetime=10)
+        with mock.patch("auth_cache.time.time", return_value=1000.0):
+            cache.revoke("alice")
+        with mock.patch("auth_cache.time.time", return_value=1011.0):
+            cache.revoke("bob")
+        self.assertEqual(cache.stats()["revoked_users"], 1)
+        self.assertFalse(cache.is_revoked({"sub": "alice", "iat": 999.0}))
+
+
+class RevocationRouteTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.client = support.client()
+
+    def login(self, username):
+        response = self.client.post("/login/", json={"username": username, "password": "pw"})
+        return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    def test_deleted_account_tokens_are_refused_and_new_account_logs_in_at_once(self):
+        username = support.unique("revoke")
+        self.client.post("/register/", json={"username": username, "password": "pw"})
+        old = self.login(username)
+        self.assertEqual(self.client.get("/me/", headers=old).status_code, 200)  # En cache
+
+        self.client.post("/admin/delete_user/", json=username)
+        self.assertEqual(self.client.get("/me/", headers=old).json(), {"detail": "Token revoked"})
+
+        # Réinscription et connexion dans la foulée, souvent dans la même seconde
+        self.client.post("/register/", json={"username": username, "password": "pw"})
+        new = self.login(username)
+        self.assertEqual(self.client.get("/me/", headers=new).status_code, 200)
+        self.assertEqual(self.client.get("/me/", headers=old).status_code, 401)
+
+
+if __name__ == "__main__":
+    unittest.main()
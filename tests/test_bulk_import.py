@@ -0,0 +1,171 @@
+"""Import en masse : lecture NDJSON / CSV en streaming, validation des lignes, commits par lot.
+
+    python -m unittest discover tests
+"""
+import json
+import asyncio
+import unittest
+from unittest import mock
+
+import support
+
+import hashing  # noqa: E402
+import bulk_import  # noqa: E402
+from accounts import PHONE_TAKEN, USER_EXISTS  # noqa: E402
+
+
+async def _chunks(data, size):
+    for start in range(0, len(data), size):
+        yield data[start:start + size]
+
+
+def read_rows(text, fmt, size=7):
+    """Lignes de `text` lues par morceaux de `size` octets : [(numéro, ligne, erreur)]."""
+    async def collect():
+        return [row async for row in bulk_import.iter_rows(_chunks(text.encode(), size), fmt)]
+    return asyncio.run(collect())
+
+
+def ndjson(*rows):
+    return "".join(json.dumps(row) + "\n" for row in rows)
+
+
+class IterRowsTest(unittest.TestCase):
+
+    def test_ndjson_rows_and_line_errors(self):
+        text = '{"username": "a"}\n\n[1, 2]\n{"username": \n{"username": "b"}'
+        self.assertEqual(read_rows(text, "ndjson"), [
+            (1, {"username": "a"}, None),
+            (3, None, "Objet JSON attendu."),
+            (4, None, "JSON invalide."),
+            (5, {"username": "b"}, None),
+        ])
+
+    def test_invalid_utf8_is_a_row_error(self):
+        async def collect():
+            stream = _chunks(b'{"username": "a"}\n\xff\xfe\n', 4)
+            return [row async for row in bulk_import.iter_rows(stream, "ndjson")]
+        rows = asyncio.run(collect())
+        self.assertEqual(rows[1], (2, None, "Encodage invalide (UTF-8 attendu)."))
+
+    def test_csv_header_and_quoted_newlines(self):
+        text = 'username, phone_number,password\nalice,0701,"mot\nde passe"\n\nbob,0702,"a ""b"""\n'
+        self.assertEqual(read_rows(text, "csv", size=5), [
+            (2, {"username": "alice", "phone_number": "0701", "password": "mot\nde passe"}, None),
+            (5, {"username": "bob", "phone_number": "0702", "password": 'a "b"'}, None),
+        ])
+
+    def test_csv_unclosed_quote(self):
+        rows = read_rows('username,password\nalice,"jamais fermé\n', "csv")
+        self.assertEqual(rows, [(2, None, "CSV invalide : guillemet non fermé.")])
+
+
+class ValidateRowTest(unittest.TestCase):
+
+    def row(self, **fields):
+        return {"username": "alice", "phone_number": "0701", "password": "secret", **fields}
+
+    def error(self, **fields):
+        row, error = bulk_import.validate_row(self.row(**fields))
+        self.assertIsNone(row)
+        return error
+
+    def test_valid_row_is_normalized(self):
+        row, error = bulk_import.validate_row(self.row(username=" alice ", phone_number=701,
+                                                       balance_fcfa="1500", balance_stablecoin="2.5"))
+        self.assertIsNone(error)
+        self.assertEqual(row, {"username": "alice", "phone_number": "701", "password": "secret",
+                               "password_hash": None, "balance_fcfa": 1500, "balance_stablecoin": 2.5})
+
+    def test_missing_fields(self):
+        self.assertEqual(self.error(username=""), "username manquant.")
+        self.assertEqual(self.error(phone_number=None), "phone_number manquant.")
+        self.assertEqual(self.error(password=""), "password ou password_hash requis.")
+
+    def test_non_string_password_never_reaches_bcrypt(self):
+        self.assertEqual(self.error(password=123), "password doit être une chaîne.")
+        self.assertEqual(self.error(password=None, password_hash=["$2b$"]), "password_hash doit être une chaîne.")
+
+    def test_unknown_password_hash(self):
+        self.assertEqual(self.error(password=None, password_hash="md5:abc"),
+                         "password_hash non reconnu (bcrypt attendu).")
+
+    def test_balances(self):
+        self.assertEqual(self.error(balance_fcfa=12.7), "Solde invalide.")
+        self.assertEqual(self.error(balance_fcfa="12.7"), "Solde invalide.")
+        self.assertEqual(self.error(balance_stablecoin="nan"), "Solde invalide.")
+        self.assertEqual(self.error(balance_stablecoin=1e300), "Solde invalide.")
+        self.assertEqual(self.error(balance_fcfa=-1), "Solde négatif.")
+        row, _ = bulk_import.validate_row(self.row(balance_fcfa=12.0))
+        self.assertEqual(row["balance_fcfa"], 12)
+
+
+class BulkImportRouteTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.client = support.client()
+
+    def post(self, body, content_type="application/x-ndjson"):
+        response = self.client.post("/admin/bulk_import/", content=body, headers={"content-type": content_type})
+        self.assertEqual(response.status_code, 200, response.text)
+        return response.json()
+
+    def user(self, **fields):
+        return {"username": support.unique("bulk"), "phone_number": support.unique("07"), "password": "pw",
+                **fields}
+
+    def login(self, username, password):
+        return self.client.post("/login/", json={"username": username, "password": password}).status_code
+
+    def test_row_errors_are_reported_and_valid_rows_imported(self):
+        good, numeric, fractional = self.user(), self.user(password=123), self.user(balance_fcfa=12.7)
+        report = self.post(ndjson(good, numeric, fractional) + "pas du json\n")
+        self.assertEqual(report["imported"], 1)
+        self.assertEqual(report["failed"], 3)
+        self.assertEqual([(e["row"], e["error"]) for e in report["errors"]], [
+            (2, "password doit être une chaîne."), (3, "Solde invalide."), (4, "JSON invalide.")])
+        self.assertEqual(self.login(good["username"], "pw"), 200)
+
+    def test_duplicate_names_and_phones(self):
+        existing = self.user()
+        self.post(ndjson(existing))
+        first = self.user()
+        rows = [first, self.user(username=first["username"]), self.user(phone_number=first["phone_number"]),
+                self.user(username=existing["username"]), self.user(phone_number=existing["phone_number"])]
+        report = self.post(ndjson(*rows))
+        self.assertEqual(report["imported"], 1)
+        self.assertEqual([(e["row"], e["error"]) for e in report["errors"]], [
+            (2, USER_EXISTS), (3, PHONE_TAKEN), (4, USER_EXISTS), (5, PHONE_TAKEN)])
+
+    def test_csv_with_precomputed_hash(self):
+        username = support.unique("csv")
+        password_hash = hashing.hash_password("secret")
+        body = f"username,phone_number,password_hash,balance_fcfa\n{username},{support.unique('07')},{password_hash},250\n"
+        report = self.post(body, "text/csv")
+        self.assertEqual((report["imported"], report["failed"]), (1, 0))
+        self.assertEqual(self.login(username, "secret"), 200)
+
+    def test_one_commit_per_chunk(self):
+        import main
+
+        rows = [self.user() for _ in range(5)]
+        with mock.patch.object(main, "BULK_IMPORT_CHUNK", 2), \
+                mock.patch.object(main.accounts, "import_accounts", wraps=main.accounts.import_accounts) as commit:
+            report = self.post(ndjson(*rows))
+        self.assertEqual(report["imported"], 5)
+        self.assertEqual([len(call.args[0]) for call in commit.call_args_list], [2, 2, 1])
+        self.assertTrue(all(main.accounts.exists(row["username"]) for row in rows))
+
+    def test_chunk_rechecks_accounts_created_while_hashing(self):
+        import main
+
+        row = self.user()
+        prepared = bulk_import.prepare_account(bulk_import.validate_row(row)[0])
+        main.accounts.create_account(row["username"], {**prepared, "phone_numbers": [support.unique("07")]})
+        errors = main.accounts.import_accounts([(1, row["username"], prepared)])
+        self.assertEqual(errors, [(1, USER_EXISTS)])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,81 @@
+"""Liste des DID : pages triées par curseur, recherche par préfixe et par sous-chaîne.
+
+    python -m unittest discover tests
+"""
+import threading
+import unittest
+from unittest import mock
+
+import support
+
+import accounts as accounts_module  # noqa: E402
+from accounts import AccountService  # noqa: E402
+
+
+class DidPageTest(unittest.TestCase):
+
+    def setUp(self):
+        self.store = support.open_store()
+        self.accounts = AccountService(self.store)
+        for i in range(40):
+            self.open_account(f"u{i:02d}", f"did:transferz:{'ab' if i % 3 == 0 else 'cd'}-{i:02d}")
+        self.dids = sorted(self.store.dids_sorted)
+
+    def tearDown(self):
+        self.accounts.close()
+        self.store.close()
+
+    def open_account(self, username, did):
+        self.accounts.create_account(username, {
+            "password": "", "did": did, "private_key": "", "blockchain_address": "",
+            "phone_numbers": [], "balance_fcfa": 0, "balance_stablecoin": 0,
+        })
+
+    def walk(self, q=None, match="prefix", limit=4):
+        found, cursor = [], None
+        while True:
+            page = self.accounts.did_page(cursor, q, match, limit)
+            found.extend(page[:limit])
+            if len(page) <= limit:
+                return found
+            cursor = page[limit - 1]
+
+    def test_pages_follow_the_cursor(self):
+        self.assertEqual(self.accounts.did_page(None, None, "prefix", 5), self.dids[:6])
+        self.assertEqual(self.walk(limit=7), self.dids)
+
+    def test_prefix(self):
+        expected = [d for d in self.dids if d.startswith("did:transferz:ab")]
+        self.assertEqual(self.walk("did:transferz:ab", limit=3), expected)
+
+    def test_substring_across_scan_chunks(self):
+        expected = [d for d in self.dids if "ab-" in d]
+        for chunk in (1, 5, 4096):
+            with mock.patch.object(accounts_module, "DID_SCAN_CHUNK", chunk):
+                self.assertEqual(self.walk("ab-", "substring", limit=3), expected)
+                self.assertEqual(self.accounts.did_page(None, "absent", "substring", 3), [])
+
+    def test_substring_scan_with_concurrent_registrations(self):
+        stop = threading.Event()
+
+        def register():
+            i = 0
+            while not stop.is_set():
+                # Triés avant les DID cherchés : la liste se décale pendant le parcours
+                self.open_account(f"new{i}", f"did:transferz:aa-{i:05d}")
+                i += 1
+
+        writer = threading.Thread(target=register)
+        writer.start()
+        try:
+            with mock.patch.object(accounts_module, "DID_SCAN_CHUNK", 2):
+                for _ in range(20):
+                    found = self.walk("ab-", "substring", limit=2)
+                    self.assertEqual(found, [d for d in self.dids if "ab-" in d])
+        finally:
+            stop.set()
+            writer.join()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,96 @@
+"""Flux SSE : remise des écritures aux abonnés, fermeture sur file pleine, compteurs.
+
+    python -m unittest discover tests
+"""
+import json
+import asyncio
+import unittest
+
+import support
+
+import ledger  # noqa: E402
+from events import EventBus  # noqa: E402
+
+ALICE = ("alice", "did:transferz:alice")
+BOB = ("bob", "did:transferz:bob")
+
+
+def transfer(entry_id):
+    entry = {"id": entry_id, "type": ledger.TRANSFER, "currency": "USDT", "amount": 1,
+             "sender": ALICE[0], "sender_did": ALICE[1], "receiver": BOB[0], "receiver_did": BOB[1]}
+    return entry, {ALICE[1]: {"balance_stablecoin": 100 - entry_id}, BOB[1]: {"balance_stablecoin": entry_id}}
+
+
+async def drain(bus, subscription):
+    """Événements du flux jusqu'à sa fermeture : [(id, données)]."""
+    events = []
+    async for chunk in bus.stream(subscription):
+        if chunk.startswith("id: "):
+            lines = chunk.splitlines()
+            events.append((int(lines[0][4:]), json.loads(lines[2][6:])))
+    return events
+
+
+class EventBusTest(unittest.TestCase):
+
+    def run_bus(self, queue_size, entries, *subscribers):
+        """Publie `entries` d'un coup, puis lit chaque flux ; renvoie les événements par abonné."""
+        bus = EventBus(None, None, queue_size=queue_size)
+
+        async def scenario():
+            subscriptions = [bus.subscribe(*who) for who in subscribers]
+            bus.publish([transfer(i) for i in entries])
+            await asyncio.sleep(0)  # _deliver passe par call_soon_threadsafe
+            streams = [asyncio.wait_for(drain(bus, s), 1) for s in subscriptions]
+            return await asyncio.gather(*streams, return_exceptions=True)
+
+        return bus, asyncio.run(scenario())
+
+    def test_events_reach_both_parties_with_their_own_balances(self):
+        bus = EventBus(None, None)
+
+        async def scenario():
+            alice, bob = bus.subscribe(*ALICE), bus.subscribe(*BOB)
+            bus.publish([transfer(1)])
+            await asyncio.sleep(0)
+            self.assertEqual([s.queue.qsize() for s in (alice, bob)], [1, 1])
+            return [bus._event(s, *s.queue.get_nowait()) for s in (alice, bob)]
+
+        alice_event, bob_event = asyncio.run(scenario())
+        self.assertIn('"balance_stablecoin": 99', alice_event)
+        self.assertIn('"balance_stablecoin": 1', bob_event)
+        self.assertEqual((bus.published, bus.last_id), (2, 1))
+
+    def test_full_queue_closes_the_stream_and_counts_only_queued_events(self):
+        bus, (events,) = self.run_bus(3, range(1, 6), ALICE)
+        # Les trois premiers sont envoyés, puis le flux se ferme : le client reprend avec Last-Event-ID
+        self.assertEqual([event_id for event_id, _ in events], [1, 2, 3])
+        self.assertEqual((bus.published, bus.overflows), (3, 1))
+        self.assertEqual(bus.subscriber_count(), 0)
+
+    def test_slow_subscriber_does_not_affect_others(self):
+        bus = EventBus(None, None, queue_size=2)
+
+        async def scenario():
+            slow, fast = bus.subscribe(*ALICE), bus.subscribe(*BOB)
+            received = []
+            for i in range(1, 5):
+                bus.publish([transfer(i)])
+                await asyncio.sleep(0)
+                received.append(fast.queue.get_nowait()[0]["id"])  # Lu au fil de l'eau
+            return slow, received
+
+        slow, received = asyncio.run(scenario())
+        self.assertEqual(received, [1, 2, 3, 4])
+        self.assertTrue(slow.overflow)
+        self.assertEqual((bus.published, bus.overflows), (6, 1))
+
+    def test_queue_exactly_full_is_not_an_overflow(self):
+        bus, (events,) = self.run_bus(3, range(1, 4), ALICE)
+        # Flux toujours ouvert après le dernier événement : la lecture expire
+        self.assertIsInstance(events, asyncio.TimeoutError)
+        self.assertEqual((bus.published, bus.overflows), (3, 0))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,81 @@
+"""Réserve de paires de clés : remplissage en fond, génération directe si vide, attente après un échec.
+
+    python -m unittest discover tests
+"""
+import time
+import itertools
+import threading
+import unittest
+
+import support
+
+from keypool import KeyPairPool  # noqa: E402
+
+
+class FlakyGenerator:
+    """Paires numérotées ; échoue tant que `failing` est vrai, en notant l'heure de chaque appel."""
+
+    def __init__(self, failing=False):
+        self.failing = failing
+        self.calls = []
+        self._next = itertools.count()
+
+    def __call__(self):
+        self.calls.append(time.monotonic())
+        if self.failing:
+            raise RuntimeError("entropie indisponible")
+        n = next(self._next)
+        return f"key-{n}", f"0x{n}"
+
+
+class KeyPairPoolTest(unittest.TestCase):
+
+    def pool(self, generate, **kwargs):
+        pool = KeyPairPool(generate=generate, **kwargs)
+        self.addCleanup(pool.close)
+        return pool
+
+    def test_refills_to_high_and_serves_inline_when_empty(self):
+        pool = self.pool(FlakyGenerator(), low=2, high=5)
+        self.assertTrue(pool.wait_for(5, timeout=5))
+        served = [pool.pop() for _ in range(8)]
+        self.assertEqual(len(set(served)), 8)
+        stats = pool.stats()
+        self.assertGreaterEqual(stats["served_from_pool"], 5)
+        self.assertEqual(stats["served_from_pool"] + stats["served_inline"], 8)
+
+    def test_failures_back_off_instead_of_spinning(self):
+        generate = FlakyGenerator(failing=True)
+        pool = self.pool(generate, low=2, high=5, retry_min=0.05, retry_max=0.2)
+        time.sleep(0.6)
+        # Sans attente, le thread réessaierait des milliers de fois ; 0,05 + 0,1 + 0,2 + 0,2 s ≈ 4 à 6 essais
+        self.assertLessEqual(len(generate.calls), 8)
+        self.assertEqual(pool.failures, len(generate.calls))
+        gaps = [b - a for a, b in zip(generate.calls, generate.calls[1:])]
+        self.assertTrue(all(gap >= 0.04 for gap in gaps), gaps)
+
+        generate.failing = False
+        self.assertTrue(pool.wait_for(5, timeout=2))  # Reprise au nouvel essai suivant
+
+    def test_pop_does_not_cut_the_backoff_short(self):
+        generate = FlakyGenerator(failing=True)
+        pool = self.pool(generate, low=2, high=5, retry_min=0.3, retry_max=0.3)
+        time.sleep(0.05)
+        generate.failing = False
+        for _ in range(20):
+            pool.pop()  # Génération directe ; notifie le thread à chaque appel
+        self.assertEqual(pool.failures, 1)
+        self.assertEqual(pool.stats()["depth"], 0)
+
+    def test_close_interrupts_the_backoff(self):
+        generate = FlakyGenerator(failing=True)
+        pool = KeyPairPool(generate=generate, low=2, high=5, retry_min=60, retry_max=60)
+        time.sleep(0.05)
+        closed = threading.Event()
+        threading.Thread(target=lambda: (pool._thread.join(), closed.set()), daemon=True).start()
+        pool.close()
+        self.assertTrue(closed.wait(2))
+
+
+if __name__ == "__main__":
+    unittest.main()
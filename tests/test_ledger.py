@@ -0,0 +1,88 @@
+"""Grand livre : pagination par curseur, filtres par type et par date, historique rattaché au DID.
+
+    python -m unittest discover tests
+"""
+import unittest
+
+import support
+
+import ledger  # noqa: E402
+from accounts import AccountService, Caller  # noqa: E402
+
+
+class LedgerPaginationTest(unittest.TestCase):
+
+    def setUp(self):
+        self.store = support.open_store()
+        self.accounts = AccountService(self.store)
+        self.alice = self.open_account("alice", 100)
+        self.bob = self.open_account("bob")
+        for amount in range(1, 8):
+            self.accounts.transfer(self.alice, self.bob.did, amount)
+        self.accounts.set_balances("alice", 500, 80)
+
+    def tearDown(self):
+        self.accounts.close()
+        self.store.close()
+
+    def open_account(self, username, balance=0, did=None):
+        did = did or f"did:transferz:{username}"
+        self.accounts.create_account(username, {
+            "password": "", "did": did, "private_key": "", "blockchain_address": "",
+            "phone_numbers": [], "balance_fcfa": 0, "balance_stablecoin": balance,
+        })
+        return Caller(username, did)
+
+    def pages(self, caller, **filters):
+        pages, cursor = [], None
+        while True:
+            items, cursor = self.accounts.history(caller, cursor=cursor, **filters)
+            pages.append([e["id"] for e in items])
+            if cursor is None:
+                return pages
+
+    def test_cursor_walks_history_newest_first_without_gaps(self):
+        # Solde d'ouverture, 7 transferts, édition admin
+        everything = [e["id"] for e in self.accounts.history(self.alice, limit=100)[0]]
+        self.assertEqual(len(everything), 9)
+        self.assertEqual(everything, sorted(everything, reverse=True))
+
+        pages = self.pages(self.alice, limit=4)
+        self.assertEqual([len(p) for p in pages], [4, 4, 1])
+        self.assertEqual([i for page in pages for i in page], everything)
+
+    def test_exact_last_page_has_no_cursor(self):
+        pages = self.pages(self.bob, limit=7)
+        self.assertEqual([len(p) for p in pages], [7])
+
+    def test_type_filter(self):
+        items, cursor = self.accounts.history(self.alice, entry_type=ledger.ADMIN_BALANCE)
+        self.assertEqual([e["type"] for e in items], [ledger.ADMIN_BALANCE] * 2)
+        self.assertIsNone(cursor)
+        pages = self.pages(self.bob, limit=3, entry_type=ledger.TRANSFER)
+        self.assertEqual([len(p) for p in pages], [3, 3, 1])
+
+    def test_time_window(self):
+        transfers = self.accounts.history(self.bob, limit=100)[0][::-1]
+        since, until = transfers[2]["ts"], transfers[4]["ts"]
+        expected = [e["id"] for e in reversed(transfers) if since <= e["ts"] <= until]
+        self.assertGreaterEqual(len(expected), 3)
+        items, _ = self.accounts.history(self.bob, since=since, until=until)
+        self.assertEqual([e["id"] for e in items], expected)
+        pages = self.pages(self.bob, limit=2, since=since, until=until)
+        self.assertEqual([i for page in pages for i in page], expected)
+        self.assertTrue(all(len(page) <= 2 for page in pages))
+
+    def test_history_follows_the_did_not_the_name(self):
+        self.accounts.delete_account("bob")
+        bob = self.open_account("bob", did="did:transferz:bob-2")
+        self.assertEqual(self.accounts.history(bob), ([], None))
+        self.accounts.transfer(self.alice, bob.did, 1)
+        items, _ = self.accounts.history(bob)
+        self.assertEqual([(e["receiver_did"], e["amount"]) for e in items], [(bob.did, 1)])
+        # L'historique de l'ancien compte reste celui de son DID
+        self.assertEqual(len(self.accounts.book.history("did:transferz:bob", limit=100)[0]), 7)
+
+
+if __name__ == "__main__":
+    unittest.main()
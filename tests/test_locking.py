@@ -0,0 +1,119 @@
+"""Verrous de compte répartis sur des verrous fixes : ordre de prise et conservation des soldes.
+
+    python -m unittest discover tests
+"""
+import random
+import threading
+import unittest
+
+import support
+
+from locking import TransactionManager  # noqa: E402
+from accounts import AccountError, AccountService, Caller  # noqa: E402
+from balances import STABLECOIN  # noqa: E402
+
+THREADS = 16
+TRANSFERS = 200
+
+
+class TransactionManagerTest(unittest.TestCase):
+
+    def test_opposite_orders_do_not_deadlock(self):
+        txm = TransactionManager(stripes=8)
+        keys = [f"did:transferz:{i}" for i in range(6)]
+        done = []
+
+        def worker(seed):
+            rng = random.Random(seed)
+            for _ in range(2000):
+                a, b = rng.sample(keys, 2)
+                with txm.locked(a, b):
+                    pass
+            done.append(seed)
+
+        threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join(timeout=30)
+        self.assertEqual(len(done), len(threads), "interblocage entre verrous pris dans des ordres opposés")
+
+    def test_keys_on_the_same_stripe_are_taken_once(self):
+        # Une seule bande : les deux clés partagent le verrou, non réentrant
+        txm = TransactionManager(stripes=1)
+        with txm.locked("did:a", "did:b", "did:a"):
+            pass
+
+    def test_lock_count_does_not_grow_with_keys(self):
+        txm = TransactionManager(stripes=4)
+        for i in range(1000):
+            with txm.locked(f"did:inconnu:{i}"):
+                pass
+        self.assertEqual(len(txm._locks), 4)
+
+    def test_disjoint_keys_do_not_wait(self):
+        txm = TransactionManager(stripes=64)
+        a, b = "did:a", next(f"did:{i}" for i in range(1000) if hash(f"did:{i}") % 64 != hash("did:a") % 64)
+        entered = threading.Event()
+
+        def take():
+            with txm.locked(b):
+                entered.set()
+
+        with txm.locked(a):
+            threading.Thread(target=take, daemon=True).start()
+            self.assertTrue(entered.wait(5))
+
+
+class ConcurrentTransfersTest(unittest.TestCase):
+
+    def setUp(self):
+        self.store = support.open_store()
+        self.accounts = AccountService(self.store, TransactionManager(stripes=4))
+        self.callers = []
+        for i in range(8):
+            username = f"lock{i}"
+            did = f"did:transferz:lock-{i}"
+            self.accounts.create_account(username, {
+                "password": "", "did": did, "private_key": "", "blockchain_address": "",
+                "phone_numbers": [], "balance_fcfa": 0, "balance_stablecoin": 100,
+            })
+            self.callers.append(Caller(username, did))
+
+    def tearDown(self):
+        self.accounts.close()
+        self.store.close()
+
+    def test_concurrent_transfers_conserve_supply(self):
+        supply = self.store.balances.total_supply(STABLECOIN)
+        outcomes = {"ok": 0, "refused": 0}
+        lock = threading.Lock()
+
+        def worker(seed):
+            rng = random.Random(seed)
+            for _ in range(TRANSFERS):
+                sender, receiver = rng.sample(self.callers, 2)
+                try:
+                    self.accounts.transfer(sender, receiver.did, rng.randint(1, 40))
+                    key = "ok"
+                except AccountError:
+                    key = "refused"  # Solde insuffisant
+                with lock:
+                    outcomes[key] += 1
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(THREADS)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(sum(outcomes.values()), THREADS * TRANSFERS)
+        self.assertGreater(outcomes["ok"], 0)
+        self.assertEqual(self.store.balances.total_supply(STABLECOIN), supply)
+        self.assertTrue(all(self.store.balances.get(c.username, STABLECOIN) >= 0 for c in self.callers))
+        # Chaque solde est celui que décrit le grand livre
+        self.assertEqual(self.accounts.reconciler.audit(), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
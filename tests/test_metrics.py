@@ -0,0 +1,83 @@
+"""Métriques Prometheus : rendu texte, jauges des comptes lues une fois par scrape.
+
+    python -m unittest discover tests
+"""
+import threading
+import unittest
+from unittest import mock
+
+import support
+
+import metrics  # noqa: E402
+
+
+class RegistryTest(unittest.TestCase):
+
+    def test_counter_and_labels(self):
+        registry = metrics.Registry()
+        counter = registry.register(metrics.Counter("t_requests_total", "Requêtes", ["route"]))
+        counter.inc('/a"b')
+        counter.inc('/a"b', amount=2)
+        self.assertIn('t_requests_total{route="/a\\"b"} 3', registry.render())
+
+    def test_per_scrape_value_is_shared_within_one_render(self):
+        calls = []
+        gauges = metrics.per_scrape(lambda: calls.append(1) or {"a": len(calls), "b": 10})
+        registry = metrics.Registry()
+        for key in ("a", "b"):
+            registry.register(metrics.CallbackMetric(f"t_{key}", key, lambda key=key: {(): gauges()[key]}))
+
+        first = registry.render()
+        self.assertEqual(len(calls), 1)
+        self.assertIn("t_a 1", first)
+        self.assertIn("t_a 2", registry.render())  # Nouveau scrape : nouvelle lecture
+        self.assertEqual(gauges()["a"], 3)  # Hors rendu : pas de cache
+
+    def test_concurrent_renders_do_not_share_values(self):
+        entered, release = threading.Event(), threading.Event()
+        values = iter([1, 2])
+        lock = threading.Lock()
+
+        def read():
+            with lock:
+                value = next(values)
+            if value == 1:
+                entered.set()
+                release.wait(5)
+            return value
+
+        shared = metrics.per_scrape(read)
+        registry = metrics.Registry()
+        registry.register(metrics.CallbackMetric("t_x", "x", lambda: {(): shared()}))
+        registry.register(metrics.CallbackMetric("t_y", "y", lambda: {(): shared()}))
+        results = {}
+        slow = threading.Thread(target=lambda: results.setdefault("slow", registry.render()))
+        slow.start()
+        entered.wait(5)
+        results["fast"] = registry.render()
+        release.set()
+        slow.join(5)
+        self.assertIn("t_x 1\n", results["slow"])
+        self.assertIn("t_y 1\n", results["slow"])
+        self.assertIn("t_x 2\n", results["fast"])
+        self.assertIn("t_y 2\n", results["fast"])
+
+
+class MetricsRouteTest(unittest.TestCase):
+
+    def test_account_gauges_read_once_per_scrape(self):
+        import main
+
+        client = support.client()
+        with mock.patch.object(main.accounts, "gauges", wraps=main.accounts.gauges) as gauges:
+            body = client.get("/metrics").text
+            self.assertEqual(gauges.call_count, 1)
+            client.get("/metrics")
+            self.assertEqual(gauges.call_count, 2)
+        for name in ("transferz_total_supply", "transferz_reconciliation_discrepancies",
+                     "transferz_deposit_queue_depth", "transferz_deposits_settled_total"):
+            self.assertIn(f"# TYPE {name}", body)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,95 @@
+"""Profilage à la demande : journal des requêtes les plus lentes, accès aux profils réservé au jeton.
+
+    python -m unittest discover tests
+"""
+import unittest
+from unittest import mock
+
+import support
+
+import profiling  # noqa: E402
+from profiling import ProfilingMiddleware, RequestProfile, SlowRequestLog  # noqa: E402
+
+TOKEN = "jeton-de-test"
+
+
+def request(duration, route="/transfer/"):
+    profile = RequestProfile("POST", route)
+    profile.route = route
+    profile.duration = duration
+    return profile
+
+
+class SlowRequestLogTest(unittest.TestCase):
+
+    def test_keeps_the_slowest_per_route(self):
+        log = SlowRequestLog(keep=2)
+        profiles = [request(d) for d in (0.1, 0.5, 0.2, 0.9)] + [request(0.05, "/me/")]
+        for profile in profiles:
+            log.offer(profile)
+        slowest = log.slowest()
+        self.assertEqual([p["duration_ms"] for p in slowest["POST /transfer/"]], [900, 500])
+        self.assertEqual(len(slowest["POST /me/"]), 1)
+        self.assertIs(log.get(profiles[3].id), profiles[3])
+        self.assertIsNone(log.get(profiles[0].id))
+
+
+class TokenTest(unittest.TestCase):
+
+    def test_token_matches(self):
+        with mock.patch.object(profiling, "TOKEN", TOKEN):
+            self.assertTrue(profiling.token_matches(TOKEN))
+            self.assertTrue(profiling.token_matches(TOKEN.encode()))
+            self.assertFalse(profiling.token_matches("jeton"))
+            self.assertFalse(profiling.token_matches("é" + TOKEN))
+            self.assertFalse(profiling.token_matches(None))
+        with mock.patch.object(profiling, "TOKEN", ""):
+            self.assertFalse(profiling.token_matches(""))
+
+    def test_middleware_selection(self):
+        middleware = ProfilingMiddleware(None, SlowRequestLog(), sample_rate=0, token=TOKEN)
+
+        def wanted(path, value=None):
+            headers = [(profiling.HEADER, value.encode())] if value is not None else []
+            return middleware._wanted({"path": path, "headers": headers})
+
+        self.assertTrue(wanted("/me/", TOKEN))
+        self.assertFalse(wanted("/me/", "autre"))
+        self.assertFalse(wanted("/me/"))
+        self.assertFalse(wanted("/admin/profiles/3", TOKEN))
+
+
+class ProfileRoutesTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        import main
+
+        cls.client = support.client()
+        cls.profile = request(0.3)
+        main.slow_requests.offer(cls.profile)
+
+    def get(self, path, token=None):
+        headers = {"X-Transferz-Profile": token} if token is not None else {}
+        with mock.patch.object(profiling, "TOKEN", TOKEN):
+            return self.client.get(path, headers=headers)
+
+    def test_token_required(self):
+        for path in ("/admin/profiles/", f"/admin/profiles/{self.profile.id}"):
+            self.assertEqual(self.get(path).status_code, 403)
+            self.assertEqual(self.get(path, "mauvais").status_code, 403)
+        # Sans TRANSFERZ_PROFILE_TOKEN, les profils ne sont pas lisibles
+        self.assertEqual(self.client.get("/admin/profiles/", headers={"X-Transferz-Profile": ""}).status_code, 403)
+
+    def test_read_with_token(self):
+        listing = self.get("/admin/profiles/", TOKEN)
+        self.assertEqual(listing.status_code, 200)
+        self.assertIn("POST /transfer/", listing.json()["routes"])
+        summary = self.get(f"/admin/profiles/{self.profile.id}", TOKEN)
+        self.assertEqual(summary.json()["duration_ms"], 300)
+        # Pas de profil cProfile attaché à cette requête
+        self.assertEqual(self.get(f"/admin/profiles/{self.profile.id}?format=pstats", TOKEN).status_code, 404)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,116 @@
+"""Limitation de débit : seaux à jetons, IP lue dans X-Forwarded-For derrière N proxys, 429.
+
+    python -m unittest discover tests
+"""
+import unittest
+from unittest import mock
+
+import support
+
+from fastapi import FastAPI  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+
+from ratelimit import RateLimiter, RateLimitMiddleware, limiter_from_env  # noqa: E402
+
+
+class RateLimiterTest(unittest.TestCase):
+
+    def test_burst_then_refill(self):
+        limiter = RateLimiter(rate=2, burst=3)
+        self.assertEqual([limiter.acquire("ip", now=0) for _ in range(3)], [0, 0, 0])
+        self.assertAlmostEqual(limiter.acquire("ip", now=0), 0.5)
+        self.assertEqual(limiter.acquire("other", now=0), 0)  # Budget propre à chaque clé
+        self.assertEqual(limiter.acquire("ip", now=0.5), 0)
+
+    def test_idle_buckets_are_evicted(self):
+        limiter = RateLimiter(rate=1, burst=2)
+        limiter.acquire("a", now=0)
+        limiter.acquire("b", now=1)
+        limiter.acquire("c", now=2.5)  # "a" est de nouveau plein : équivaut à une clé absente
+        self.assertEqual(len(limiter), 2)
+        bounded = RateLimiter(rate=1, burst=100, max_keys=2)
+        for i, key in enumerate("abc"):
+            bounded.acquire(key, now=i)
+        self.assertEqual(len(bounded), 2)
+
+    def test_limiter_from_env(self):
+        with mock.patch.dict("os.environ", {"TRANSFERZ_RATE_LIMIT_AUTH_IP": "0.5:10"}):
+            limiter = limiter_from_env("auth_ip", "1:1")
+        self.assertEqual((limiter.rate, limiter.burst), (0.5, 10))
+        with mock.patch.dict("os.environ", {"TRANSFERZ_RATE_LIMIT_AUTH_IP": "0"}):
+            self.assertIsNone(limiter_from_env("auth_ip", "1:1"))
+
+
+class ClientIpTest(unittest.TestCase):
+
+    def client_ip(self, trust_proxy, forwarded=None, peer=("10.0.0.1", 443)):
+        middleware = RateLimitMiddleware(None, {}, None, None, trust_proxy=trust_proxy)
+        headers = {b"x-forwarded-for": forwarded.encode()} if forwarded is not None else {}
+        return middleware._client_ip({"client": peer}, headers)
+
+    def test_header_ignored_without_trusted_proxy(self):
+        self.assertEqual(self.client_ip(0, "1.2.3.4"), "10.0.0.1")
+        self.assertEqual(self.client_ip(1, None), "10.0.0.1")
+        self.assertEqual(self.client_ip(0, None, peer=None), "unknown")
+
+    def test_nth_entry_from_the_right(self):
+        self.assertEqual(self.client_ip(1, "203.0.113.7"), "203.0.113.7")
+        self.assertEqual(self.client_ip(1, "198.51.100.1, 203.0.113.7"), "203.0.113.7")
+        self.assertEqual(self.client_ip(2, "203.0.113.7, 192.168.1.10"), "203.0.113.7")
+
+    def test_spoofed_left_entries_do_not_change_the_ip(self):
+        # Le client envoie lui-même un X-Forwarded-For ; le proxy y ajoute l'adresse réelle
+        for spoofed in ("1.1.1.1", "1.1.1.1, 2.2.2.2", "x, y, z, w"):
+            self.assertEqual(self.client_ip(1, f"{spoofed}, 203.0.113.7"), "203.0.113.7")
+            self.assertEqual(self.client_ip(2, f"{spoofed}, 203.0.113.7, 192.168.1.10"), "203.0.113.7")
+
+    def test_fewer_hops_than_trusted_proxies(self):
+        self.assertEqual(self.client_ip(3, "203.0.113.7, 192.168.1.10"), "203.0.113.7")
+
+
+class RateLimitMiddlewareTest(unittest.TestCase):
+
+    def setUp(self):
+        app = FastAPI()
+
+        @app.get("/login/")
+        def login():
+            return {"ok": True}
+
+        @app.get("/health")
+        def health():
+            return {"ok": True}
+
+        limits = {"auth": {"ip": RateLimiter(rate=0.01, burst=2), "user": RateLimiter(rate=0.01, burst=1)}}
+        classify = {"/login/": "auth"}.get
+        self.client = TestClient(RateLimitMiddleware(app, limits, classify, {"good": "alice"}.get, trust_proxy=1))
+
+    def get(self, path, ip="203.0.113.7", token=None):
+        headers = {"X-Forwarded-For": ip}
+        if token:
+            headers["Authorization"] = f"Bearer {token}"
+        return self.client.get(path, headers=headers)
+
+    def test_429_with_retry_after_once_the_ip_budget_is_spent(self):
+        self.assertEqual([self.get("/login/").status_code for _ in range(2)], [200, 200])
+        response = self.get("/login/")
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response.headers["retry-after"], "100")
+        self.assertIn("réessayez", response.json()["detail"])
+        # Autre IP, route sans classe : non limitées
+        self.assertEqual(self.get("/login/", ip="198.51.100.1").status_code, 200)
+        self.assertEqual(self.get("/health").status_code, 200)
+
+    def test_spoofed_header_does_not_buy_a_new_budget(self):
+        codes = [self.get("/login/", ip=f"10.9.9.{i}, 203.0.113.7").status_code for i in range(3)]
+        self.assertEqual(codes, [200, 200, 429])
+
+    def test_user_budget_follows_the_token_across_ips(self):
+        self.assertEqual(self.get("/login/", ip="198.51.100.1", token="good").status_code, 200)
+        self.assertEqual(self.get("/login/", ip="198.51.100.2", token="good").status_code, 429)
+        # Token invalide : seul le budget de l'IP s'applique
+        self.assertEqual(self.get("/login/", ip="198.51.100.3", token="bad").status_code, 200)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,96 @@
+"""Rapprochement grand livre / soldes : écarts détectés par check() et audit(), reprise au démarrage.
+
+    python -m unittest discover tests
+"""
+import uuid
+import unittest
+
+import support
+
+import storage  # noqa: E402
+from accounts import AccountService, Caller  # noqa: E402
+
+
+class ReconcilerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.suffix = f"test-{uuid.uuid4().hex[:8]}"
+        self.open()
+        self.alice = self.open_account("alice", 100)
+        self.bob = self.open_account("bob")
+
+    def open(self):
+        self.store = storage.open_store(suffix=self.suffix)
+        self.accounts = AccountService(self.store)
+        self.reconciler = self.accounts.reconciler
+
+    def tearDown(self):
+        self.accounts.close()
+        self.store.close()
+
+    def open_account(self, username, balance=0, did=None):
+        did = did or f"did:transferz:{username}"
+        self.accounts.create_account(username, {
+            "password": "", "did": did, "private_key": "", "blockchain_address": "",
+            "phone_numbers": [], "balance_fcfa": 0, "balance_stablecoin": balance,
+        })
+        return Caller(username, did)
+
+    def tamper(self, username, **balances):
+        """Solde écrit sans écriture au grand livre."""
+        self.store.wait(self.store.submit(storage.set_balance(username, **balances)))
+
+    def test_ledgered_operations_reconcile(self):
+        self.accounts.transfer(self.alice, self.bob.did, 30)
+        self.accounts.set_balances("bob", 1500, 45)
+        self.assertEqual(self.reconciler.check(), 2)
+        self.assertEqual(self.reconciler.discrepancies, {})
+        self.assertEqual(self.reconciler.audit(), 0)
+        totals = self.reconciler.totals()["stablecoin"]
+        self.assertEqual((totals["stored"], totals["expected"], totals["net_issued"]), (115, 115, 115))
+
+    def test_check_finds_a_balance_written_outside_the_ledger(self):
+        self.reconciler.check()
+        self.tamper("bob", balance_stablecoin=7)
+        self.assertEqual(self.reconciler.check(), 1)  # Seul le compte modifié est revérifié
+        self.assertEqual(self.reconciler.discrepancies,
+                         {"bob": {"stablecoin": {"stored": 7, "expected": 0}}})
+        report = self.accounts.reconciliation()
+        self.assertEqual(report["discrepancy_count"], 1)
+        self.assertEqual(report["discrepancies"][0]["username"], "bob")
+
+        # Remis au solde du grand livre : l'écart disparaît au contrôle suivant
+        self.tamper("bob", balance_stablecoin=0)
+        self.reconciler.check()
+        self.assertEqual(self.reconciler.discrepancies, {})
+
+    def test_audit_compares_every_account(self):
+        self.tamper("alice", balance_fcfa=10)
+        self.reconciler._dirty.clear()  # Marque perdue : check() ne le verrait plus
+        self.assertEqual(self.reconciler.check(), 0)
+        self.assertEqual(self.reconciler.audit(), 1)
+        self.assertEqual(self.reconciler.discrepancies["alice"], {"fcfa": {"stored": 10, "expected": 0}})
+
+    def test_deleting_the_account_clears_its_discrepancy(self):
+        self.tamper("bob", balance_stablecoin=7)
+        self.reconciler.check()
+        self.accounts.delete_account("bob")
+        self.assertNotIn("bob", self.reconciler.discrepancies)
+        self.assertEqual(self.reconciler.audit(), 0)
+
+    def test_restart_rebuilds_expected_balances_from_the_ledger(self):
+        self.accounts.transfer(self.alice, self.bob.did, 30)
+        # Nom réutilisé : les écritures de l'ancien compte ne comptent pas pour le nouveau
+        self.accounts.delete_account("bob")
+        self.open_account("bob", did="did:transferz:bob-2")
+        self.tamper("alice", balance_stablecoin=99)
+        self.accounts.close()
+        self.store.close()
+
+        self.open()
+        self.assertEqual(self.reconciler.discrepancies,
+                         {"alice": {"stablecoin": {"stored": 99, "expected": 70}}})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,253 @@
+"""Mode multi-processus : pannes du commit à deux phases et reprise par les résolveurs.
+
+Démarre de vrais processus shards (store JSON dans un répertoire temporaire,
+TRANSFERZ_2PC_TIMEOUT court), simule la chute du worker coordinateur à
+chaque étape en n'envoyant qu'une partie des appels, puis vérifie que les
+résolveurs ramènent les shards dans un état cohérent.
+
+    python -m unittest discover tests
+"""
+import os
+import sys
+import time
+import uuid
+import signal
+import asyncio
+import tempfile
+import unittest
+import multiprocessing
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend")
+WORK_DIR = tempfile.mkdtemp(prefix="transferz-test-shards-")
+SHARDS = 3
+
+# Lu à l'import de shards.py, ici comme dans les processus shards
+os.environ["TRANSFERZ_2PC_TIMEOUT"] = "1"
+os.environ["TRANSFERZ_DB_PATH"] = os.path.join(WORK_DIR, "database.json")
+os.environ["TRANSFERZ_SQLITE_PATH"] = os.path.join(WORK_DIR, "transferz.db")
+os.environ["TRANSFERZ_LOG_LEVEL"] = "WARNING"
+os.environ["TRANSFERZ_VELOCITY_RULES"] = "0"
+sys.path.insert(0, BACKEND_DIR)
+
+import shards  # noqa: E402
+from accounts import Caller  # noqa: E402
+from shards import CLAIMS, ShardError, ShardRouter, ShardedAccounts  # noqa: E402
+
+SETTLE_TIMEOUT = 15
+
+
+def eventually(predicate, timeout=SETTLE_TIMEOUT):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.1)
+    return predicate()
+
+
+class ShardedTestCase(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = os.path.join(WORK_DIR, "sockets")
+        cls.processes = shards.start_shards(SHARDS, cls.directory)
+        cls.router = ShardRouter(SHARDS, cls.directory)
+        cls.accounts = ShardedAccounts(cls.router)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.router.close()
+        shards.stop_shards(cls.processes)
+
+    def did_on(self, index):
+        while True:
+            did = f"did:transferz:{uuid.uuid4()}"
+            if shards.shard_of(did, SHARDS) == index:
+                return did
+
+    def open_account(self, index, balance=0):
+        username = f"u{uuid.uuid4().hex[:12]}"
+        did = self.did_on(index)
+        self.accounts.create_account(username, {
+            "password": "", "did": did, "private_key": "", "blockchain_address": "",
+            "phone_numbers": [], "balance_fcfa": 0, "balance_stablecoin": balance,
+        })
+        return Caller(username, did)
+
+    def balance(self, caller):
+        return self.accounts.profile(caller, 0)["balance_stablecoin"]
+
+    def stats(self, index):
+        return self.router.call(index, "stats")
+
+    def settled(self, *indexes):
+        return all(self.stats(index)["open_intents"] == 0 for index in indexes)
+
+    def restart(self, index):
+        """Tue le shard (SIGKILL, sans fermeture propre) et le relance sur le même fichier."""
+        process = self.processes[index]
+        os.kill(process.pid, signal.SIGKILL)
+        process.join()
+        self.router.close()
+        ctx = multiprocessing.get_context("spawn")
+        process = ctx.Process(target=shards._run_shard, args=(index, SHARDS, self.directory), name=f"shard-{index}")
+        process.start()
+        self.processes[index] = process
+        self.assertTrue(eventually(lambda: self._reachable(index)))
+
+    def _reachable(self, index):
+        try:
+            self.stats(index)
+            return True
+        except ShardError:
+            return False
+
+
+class TwoPhaseCommitRecoveryTest(ShardedTestCase):
+
+    def prepare(self, sender, receiver, amount):
+        txid = uuid.uuid4().hex
+        s = shards.shard_of(sender.did, SHARDS)
+        legs = self.router.call(s, "prepare_transfer", txid=txid, caller=sender, receiver_did=receiver.did,
+                                receiver=receiver.username, amount=amount)
+        return txid, s, legs
+
+    def test_coordinator_crash_after_debit_prepare_refunds_sender(self):
+        sender, receiver = self.open_account(0, 10), self.open_account(1)
+        self.prepare(sender, receiver, 4)
+        self.assertEqual(self.balance(sender), 6)  # Fonds réservés
+
+        self.assertTrue(eventually(lambda: self.settled(0)))
+        self.assertEqual(self.balance(sender), 10)
+        self.assertEqual(self.balance(receiver), 0)
+
+    def test_coordinator_crash_after_both_prepares_aborts_both_sides(self):
+        sender, receiver = self.open_account(0, 10), self.open_account(1)
+        txid, s, legs = self.prepare(sender, receiver, 4)
+        for r, lines in legs.items():
+            self.router.call(r, "prepare_credit", txid=txid, lines=lines, coordinator=s)
+
+        self.assertTrue(eventually(lambda: self.settled(0, 1)))
+        self.assertEqual(self.balance(sender), 10)
+        self.assertEqual(self.balance(receiver), 0)
+        # Décision d'abandon définitive : un commit en retard est refusé
+        with self.assertRaises(ShardError) as refused:
+            self.router.call(s, "commit_debit", txid=txid)
+        self.assertEqual(refused.exception.status, 409)
+
+    def test_coordinator_crash_after_commit_decision_applies_credit(self):
+        sender, receiver = self.open_account(0, 10), self.open_account(2)
+        txid, s, legs = self.prepare(sender, receiver, 4)
+        for r, lines in legs.items():
+            self.router.call(r, "prepare_credit", txid=txid, lines=lines, coordinator=s)
+        self.router.call(s, "commit_debit", txid=txid)
+
+        self.assertTrue(eventually(lambda: self.settled(0, 2)))
+        self.assertEqual(self.balance(sender), 6)
+        self.assertEqual(self.balance(receiver), 4)
+        credit = self.accounts.history(receiver)[0][0]
+        self.assertEqual((credit["txid"], credit["leg"]), (txid, "credit"))
+
+    def test_coordinator_crash_before_forget_clears_debit_intent(self):
+        sender, receiver = self.open_account(0, 10), self.open_account(1)
+        txid, s, legs = self.prepare(sender, receiver, 4)
+        for r, lines in legs.items():
+            self.router.call(r, "prepare_credit", txid=txid, lines=lines, coordinator=s)
+        self.router.call(s, "commit_debit", txid=txid)
+        for r in legs:
+            self.router.call(r, "commit_credit", txid=txid)
+        self.assertEqual(self.stats(0)["open_intents"], 1)
+
+        self.assertTrue(eventually(lambda: self.settled(0, 1)))
+        # Crédit rejoué par le résolveur : appliqué une seule fois
+        self.assertEqual(self.balance(receiver), 4)
+
+    def test_shard_killed_with_prepared_intent_recovers_after_restart(self):
+        sender, receiver = self.open_account(1, 10), self.open_account(2)
+        txid, s, legs = self.prepare(sender, receiver, 4)
+        for r, lines in legs.items():
+            self.router.call(r, "prepare_credit", txid=txid, lines=lines, coordinator=s)
+        self.restart(s)
+
+        self.assertTrue(eventually(lambda: self.settled(1, 2)))
+        self.assertEqual(self.balance(sender), 10)
+        self.assertEqual(self.balance(receiver), 0)
+
+    def test_cross_shard_batch_conserves_supply(self):
+        sender = self.open_account(0, 100)
+        receivers = [self.open_account(index % SHARDS) for index in range(6)]
+        before = sum(s["total_supply_stablecoin"] for s in self.router.stats())
+
+        summary = self.accounts.transfer_batch(sender, [(r.did, 5) for r in receivers]
+                                               + [("did:transferz:inconnu", 1)], "best_effort")
+        self.assertEqual((summary["applied"], summary["rejected"], summary["total_debited"]), (6, 1, 30))
+        self.assertEqual(self.balance(sender), 70)
+        self.assertEqual([self.balance(r) for r in receivers], [5] * 6)
+        self.assertTrue(self.settled(*range(SHARDS)))
+        self.assertEqual(sum(s["total_supply_stablecoin"] for s in self.router.stats()), before)
+
+        # Lot atomique refusé : rien n'est débité
+        with self.assertRaises(ShardError) as refused:
+            self.accounts.transfer_batch(sender, [(receivers[1].did, 5), (receivers[2].did, 500)], "atomic")
+        self.assertEqual(refused.exception.status, 400)
+        self.assertEqual(self.balance(sender), 70)
+
+    def test_cross_shard_events_reach_both_parties(self):
+        sender, receiver = self.open_account(0, 10), self.open_account(1)
+        bus = self.accounts.event_bus
+
+        async def scenario():
+            outgoing = bus.subscribe(sender.username, sender.did)
+            incoming = bus.subscribe(receiver.username, receiver.did)
+            await asyncio.sleep(0.5)  # Les threads des shards ont relevé leur dernier id
+            await asyncio.to_thread(self.accounts.transfer, sender, receiver.did, 3)
+            sent = await asyncio.wait_for(outgoing.queue.get(), SETTLE_TIMEOUT)
+            received = await asyncio.wait_for(incoming.queue.get(), SETTLE_TIMEOUT)
+            return sent, received
+
+        (sent, sent_balances), (received, received_balances) = asyncio.run(scenario())
+        self.assertEqual((sent["leg"], sent_balances["balance_stablecoin"]), ("debit", 7))
+        self.assertEqual((received["leg"], received_balances["balance_stablecoin"]), ("credit", 3))
+
+
+class UsernameClaimRecoveryTest(ShardedTestCase):
+
+    def user(self, did):
+        return {"password": "", "did": did, "private_key": "", "blockchain_address": "",
+                "phone_numbers": [], "balance_fcfa": 0, "balance_stablecoin": 0}
+
+    def test_orphaned_claim_is_released_and_late_create_refused(self):
+        username = f"orphan{uuid.uuid4().hex[:8]}"
+        abandoned_did, did = self.did_on(0), self.did_on(1)
+        # Worker tombé entre la réservation du nom et la création du compte
+        self.router.call(shards.shard_of(username, SHARDS), "claim", namespace=CLAIMS, key=username,
+                         did=abandoned_did, claim_id="abandoned")
+        with self.assertRaises(ShardError) as taken:
+            self.accounts.create_account(username, self.user(did))
+        self.assertEqual(taken.exception.status, 400)
+
+        self.assertTrue(eventually(lambda: not self.accounts.exists(username)))
+        self.accounts.create_account(username, self.user(did))
+        self.assertEqual(self.accounts.lookup(username=username), did)
+
+        # La création du worker tombé, arrivée en retard, ne passe plus
+        with self.assertRaises(ShardError) as late:
+            self.router.call(0, "create_account", username=username, user=self.user(abandoned_did),
+                             claims=["abandoned"])
+        self.assertEqual(late.exception.status, 409)
+
+    def test_pending_claim_of_created_account_is_activated(self):
+        username = f"slow{uuid.uuid4().hex[:8]}"
+        did = self.did_on(2)
+        index = shards.shard_of(username, SHARDS)
+        # Compte créé, worker tombé avant l'activation
+        self.router.call(index, "claim", namespace=CLAIMS, key=username, did=did, claim_id="created")
+        self.router.call(2, "create_account", username=username, user=self.user(did), claims=["created"])
+        self.assertIsNone(self.accounts.lookup(username=username))
+
+        self.assertTrue(eventually(lambda: self.accounts.lookup(username=username) == did))
+        self.assertEqual(self.accounts.credentials(username)[0], did)
+
+
+if __name__ == "__main__":
+    unittest.main()
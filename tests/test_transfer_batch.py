@@ -0,0 +1,80 @@
+"""/transfer/batch/ : modes atomic et best_effort, sur le store local de main.py.
+
+    python -m unittest discover tests
+"""
+import unittest
+
+import support
+
+
+class TransferBatchTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.client = support.client()
+
+    def open_account(self, balance=0):
+        username = support.unique("batch")
+        response = self.client.post("/register/", json={"username": username, "password": "pw"})
+        self.assertEqual(response.status_code, 200, response.text)
+        did = response.json()["did"]
+        if balance:
+            self.client.post("/admin/update_balance/", json={
+                "username": username, "balance_fcfa": 0, "balance_stablecoin": balance})
+        token = self.client.post("/login/", json={"username": username, "password": "pw"}).json()["access_token"]
+        return {"did": did, "headers": {"Authorization": f"Bearer {token}"}}
+
+    def balance(self, account):
+        return self.client.get("/me/", headers=account["headers"]).json()["balance_stablecoin"]
+
+    def batch(self, sender, lines, mode=None):
+        body = {"transfers": [{"receiver_did": did, "amount": amount} for did, amount in lines]}
+        if mode:
+            body["mode"] = mode
+        return self.client.post("/transfer/batch/", json=body, headers=sender["headers"])
+
+    def setUp(self):
+        self.sender = self.open_account(100)
+        self.bob, self.carol = self.open_account(), self.open_account()
+
+    def test_atomic_applies_every_line_in_one_commit(self):
+        response = self.batch(self.sender, [(self.bob["did"], 10), (self.carol["did"], 15), (self.bob["did"], 5)])
+        self.assertEqual(response.status_code, 200, response.text)
+        summary = response.json()
+        self.assertEqual((summary["applied"], summary["rejected"], summary["total_debited"]), (3, 0, 30))
+        self.assertEqual([self.balance(a) for a in (self.sender, self.bob, self.carol)], [70, 15, 15])
+
+    def test_atomic_refuses_whole_batch_on_one_bad_line(self):
+        response = self.batch(self.sender, [(self.bob["did"], 10), ("did:transferz:inconnu", 5),
+                                            (self.sender["did"], 1)])
+        self.assertEqual(response.status_code, 400)
+        results = response.json()["detail"]["results"]
+        self.assertEqual([r["status"] for r in results], ["not_applied", "rejected", "rejected"])
+        self.assertEqual(results[1]["detail"], "Destinataire non trouvé.")
+        self.assertEqual([self.balance(a) for a in (self.sender, self.bob)], [100, 0])
+
+    def test_best_effort_applies_valid_lines(self):
+        response = self.batch(self.sender, [(self.bob["did"], 60), ("did:transferz:inconnu", 5),
+                                            (self.carol["did"], 50), (self.carol["did"], 40)], "best_effort")
+        self.assertEqual(response.status_code, 200, response.text)
+        summary = response.json()
+        # Le solde est consommé ligne à ligne : la troisième dépasse ce qui reste après la première
+        self.assertEqual([r["status"] for r in summary["results"]], ["ok", "rejected", "rejected", "ok"])
+        self.assertEqual(summary["results"][2]["detail"], "Solde insuffisant")
+        self.assertEqual((summary["applied"], summary["rejected"], summary["total_debited"]), (2, 2, 100))
+        self.assertEqual([self.balance(a) for a in (self.sender, self.bob, self.carol)], [0, 60, 40])
+
+    def test_best_effort_with_no_valid_line_changes_nothing(self):
+        response = self.batch(self.sender, [("did:transferz:inconnu", 5)], "best_effort")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.json()["applied"], response.json()["total_debited"]), (0, 0))
+        self.assertEqual(self.balance(self.sender), 100)
+
+    def test_invalid_requests(self):
+        self.assertEqual(self.batch(self.sender, []).status_code, 400)
+        self.assertEqual(self.batch(self.sender, [(self.bob["did"], -1)]).status_code, 422)
+        self.assertEqual(self.batch(self.sender, [(self.bob["did"], 1)], "partial").status_code, 422)
+
+
+if __name__ == "__main__":
+    unittest.main()
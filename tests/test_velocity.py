@@ -0,0 +1,146 @@
+"""Limites de vélocité : règles activées explicitement, fenêtres glissantes par seaux, refus des transferts.
+
+    python -m unittest discover tests
+"""
+import os
+import json
+import time
+import uuid
+import unittest
+from unittest import mock
+
+import support
+
+import velocity  # noqa: E402
+from accounts import AccountError, AccountService, Caller  # noqa: E402
+from velocity import VelocityEngine, VelocityExceeded, make_rule, rules_from_env  # noqa: E402
+
+RULES = [
+    {"name": "amount_1h", "event": "transfer", "metric": "amount", "window": 3600, "limit": 100, "buckets": 6},
+    {"name": "receivers_1h", "event": "transfer", "metric": "distinct_receivers", "window": 3600, "limit": 2},
+]
+
+
+class RulesFromEnvTest(unittest.TestCase):
+
+    def rules(self, value):
+        env = {"TRANSFERZ_VELOCITY_RULES": value} if value is not None else {}
+        with mock.patch.dict("os.environ", env):
+            if value is None:
+                os.environ.pop("TRANSFERZ_VELOCITY_RULES", None)
+            return rules_from_env()
+
+    def test_no_rules_unless_asked(self):
+        self.assertEqual(self.rules(None), [])
+        self.assertEqual(self.rules("0"), [])
+        self.assertEqual([r.name for r in self.rules("default")], [r["name"] for r in velocity.DEFAULT_RULES])
+
+    def test_rules_file(self):
+        path = os.path.join(support.WORK_DIR, f"velocity-{uuid.uuid4().hex[:8]}.json")
+        with open(path, "w") as f:
+            json.dump(RULES, f)
+        amount, receivers = self.rules(path)
+        self.assertEqual((amount.limit, amount.buckets), (100_000_000, 6))  # Micro-USDT
+        self.assertEqual((receivers.limit, receivers.buckets), (2, 12))
+
+    def test_invalid_rule(self):
+        with self.assertRaises(ValueError):
+            make_rule({**RULES[0], "metric": "median"})
+
+
+class WindowTest(unittest.TestCase):
+
+    def test_sum_window_slides_bucket_by_bucket(self):
+        window = velocity._SumWindow(60, 6)  # Seaux de 10 s
+        window.add(0, 5)
+        window.add(15, 7)
+        self.assertEqual(window.value(59), 12)
+        self.assertEqual(window.value(60), 7)  # Le seau [0, 10) sort de la fenêtre
+        self.assertEqual(window.value(75), 0)
+        window.add(500, 1)  # Saut de plusieurs fenêtres
+        self.assertEqual(window.value(500), 1)
+
+    def test_late_entry_does_not_move_the_window_back(self):
+        window = velocity._SumWindow(60, 6)
+        window.add(100, 1)
+        window.add(95, 2)  # Horloge décalée, encore dans la fenêtre
+        window.add(10, 4)  # Hors fenêtre : dans le plus ancien seau, pas dans le courant
+        self.assertEqual(window.bucket_of(10), window.bucket_of(50))
+        self.assertEqual(window.value(100), 7)
+        self.assertEqual(window.value(110), 3)  # Le plus ancien seau sort en premier
+        self.assertEqual(window.value(160), 0)
+
+    def test_distinct_window(self):
+        window = velocity._DistinctWindow(60, 6)
+        window.add(0, "bob")
+        window.add(20, "bob")
+        window.add(20, "carol")
+        self.assertEqual(window.value(20), 2)
+        self.assertEqual(window.value(20, extra=("bob", "dave")), 3)
+        self.assertEqual(window.value(60), 2)  # "bob" reste compté par son envoi à 20 s
+        self.assertEqual(window.value(80), 0)
+        self.assertEqual(window.seen, {})
+
+
+class VelocityEngineTest(unittest.TestCase):
+
+    def setUp(self):
+        self.store = support.open_store()
+        self.accounts = AccountService(self.store)
+        self.alice = self.open_account("alice", 1000)
+        for name in ("bob", "carol", "dave"):
+            self.open_account(name)
+        self.now = [0.0]
+
+    def tearDown(self):
+        self.accounts.close()
+        self.store.close()
+
+    def open_account(self, username, balance=0):
+        did = f"did:transferz:{username}"
+        self.accounts.create_account(username, {
+            "password": "", "did": did, "private_key": "", "blockchain_address": "",
+            "phone_numbers": [], "balance_fcfa": 0, "balance_stablecoin": balance,
+        })
+        return Caller(username, did)
+
+    def engine(self):
+        engine = VelocityEngine(self.store, [make_rule(spec) for spec in RULES], clock=lambda: self.now[0])
+        self.accounts.velocity = engine
+        return engine
+
+    def test_disabled_by_default(self):
+        self.assertEqual(self.accounts.velocity.rules, [])
+        for _ in range(3):
+            self.accounts.transfer(self.alice, "did:transferz:bob", 200)
+
+    def test_transfers_refused_past_a_rule(self):
+        self.now[0] = time.time()
+        engine = self.engine()
+        self.accounts.transfer(self.alice, "did:transferz:bob", 60)
+        with self.assertRaises(AccountError) as refused:
+            self.accounts.transfer(self.alice, "did:transferz:carol", 50)
+        self.assertEqual(refused.exception.status, 403)
+        self.assertIn("amount_1h", refused.exception.detail)
+        self.accounts.transfer(self.alice, "did:transferz:carol", 40)
+        self.assertEqual(engine.usage("alice")["amount_1h"]["used"], 100)
+
+        # Une heure plus tard, la fenêtre est vide
+        self.now[0] += 3600
+        self.assertEqual(engine.usage("alice")["amount_1h"]["used"], 0)
+        engine.check(velocity.TRANSFER, "alice", 100_000_000, ["did:a", "did:b"])
+        with self.assertRaises(VelocityExceeded) as exceeded:
+            engine.check(velocity.TRANSFER, "alice", 1, ["bob", "carol", "dave"])
+        self.assertEqual(exceeded.exception.rule.name, "receivers_1h")
+
+    def test_restart_replays_only_the_window(self):
+        self.accounts.transfer(self.alice, "did:transferz:bob", 30)
+        self.accounts.transfer(self.alice, "did:transferz:carol", 20)
+        self.now[0] = time.time()
+        self.assertEqual(self.engine().usage("alice")["amount_1h"]["used"], 50)
+        self.now[0] += 3600
+        self.assertEqual(self.engine().tracked(), {"amount_1h": 0, "receivers_1h": 0})
+
+
+if __name__ == "__main__":
+    unittest.main()